@@ -0,0 +1,144 @@
+"""
+Columnar in-memory analytics over a user's expenses (optional, needs numpy).
+
+A user's expenses are loaded once into NumPy columns (amount float64,
+date datetime64, category as dictionary-encoded int32 codes) sorted by
+date, and kept in a small per-process LRU. Expense and funds writes drop
+the user's frame through cache.invalidate_user; frames also expire after
+ANALYTICS_FRAME_TTL_SECONDS, for writes served by other processes. Queries are vectorized:
+group-by via bincount, date ranges via searchsorted on a prefix sum.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+from repository import repo
+from cache import on_invalidate_user
+import settings
+
+try:
+    import numpy as np
+except ImportError:  # analytics endpoints answer 503 without it
+    np = None
+
+
+class UserFrame:
+    def __init__(self, amounts, dates, codes, categories):
+        order = np.argsort(dates, kind="stable")
+        self.amounts = amounts[order]
+        self.dates = dates[order]
+        self.codes = codes[order]
+        self.categories = categories
+        # prefix[i] = sum of the first i amounts, for O(log n) range totals
+        self.prefix = np.concatenate(([0.0], np.cumsum(self.amounts)))
+
+    @classmethod
+    def load(cls, email_id: str) -> "UserFrame":
+        amounts, dates, codes = [], [], []
+        category_index = {}
+        # Every row on either backend (hot plus archive tier on Mongo)
+        for doc in repo.expenses.find(email_id, fields={"amount", "date", "category"}, batch_size=5000):
+            if not doc.get("date"):
+                continue
+            amounts.append(doc.get("amount") or 0.0)
+            dates.append(doc["date"])
+            codes.append(category_index.setdefault(doc.get("category"), len(category_index)))
+        return cls(
+            np.array(amounts, dtype=np.float64),
+            np.array(dates, dtype="datetime64[ms]"),
+            np.array(codes, dtype=np.int32),
+            list(category_index)
+        )
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def by_month(self):
+        if not len(self):
+            return []
+        months, inverse = np.unique(self.dates.astype("datetime64[M]"), return_inverse=True)
+        totals = np.bincount(inverse, weights=self.amounts)
+        return [
+            {"month": str(month), "total_expense": float(total)}
+            for month, total in zip(months[::-1], totals[::-1])
+        ]
+
+    def by_category(self, top_n: Optional[int] = None):
+        totals = np.bincount(self.codes, weights=self.amounts, minlength=len(self.categories))
+        order = np.argsort(-totals, kind="stable")
+        if top_n:
+            order = order[:top_n]
+        return [{"category": self.categories[i], "total": float(totals[i])} for i in order]
+
+    def range_total(self, start: datetime, end: datetime) -> float:
+        lo = np.searchsorted(self.dates, np.datetime64(start, "ms"), side="left")
+        hi = np.searchsorted(self.dates, np.datetime64(end, "ms"), side="right")
+        return float(self.prefix[hi] - self.prefix[lo])
+
+    def rolling(self, window_days: int, start: Optional[datetime] = None, end: Optional[datetime] = None):
+        """
+        Trailing `window_days` sum of spending for every day in [start, end].
+        """
+        if not len(self):
+            return []
+        days = self.dates.astype("datetime64[D]")
+        first = np.datetime64(start, "D") if start else days[0]
+        last = np.datetime64(end, "D") if end else days[-1]
+        if last < first:
+            return []
+        # Daily totals from (first - window) so the first windows are complete
+        origin = first - np.timedelta64(window_days - 1, "D")
+        mask = (days >= origin) & (days <= last)
+        offsets = (days[mask] - origin).astype(np.int64)
+        span = int((last - origin).astype(np.int64)) + 1
+        daily = np.bincount(offsets, weights=self.amounts[mask], minlength=span)
+        cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+        window_sums = cumulative[window_days:] - cumulative[:-window_days]
+        return [
+            {"date": str(first + np.timedelta64(i, "D")), "total": float(total)}
+            for i, total in enumerate(window_sums)
+        ]
+
+
+# =========================
+# PER-USER FRAME CACHE
+# =========================
+_frames = OrderedDict()  # email -> (frame, loaded at)
+# Bumped by forget(); a load that overlapped an invalidation is not cached
+_generations = {}
+_lock = threading.Lock()
+
+
+def available() -> bool:
+    return np is not None
+
+
+def get_frame(email_id: str) -> UserFrame:
+    email_id = email_id.strip().lower()
+    with _lock:
+        entry = _frames.get(email_id)
+        if entry is not None and time.monotonic() - entry[1] < settings.ANALYTICS_FRAME_TTL_SECONDS:
+            _frames.move_to_end(email_id)
+            return entry[0]
+        generation = _generations.get(email_id, 0)
+    loaded_at = time.monotonic()
+    frame = UserFrame.load(email_id)
+    with _lock:
+        # A write during the load may not be in the frame: serve it once, don't keep it
+        if _generations.get(email_id, 0) == generation:
+            _frames[email_id] = (frame, loaded_at)
+            _frames.move_to_end(email_id)
+            while len(_frames) > settings.ANALYTICS_MAX_USERS:
+                _frames.popitem(last=False)
+    return frame
+
+
+def forget(email_id: str):
+    email_id = email_id.strip().lower()
+    with _lock:
+        _frames.pop(email_id, None)
+        _generations[email_id] = _generations.get(email_id, 0) + 1
+
+
+on_invalidate_user(forget)
@@ -0,0 +1,189 @@
+"""
+HTTP client used by the Streamlit frontend.
+
+All calls share one pooled keep-alive requests.Session. GETs made with a
+`ttl` are cached in st.session_state (so per logged-in user) and reused
+across reruns until they expire or a mutation through this module
+invalidates them.
+
+Every call is also recorded per rerun (see begin_rerun / rerun_report) so
+the number of backend round trips a page costs can be measured.
+
+After login the access/refresh tokens live in st.session_state and every
+call sends `Authorization: Bearer <access token>`. A 401 triggers one
+refresh through POST /users/refresh and a single retry.
+"""
+import logging
+import time
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+API_BASE = "http://127.0.0.1:8000"
+
+logger = logging.getLogger("expense_tracker.api_client")
+
+# Cache lifetimes (seconds) for the datasets the dashboard reads
+TTL_STATIC = 300    # categories, roles
+TTL_USER = 60       # funds, expenses, summaries
+
+# Which cached paths each kind of write makes stale
+EXPENSE_PATHS = ("/expenses", "/summary", "/funds", "/dashboard")
+FUND_PATHS = ("/funds", "/summary", "/expenses", "/dashboard")
+CATEGORY_PATHS = ("/categories", "/dashboard")
+USER_PATHS = ("/users",)
+
+
+@st.cache_resource
+def _session() -> requests.Session:
+    # One connection pool for the whole Streamlit server process
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _calls() -> list:
+    if "_api_calls" not in st.session_state:
+        st.session_state["_api_calls"] = []
+    return st.session_state["_api_calls"]
+
+
+def _record(method: str, path: str, started: float, cached: bool = False):
+    _calls().append({
+        "method": method,
+        "path": path,
+        "cached": cached,
+        "ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+
+def begin_rerun():
+    """
+    Call at the top of the script: starts a fresh per-rerun call log.
+    """
+    st.session_state["_api_calls"] = []
+
+
+def rerun_report() -> dict:
+    """
+    Summarize (and log) the backend calls made during this rerun.
+    """
+    calls = _calls()
+    report = {
+        "network_calls": sum(1 for c in calls if not c["cached"]),
+        "cache_hits": sum(1 for c in calls if c["cached"]),
+        "network_ms": round(sum(c["ms"] for c in calls if not c["cached"]), 1),
+        "calls": calls
+    }
+    logger.info(
+        "rerun: %d backend call(s), %d cache hit(s), %.1f ms",
+        report["network_calls"], report["cache_hits"], report["network_ms"]
+    )
+    return report
+
+
+# =========================
+# TOKENS
+# =========================
+def set_tokens(data: dict):
+    """Keep the tokens from a login/refresh response."""
+    st.session_state["_access_token"] = data.get("access_token")
+    if data.get("refresh_token"):
+        st.session_state["_refresh_token"] = data["refresh_token"]
+
+
+def clear_tokens():
+    st.session_state.pop("_access_token", None)
+    st.session_state.pop("_refresh_token", None)
+
+
+def _auth_headers(kwargs: dict) -> dict:
+    token = st.session_state.get("_access_token")
+    if token:
+        kwargs["headers"] = {**kwargs.get("headers", {}), "Authorization": f"Bearer {token}"}
+    return kwargs
+
+
+def _refresh() -> bool:
+    token = st.session_state.get("_refresh_token")
+    if not token:
+        return False
+    started = time.perf_counter()
+    res = _session().post(f"{API_BASE}/users/refresh", json={"refresh_token": token})
+    _record("POST", "/users/refresh", started)
+    if res.status_code != 200:
+        clear_tokens()
+        return False
+    set_tokens(res.json())
+    return True
+
+
+def _send(method: str, path: str, **kwargs) -> requests.Response:
+    res = _session().request(method, f"{API_BASE}{path}", **_auth_headers(dict(kwargs)))
+    if res.status_code == 401 and _refresh():
+        res = _session().request(method, f"{API_BASE}{path}", **_auth_headers(dict(kwargs)))
+    return res
+
+
+def _cache() -> dict:
+    if "_api_cache" not in st.session_state:
+        st.session_state["_api_cache"] = {}
+    return st.session_state["_api_cache"]
+
+
+def get(path: str, params=None, ttl=None) -> requests.Response:
+    """
+    GET `path`; with `ttl`, serve a cached 200 response while it is fresh.
+    """
+    started = time.perf_counter()
+    if ttl is None:
+        res = _send("GET", path, params=params)
+        _record("GET", path, started)
+        return res
+
+    key = (path, tuple(sorted((params or {}).items())))
+    cached = _cache().get(key)
+    if cached and cached[0] > time.monotonic():
+        _record("GET", path, started, cached=True)
+        return cached[1]
+
+    res = _send("GET", path, params=params)
+    _record("GET", path, started)
+    if res.status_code == 200:
+        _cache()[key] = (time.monotonic() + ttl, res)
+    return res
+
+
+def _write(method: str, path: str, invalidates, **kwargs) -> requests.Response:
+    started = time.perf_counter()
+    res = _send(method, path, **kwargs)
+    _record(method, path, started)
+    invalidate(*invalidates)
+    return res
+
+
+def post(path: str, invalidates=(), **kwargs) -> requests.Response:
+    return _write("POST", path, invalidates, **kwargs)
+
+
+def put(path: str, invalidates=(), **kwargs) -> requests.Response:
+    return _write("PUT", path, invalidates, **kwargs)
+
+
+def delete(path: str, invalidates=(), **kwargs) -> requests.Response:
+    return _write("DELETE", path, invalidates, **kwargs)
+
+
+def invalidate(*prefixes: str):
+    """
+    Drop cached responses whose path starts with any of `prefixes`.
+    """
+    cache = _cache()
+    for key in [k for k in cache if k[0].startswith(prefixes)]:
+        del cache[key]
+
+
+def clear():
+    _cache().clear()
@@ -0,0 +1,260 @@
+"""
+Cold tier for old expenses.
+
+Expenses older than ARCHIVE_AFTER_DAYS (rounded down to a month boundary)
+are moved out of `expenses` into one `expense_archive` document per user
+and month, holding the rows in compact form:
+
+    {"email_id", "month": "YYYY-MM", "count", "total",
+     "rows": [{"i": _id, "a": amount, "c": category, "d": date, "s": description,
+               "x": {any other fields, e.g. created_at / updated_at}}]}
+
+That keeps the hot collection and its indexes down to recent data. The
+rollups still count archived rows, so summaries need no change; listing,
+search and export merge both tiers through iter_archived(), and update /
+delete move a row back to the hot tier first (restore()).
+
+    python archive.py run [--days 365] [--email someone@example.com]
+"""
+import argparse
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+from database import expenses_collection, archive_collection
+from rollups import month_key
+import settings
+
+
+# Fields with a short name in the compact row; the rest go under "x"
+COMPACT_FIELDS = ("_id", "email_id", "amount", "category", "date", "description")
+# What a concurrent update or delete can change between bucketing and deletion
+SNAPSHOT_FIELDS = ("email_id", "amount", "category", "date", "description")
+
+
+def _compact(doc) -> dict:
+    row = {
+        "i": doc["_id"],
+        "a": doc.get("amount", 0),
+        "c": doc.get("category"),
+        "d": doc["date"],
+        "s": doc.get("description", ""),
+    }
+    extra = {field: value for field, value in doc.items() if field not in COMPACT_FIELDS}
+    if extra:
+        row["x"] = extra
+    return row
+
+
+def _expand(email_id: str, row) -> dict:
+    return {
+        **row.get("x", {}),
+        "_id": row["i"],
+        "email_id": email_id,
+        "amount": row.get("a", 0),
+        "category": row.get("c"),
+        "date": row.get("d"),
+        "description": row.get("s", ""),
+    }
+
+
+def expand_bucket(bucket) -> list:
+    """Every row of an archive bucket, in the hot-tier shape."""
+    return [_expand(bucket["email_id"], row) for row in bucket.get("rows", [])]
+
+
+def archive_cutoff(older_than_days: Optional[int] = None) -> datetime:
+    """Start of the month that contains now - older_than_days."""
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    edge = datetime.utcnow() - timedelta(days=days)
+    return datetime(edge.year, edge.month, 1)
+
+
+def _recount(query: dict, session=None):
+    archive_collection.update_many(
+        query,
+        [{"$set": {"count": {"$size": "$rows"}, "total": {"$sum": "$rows.a"}}}],
+        session=session
+    )
+
+
+# =========================
+# ARCHIVE JOB
+# =========================
+def archive_expenses(
+    older_than_days: Optional[int] = None,
+    email_id: Optional[str] = None,
+    on_batch: Optional[Callable[..., None]] = None,
+):
+    """
+    Move expenses dated before archive_cutoff() into monthly buckets, in
+    JOB_BATCH_SIZE batches; `on_batch(**counters)` is called after each.
+    Safe to re-run after a crash: rows are added with $addToSet and only
+    deleted from the hot tier once bucketed.
+
+    Each hot row is deleted only if it still matches the snapshot that was
+    bucketed. A row updated or deleted in between is pulled back out of
+    its bucket, so the hot tier (and the ledger that followed it) stays
+    the source of truth.
+    """
+    cutoff = archive_cutoff(older_than_days)
+    query: Dict = {"date": {"$lt": cutoff}}
+    if email_id:
+        query["email_id"] = email_id.strip().lower()
+
+    last_id = None
+    archived = 0
+    while True:
+        # One forward pass in _id order rather than re-scanning for each batch
+        batch_query = dict(query, **({"_id": {"$gt": last_id}} if last_id is not None else {}))
+        batch = list(expenses_collection.find(batch_query).sort("_id", ASCENDING).limit(settings.JOB_BATCH_SIZE))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        buckets = defaultdict(list)
+        for doc in batch:
+            buckets[(doc["email_id"], month_key(doc["date"]))].append(_compact(doc))
+        for (owner, month), rows in buckets.items():
+            archive_collection.update_one(
+                {"email_id": owner, "month": month},
+                {"$addToSet": {"rows": {"$each": rows}}},
+                upsert=True
+            )
+            _recount({"email_id": owner, "month": month})
+
+        deleted = 0
+        stale = defaultdict(list)
+        for doc in batch:
+            snapshot = {"_id": doc["_id"], **{field: doc.get(field) for field in SNAPSHOT_FIELDS}}
+            if expenses_collection.delete_one(snapshot).deleted_count:
+                deleted += 1
+            else:
+                stale[(doc["email_id"], month_key(doc["date"]))].append(doc["_id"])
+        for (owner, month), ids in stale.items():
+            bucket = {"email_id": owner, "month": month}
+            archive_collection.update_one(bucket, {"$pull": {"rows": {"i": {"$in": ids}}}})
+            _recount(bucket)
+            archive_collection.delete_one(dict(bucket, count=0))
+
+        archived += deleted
+        if on_batch:
+            on_batch(expenses_archived=deleted, buckets_written=len(buckets),
+                     skipped_changed=sum(len(ids) for ids in stale.values()))
+    return {"archived": archived, "cutoff": cutoff.isoformat()}
+
+
+# =========================
+# READS
+# =========================
+def archived_query(
+    email_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    text: Optional[str] = None,
+    after: Optional[Tuple[datetime, ObjectId]] = None,
+) -> Tuple[Dict, Callable[[dict], list]]:
+    """
+    The bucket query for these filters and a function turning one matching
+    bucket into its kept rows, expanded and newest first. Shared by
+    iter_archived and the async reads (async_repository.py).
+    """
+    query: Dict = {"email_id": email_id}
+    months: Dict = {}
+    if start:
+        months["$gte"] = month_key(start)
+    upper = min((d for d in (end, after[0] if after else None) if d), default=None)
+    if upper:
+        months["$lte"] = month_key(upper)
+    if months:
+        query["month"] = months
+    if category:
+        query["rows.c"] = category
+
+    pattern = re.compile(re.escape(text), re.IGNORECASE) if text else None
+
+    def keep(row) -> bool:
+        date = row.get("d")
+        if start and date < start:
+            return False
+        if end and date > end:
+            return False
+        if category and row.get("c") != category:
+            return False
+        if min_amount is not None and row.get("a", 0) < min_amount:
+            return False
+        if max_amount is not None and row.get("a", 0) > max_amount:
+            return False
+        if pattern and not pattern.search(row.get("s") or ""):
+            return False
+        if after and (date, row["i"]) >= after:
+            return False
+        return True
+
+    def bucket_rows(bucket) -> list:
+        rows = sorted((r for r in bucket.get("rows", []) if keep(r)), key=lambda r: (r["d"], r["i"]), reverse=True)
+        return [_expand(email_id, row) for row in rows]
+
+    return query, bucket_rows
+
+
+def iter_archived(email_id: str, **filters) -> Iterator[dict]:
+    """
+    Archived expenses matching the filters (see archived_query), expanded
+    to the hot-tier shape, newest first by (date, _id) so they can be
+    heapq-merged with a hot cursor sorted the same way.
+    """
+    query, bucket_rows = archived_query(email_id, **filters)
+    for bucket in archive_collection.find(query, {"rows": 1}).sort("month", DESCENDING):
+        yield from bucket_rows(bucket)
+
+
+def archived_totals(email_id: Optional[str] = None) -> Dict[str, float]:
+    """Sum of archived amounts per user."""
+    match = {"email_id": email_id.strip().lower()} if email_id else {}
+    return {
+        row["_id"]: row["total"]
+        for row in archive_collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$email_id", "total": {"$sum": "$total"}}}
+        ])
+    }
+
+
+# =========================
+# WRITES
+# =========================
+def restore(email_id: str, expense_id: ObjectId, session=None) -> Optional[dict]:
+    """
+    Move one archived expense back to the hot tier so the normal update /
+    delete paths apply. Insert first, then pull: a crash in between leaves
+    a duplicate the next archive run collapses, never a lost row. Returns
+    the restored document, or None if the expense is not archived.
+    """
+    bucket = archive_collection.find_one({"email_id": email_id, "rows.i": expense_id}, {"rows.$": 1}, session=session)
+    if not bucket:
+        return None
+    doc = _expand(email_id, bucket["rows"][0])
+    try:
+        expenses_collection.insert_one(dict(doc), session=session)
+    except DuplicateKeyError:
+        pass  # restored concurrently
+    archive_collection.update_one({"_id": bucket["_id"]}, {"$pull": {"rows": {"i": expense_id}}}, session=session)
+    _recount({"_id": bucket["_id"]}, session)
+    archive_collection.delete_one({"_id": bucket["_id"], "count": 0}, session=session)
+    return doc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old expenses into monthly archive buckets")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--days", type=int, default=None, help=f"Archive rows older than this (default {settings.ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--email", default=None, help="Only this user")
+    args = parser.parse_args()
+    print(archive_expenses(args.days, args.email))
@@ -0,0 +1,184 @@
+"""
+Awaitable reads for the expense listing and summary endpoints.
+
+Those endpoints are `async def` and await `arepo` instead of holding a
+threadpool worker while the database answers. On MongoDB the queries run
+on PyMongo's asyncio client (database.async_db, same pool settings as the
+sync client). With MONGO_ASYNC=0, on mongomock, or on the SQLite backend,
+the same calls run the blocking repository on the threadpool, so the
+endpoints answer identically either way; benchmarks/run.py --async-mongo
+compares the two.
+
+Queries are built by the same helpers as the sync repository
+(repository.expense_find_plan, archive.archived_query, the rollups
+pipelines), so both paths return the same rows in the same order.
+"""
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from fastapi.concurrency import run_in_threadpool
+from starlette.concurrency import iterate_in_threadpool
+from pymongo import DESCENDING
+import pymongo
+from archive import archived_query
+from repository import repo, expense_find_plan, NEWEST_FIRST
+from rollups import monthly_pipeline, category_pipeline, facets_pipeline, monthly_rows, category_rows, facet_rows
+import database
+import settings
+
+
+def _order(exp):
+    return (exp.get("date") or datetime.min, exp["_id"])
+
+
+async def _newest_first(hot, archived) -> AsyncIterator[dict]:
+    """Merge two async streams already in (date desc, _id desc) order (heapq.merge for async)."""
+    a = await anext(hot, None)
+    b = await anext(archived, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and _order(a) >= _order(b)):
+            yield a
+            a = await anext(hot, None)
+        else:
+            yield b
+            b = await anext(archived, None)
+
+
+# =========================
+# ASYNC MONGODB
+# =========================
+class AsyncMongoExpenses:
+    def find(
+        self,
+        email_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        text: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[set] = None,
+        batch_size: int = 500,
+    ) -> AsyncIterator[dict]:
+        """Same rows as MongoExpenses.find, as an async stream."""
+        # Built up front so a bad cursor fails here, as on the sync path
+        query, projection, archive_filters = expense_find_plan(
+            email_id, start, end, category, min_amount, max_amount, text, cursor, fields
+        )
+        db = database.async_db()
+
+        async def archived():
+            if archive_filters is None:
+                return  # past every dated row; archived rows always have a date
+            bucket_query, bucket_rows = archived_query(email_id, **archive_filters)
+            buckets = db[database.archive_collection.name].find(bucket_query, {"rows": 1}).sort("month", DESCENDING)
+            try:
+                async for bucket in buckets:
+                    for row in bucket_rows(bucket):
+                        yield row
+            finally:
+                await buckets.close()
+
+        async def rows():
+            hot = db[database.expenses_collection.name].find(query, projection).sort(NEWEST_FIRST).batch_size(batch_size)
+            if limit:
+                hot = hot.limit(limit)
+            archive_rows = archived()
+            merged = _newest_first(hot, archive_rows)
+            served = 0
+            try:
+                async for row in merged:
+                    yield row
+                    served += 1
+                    if limit and served >= limit:
+                        return
+            finally:
+                # Release both server cursors even when the caller stops early
+                await merged.aclose()
+                await archive_rows.aclose()
+                await hot.close()
+
+        return rows()
+
+    async def fetch(self, email_id: str, **filters) -> list:
+        return [row async for row in self.find(email_id, **filters)]
+
+    async def monthly_totals(self, email_id: str):
+        rollups = database.async_db()[database.rollups_collection.name]
+        return monthly_rows(await (await rollups.aggregate(monthly_pipeline(email_id))).to_list())
+
+    async def category_totals(self, email_id: str, limit: Optional[int] = None):
+        rollups = database.async_db()[database.rollups_collection.name]
+        return category_rows(await (await rollups.aggregate(category_pipeline(email_id, limit))).to_list())
+
+    async def summary(self, email_id: str) -> dict:
+        rollups = database.async_db()[database.rollups_collection.name]
+        result = await (await rollups.aggregate(facets_pipeline(email_id))).to_list()
+        return facet_rows(result[0] if result else None)
+
+
+class AsyncMongoFunds:
+    async def get(self, email_id: str) -> Optional[dict]:
+        return await database.async_db()[database.funds_collection.name].find_one({"email_id": email_id})
+
+
+# =========================
+# THREADPOOL (any backend)
+# =========================
+class ThreadpoolExpenses:
+    """The blocking repository behind the same awaitable interface."""
+
+    def find(self, email_id: str, **filters) -> AsyncIterator[dict]:
+        rows = repo.expenses.find(email_id, **filters)
+
+        async def stream():
+            try:
+                async for row in iterate_in_threadpool(rows):
+                    yield row
+            finally:
+                if hasattr(rows, "close"):
+                    rows.close()
+
+        return stream()
+
+    async def fetch(self, email_id: str, **filters) -> list:
+        # One threadpool hop for the whole page
+        return await run_in_threadpool(lambda: list(repo.expenses.find(email_id, **filters)))
+
+    async def monthly_totals(self, email_id: str):
+        return await run_in_threadpool(repo.expenses.monthly_totals, email_id)
+
+    async def category_totals(self, email_id: str, limit: Optional[int] = None):
+        return await run_in_threadpool(repo.expenses.category_totals, email_id, limit)
+
+    async def summary(self, email_id: str) -> dict:
+        return await run_in_threadpool(repo.expenses.summary, email_id)
+
+
+class ThreadpoolFunds:
+    async def get(self, email_id: str) -> Optional[dict]:
+        return await run_in_threadpool(repo.funds.get, email_id)
+
+
+class AsyncRepository:
+    def __init__(self, expenses, funds, native: bool):
+        self.expenses = expenses
+        self.funds = funds
+        # True when the reads run on the asyncio driver
+        self.native = native
+
+
+def _make_arepo() -> AsyncRepository:
+    native = (
+        settings.MONGO_ASYNC
+        and settings.STORAGE_BACKEND == "mongo"
+        and not settings.MONGO_URI.startswith("mongomock://")
+        and hasattr(pymongo, "AsyncMongoClient")
+    )
+    if native:
+        return AsyncRepository(AsyncMongoExpenses(), AsyncMongoFunds(), True)
+    return AsyncRepository(ThreadpoolExpenses(), ThreadpoolFunds(), False)
+
+
+arepo = _make_arepo()
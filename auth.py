@@ -0,0 +1,153 @@
+"""
+Password hashing and signed session tokens.
+
+bcrypt only runs at login, registration and password change. Every other
+request carries a short-lived access token: base64url(JSON claims) plus an
+HMAC-SHA256 signature over it, so checking it costs one hash of a few
+hundred bytes and no database round trip. A longer-lived refresh token
+buys a new access token; it is tied to the user's `token_version`, which
+a password change bumps, so old refresh tokens stop working.
+
+Endpoints take the caller's identity from the `current_email` dependency
+instead of trusting an `email_id` query parameter; user, category and role
+management and the maintenance routes also need `require_admin`.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+import bcrypt
+from fastapi import Depends, Header, HTTPException, Query
+
+import settings
+
+ACCESS = "access"
+REFRESH = "refresh"
+ADMIN_ROLE = "admin"
+DEFAULT_ROLE = "User"
+
+
+# =========================
+# PASSWORDS
+# =========================
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(settings.BCRYPT_ROUNDS)).decode("utf-8")
+
+
+def check_password(password: str, stored: str) -> bool:
+    """
+    Compare against a bcrypt hash, or a legacy plain-text password (those
+    are rehashed on the next successful login, see needs_rehash).
+    """
+    if not stored:
+        return False
+    if not stored.startswith("$2"):
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+    return bcrypt.checkpw(password.encode("utf-8"), stored.encode("utf-8"))
+
+
+def needs_rehash(stored: str) -> bool:
+    """True for plain-text passwords and hashes made with a different work factor."""
+    if not stored.startswith("$2"):
+        return True
+    try:
+        return int(stored.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+# =========================
+# TOKENS
+# =========================
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(settings.SECRET_KEY.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_token(email_id: str, kind: str, role: Optional[str] = None, user_id: Optional[str] = None, token_version: int = 0) -> str:
+    ttl = settings.ACCESS_TOKEN_TTL_SECONDS if kind == ACCESS else settings.REFRESH_TOKEN_TTL_SECONDS
+    now = int(time.time())
+    claims = {"sub": email_id, "typ": kind, "iat": now, "exp": now + ttl}
+    if role:
+        claims["role"] = role
+    if kind == REFRESH:
+        claims["uid"] = user_id
+        claims["ver"] = token_version
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def issue_tokens(user: dict) -> dict:
+    """Access + refresh token pair for a user document."""
+    email_id = user["email_id"].strip().lower()
+    role = user.get("role_name")
+    return {
+        "access_token": create_token(email_id, ACCESS, role),
+        "refresh_token": create_token(email_id, REFRESH, role, str(user["_id"]), user.get("token_version", 0)),
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_TTL_SECONDS
+    }
+
+
+def decode_token(token: str, kind: str = ACCESS) -> dict:
+    """
+    Verify signature, type and expiry; return the claims or raise 401.
+    """
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise ValueError("bad signature")
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+    if claims.get("typ") != kind:
+        raise HTTPException(status_code=401, detail="Wrong token type", headers={"WWW-Authenticate": "Bearer"})
+    if claims.get("exp", 0) < time.time():
+        raise HTTPException(status_code=401, detail="Token expired", headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+
+# =========================
+# DEPENDENCIES
+# =========================
+def current_claims(authorization: Optional[str] = Header(None)) -> dict:
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return decode_token(authorization[7:].strip(), ACCESS)
+
+
+def current_email(
+    authorization: Optional[str] = Header(None),
+    email_id: Optional[str] = Query(None, description="Legacy identity parameter (only honoured with LEGACY_AUTH=1)"),
+) -> str:
+    """
+    Normalized email of the caller, taken from the bearer token. With
+    LEGACY_AUTH on, requests without a token may still name themselves
+    through `email_id` (older clients and scripts).
+    """
+    if authorization:
+        return current_claims(authorization)["sub"]
+    if settings.LEGACY_AUTH and email_id:
+        return email_id.strip().lower()
+    raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+
+def require_admin(claims: dict = Depends(current_claims)) -> dict:
+    """
+    Claims of a caller whose access token carries the Admin role, else 403.
+    Always needs a bearer token, even with LEGACY_AUTH on.
+    """
+    if (claims.get("role") or "").strip().lower() != ADMIN_ROLE:
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return claims
@@ -0,0 +1,91 @@
+"""
+Compare the columnar analytics engine with the Mongo $group pipelines.
+
+Seed first (benchmarks/seed.py, same --database), then:
+
+    python benchmarks/bench_analytics.py --database ExpenseBench --users 20 --repeat 20
+
+For a sample of users this times the raw-expense $group pipelines for
+monthly and per-category totals against analytics.UserFrame: the cold
+load (one projected scan into NumPy columns) and warm vectorized queries.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="ExpenseBench")
+    parser.add_argument("--users", type=int, default=20, help="How many seeded users to sample")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    os.environ["MONGO_DB_NAME"] = args.database
+    from database import expenses_collection
+    from analytics import UserFrame
+    from seed import user_email
+
+    def monthly_pipeline(email_id):
+        return list(expenses_collection.aggregate([
+            {"$match": {"email_id": email_id}},
+            {"$group": {"_id": {"year": {"$year": "$date"}, "month": {"$month": "$date"}}, "total": {"$sum": "$amount"}}},
+            {"$sort": {"_id.year": -1, "_id.month": -1}}
+        ]))
+
+    def category_pipeline(email_id):
+        return list(expenses_collection.aggregate([
+            {"$match": {"email_id": email_id}},
+            {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}},
+            {"$sort": {"total": -1}}
+        ]))
+
+    def range_pipeline(email_id, start, end):
+        return list(expenses_collection.aggregate([
+            {"$match": {"email_id": email_id, "date": {"$gte": start, "$lte": end}}},
+            {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+        ]))
+
+    end = datetime.utcnow()
+    start = end - timedelta(days=90)
+    rows = []
+    for n in range(args.users):
+        email_id = user_email(n)
+        frame = UserFrame.load(email_id)
+        rows.append({
+            "expenses": len(frame),
+            "mongo_monthly_ms": timed(lambda: monthly_pipeline(email_id), args.repeat),
+            "mongo_by_category_ms": timed(lambda: category_pipeline(email_id), args.repeat),
+            "mongo_range_total_ms": timed(lambda: range_pipeline(email_id, start, end), args.repeat),
+            "frame_load_ms": timed(lambda: UserFrame.load(email_id), max(1, args.repeat // 4)),
+            "frame_monthly_ms": timed(frame.by_month, args.repeat),
+            "frame_by_category_ms": timed(frame.by_category, args.repeat),
+            "frame_range_total_ms": timed(lambda: frame.range_total(start, end), args.repeat),
+        })
+
+    summary = {key: round(statistics.median(r[key] for r in rows), 3) for key in rows[0]}
+    for key, value in summary.items():
+        print(f"{key:<24} {value}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"median_per_user": summary, "users": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cost of password hashing per bcrypt work factor, next to token checks.
+
+    python benchmarks/bench_bcrypt.py --rounds 10,11,12,13 --repeat 5
+
+For each round count this times one hash (registration / password change)
+and one verify (login). It also times signing and verifying an access
+token, which is what every other authenticated request pays. Use it to
+choose BCRYPT_ROUNDS: a login should stay well under the latency budget on
+the production hardware, and each extra round doubles the cost.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+PASSWORD = b"benchpass"
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", default="10,11,12,13", help="Comma-separated bcrypt work factors")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--token-repeat", type=int, default=10000)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from auth import create_token, decode_token, ACCESS
+
+    results = {"bcrypt": [], "token": {}}
+    for rounds in [int(r) for r in args.rounds.split(",") if r.strip()]:
+        hashed = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds))
+        row = {
+            "rounds": rounds,
+            "hash_ms": timed(lambda: bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds)), args.repeat),
+            "verify_ms": timed(lambda: bcrypt.checkpw(PASSWORD, hashed), args.repeat),
+        }
+        row["logins_per_core_per_s"] = round(1000 / row["verify_ms"], 1) if row["verify_ms"] else None
+        results["bcrypt"].append(row)
+        print(f"rounds {rounds:>2}  hash {row['hash_ms']:>9} ms  verify {row['verify_ms']:>9} ms  "
+              f"~{row['logins_per_core_per_s']} logins/s/core")
+
+    token = create_token("bench-0@example.com", ACCESS, "User")
+    started = time.perf_counter()
+    for _ in range(args.token_repeat):
+        create_token("bench-0@example.com", ACCESS, "User")
+    sign_us = (time.perf_counter() - started) / args.token_repeat * 1e6
+    started = time.perf_counter()
+    for _ in range(args.token_repeat):
+        decode_token(token, ACCESS)
+    verify_us = (time.perf_counter() - started) / args.token_repeat * 1e6
+    results["token"] = {"sign_us": round(sign_us, 2), "verify_us": round(verify_us, 2)}
+    print(f"access token  sign {sign_us:.2f} us  verify {verify_us:.2f} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Plain vs time-series storage for expenses: size on disk and date-range reads.
+
+Seeds the plain `expenses` collection, copies it into a fresh time-series
+collection with timeseries.py, then reports collStats for both and times
+the two query shapes the API runs most over a date window:
+
+    find    {email_id, date: {$gte, $lt}} sorted by date desc (listing/search)
+    sum     $match on the same filter + $group by category (summaries)
+
+    MONGO_DB_NAME=ExpenseTS python benchmarks/bench_timeseries.py --users 200 --expenses 200000
+    python benchmarks/bench_timeseries.py --window-days 90 --queries 500 --output ts.json
+
+Needs a real MongoDB 6.3+ server (mongomock has no time-series support).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def time_queries(collection, windows, repeat):
+    """Median/p95 latency (ms) of the find and sum shapes over the given (email, start, end) windows."""
+    find_ms, sum_ms = [], []
+    for _ in range(repeat):
+        for email_id, start, end in windows:
+            query = {"email_id": email_id, "date": {"$gte": start, "$lt": end}}
+            started = time.perf_counter()
+            list(collection.find(query, {"amount": 1, "category": 1, "date": 1}).sort("date", -1))
+            find_ms.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            list(collection.aggregate([
+                {"$match": query},
+                {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}},
+            ]))
+            sum_ms.append((time.perf_counter() - started) * 1000)
+
+    def summary(samples):
+        samples.sort()
+        return {
+            "median_ms": round(statistics.median(samples), 3),
+            "p95_ms": round(samples[max(0, int(len(samples) * 0.95) - 1)], 3),
+        }
+
+    return {"find": summary(find_ms), "sum": summary(sum_ms)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default=os.getenv("MONGO_DB_NAME", "ExpenseTS"))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--expenses", type=int, default=100000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--window-days", type=int, default=30, help="Width of each date-range query")
+    parser.add_argument("--queries", type=int, default=200, help="Random (user, window) pairs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data already in --database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    os.environ["MONGO_DB_NAME"] = args.database
+    # Seed into the plain collection; the time-series copy is made below
+    os.environ["EXPENSES_STORAGE"] = "standard"
+    os.environ["CACHE_BACKEND"] = "none"
+
+    from database import db
+    from migrations import run_migrations
+    from timeseries import copy_expenses, storage_stats, SOURCE_COLLECTION, CHECKPOINT_COLLECTION
+    from seed import seed, user_email
+    import settings
+
+    target = settings.EXPENSES_TS_COLLECTION
+    if not args.skip_seed:
+        print("Seeding:", seed(args.users, args.expenses, args.categories, args.months, random_seed=args.seed))
+        run_migrations()
+        db.drop_collection(target)
+        db[CHECKPOINT_COLLECTION].delete_one({"_id": target})
+    started = time.perf_counter()
+    print("Copying:", copy_expenses(target))
+    copy_seconds = round(time.perf_counter() - started, 2)
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    windows = []
+    for _ in range(args.queries):
+        start = now - timedelta(days=rng.randrange(args.months * 30))
+        windows.append((user_email(rng.randrange(args.users)), start, start + timedelta(days=args.window_days)))
+
+    results = {"copy_seconds": copy_seconds, "window_days": args.window_days, "collections": {}}
+    for name in (SOURCE_COLLECTION, target):
+        collection = db[name]
+        time_queries(collection, windows[:10], 1)  # warm the cache
+        results["collections"][name] = {
+            "stats": storage_stats(name),
+            "queries": time_queries(collection, windows, args.repeat),
+        }
+
+    print(f"{'collection':<14} {'docs':>9} {'data MB':>9} {'disk MB':>9} {'index MB':>9} "
+          f"{'find p50':>9} {'find p95':>9} {'sum p50':>9} {'sum p95':>9}")
+    for name, row in results["collections"].items():
+        stats, queries = row["stats"], row["queries"]
+        mb = lambda n: round(n / 2 ** 20, 2)
+        print(f"{name:<14} {stats['count']:>9} {mb(stats['size']):>9} {mb(stats['storage_size']):>9} "
+              f"{mb(stats['index_size']):>9} {queries['find']['median_ms']:>9} {queries['find']['p95_ms']:>9} "
+              f"{queries['sum']['median_ms']:>9} {queries['sum']['p95_ms']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Diff two benchmarks/run.py result files.
+
+    python benchmarks/compare.py before.json after.json --threshold 10
+
+Exits with status 1 if any endpoint's p95 latency regressed by more than
+--threshold percent (or its throughput dropped by more than that).
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def pct_change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+
+    regressions = []
+    for name in sorted(set(before["results"]) & set(after["results"])):
+        b, a = before["results"][name], after["results"][name]
+        cells = []
+        for metric in METRICS:
+            change = pct_change(b[metric], a[metric])
+            cells.append(f"{metric} {b[metric]} -> {a[metric]} ({change:+.1f}%)")
+        print(f"{name:<24} " + "  ".join(cells))
+
+        if pct_change(b["p95_ms"], a["p95_ms"]) > args.threshold:
+            regressions.append(f"{name}: p95 latency")
+        if pct_change(b["throughput_rps"], a["throughput_rps"]) < -args.threshold:
+            regressions.append(f"{name}: throughput")
+
+    if regressions:
+        print("Regressions:", ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
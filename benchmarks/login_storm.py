@@ -0,0 +1,148 @@
+"""
+Show that expense reads stay fast while logins flood the API.
+
+Seeds a database, starts the app in-process, then measures GET /expenses/
+latency twice at the same concurrency: once alone, and once while
+--storm-threads clients hammer POST /users/login. bcrypt runs on the
+dedicated hashing pool (hashing.py), so the read percentiles should barely
+move; logins beyond the pool's queue limit come back as 429.
+
+    python benchmarks/login_storm.py --mongomock --users 50 --expenses 5000 --seconds 10
+    python benchmarks/login_storm.py --storm-threads 128 --output storm.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def read_loop(base, tokens, seconds, concurrency, seed):
+    """Run GET /expenses/ from `concurrency` threads for `seconds`; return sorted latencies (ms)."""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    deadline = time.perf_counter() + seconds
+    emails = list(tokens)
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            email = rng.choice(emails)
+            started = time.perf_counter()
+            res = session.get(f"{base}/expenses/", params={"limit": 50}, headers=tokens[email])
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += res.status_code >= 400
+        return latencies, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    latencies = sorted(ms for r in results for ms in r[0])
+    return latencies, sum(r[1] for r in results)
+
+
+def storm(base, emails, stop, threads, statuses):
+    from seed import PASSWORD
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=threads))
+
+    def worker(n):
+        rng = random.Random(n)
+        while not stop.is_set():
+            res = session.post(f"{base}/users/login", json={"email": rng.choice(emails), "password": PASSWORD})
+            statuses[res.status_code] += 1
+            if res.status_code == 429:
+                # Well-behaved clients honour Retry-After; a storm retries quickly
+                time.sleep(min(float(res.headers.get("Retry-After", 1)), 0.1))
+
+    pool = ThreadPoolExecutor(max_workers=threads)
+    for n in range(threads):
+        pool.submit(worker, n)
+    return pool
+
+
+def summarize(latencies, errors, seconds):
+    from run import percentile
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--mongomock", action="store_true")
+    parser.add_argument("--database", default="ExpenseStorm")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--expenses", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--read-concurrency", type=int, default=8)
+    parser.add_argument("--storm-threads", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    os.environ["MONGO_DB_NAME"] = args.database
+    os.environ["CACHE_BACKEND"] = "none"
+    if args.mongomock:
+        os.environ["MONGO_URI"] = "mongomock://"
+        os.environ["RUN_MIGRATIONS_ON_STARTUP"] = "0"
+
+    from seed import seed, user_email
+    from run import start_server
+    from auth import create_token, ACCESS
+
+    print("Seeding:", seed(args.users, args.expenses, args.categories, random_seed=args.seed))
+    server, _ = start_server(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    emails = [user_email(n) for n in range(args.users)]
+    tokens = {email: {"Authorization": f"Bearer {create_token(email, ACCESS)}"} for email in emails}
+
+    try:
+        baseline = summarize(*read_loop(base, tokens, args.seconds, args.read_concurrency, args.seed), args.seconds)
+
+        stop = threading.Event()
+        statuses = Counter()
+        pool = storm(base, emails, stop, args.storm_threads, statuses)
+        time.sleep(1)  # let the hashing queue fill up
+        under_storm = summarize(*read_loop(base, tokens, args.seconds, args.read_concurrency, args.seed), args.seconds)
+        stop.set()
+        pool.shutdown(wait=True)
+    finally:
+        server.should_exit = True
+
+    for name, row in (("reads alone", baseline), ("reads + storm", under_storm)):
+        print(f"{name:<14} {row['throughput_rps']:>8} req/s  p50 {row['p50_ms']:>8} ms  "
+              f"p95 {row['p95_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  errors {row['errors']}")
+    print("login statuses:", dict(statuses))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "baseline": baseline,
+                "under_storm": under_storm,
+                "login_statuses": {str(code): count for code, count in statuses.items()},
+                "storm_threads": args.storm_threads,
+                "read_concurrency": args.read_concurrency,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
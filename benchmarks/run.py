@@ -0,0 +1,275 @@
+"""
+Load-test the FastAPI backend through its real routers.
+
+By default this seeds a dedicated database, starts main.app under uvicorn
+in-process and drives every scenario at a fixed concurrency:
+
+    python benchmarks/run.py --users 1000 --expenses 50000 --concurrency 32 --output bench.json
+    python benchmarks/run.py --mongomock --users 50 --expenses 5000     # no mongod needed
+    python benchmarks/run.py --base-url http://127.0.0.1:8000 --no-seed # existing server
+
+Results (p50/p95/p99 latency and throughput per endpoint) are written as
+JSON; diff two runs with benchmarks/compare.py.
+
+Most routers are sync PyMongo on a threadpool sized to the Mongo pool (see
+main.py). To check that sizing, run the read scenarios at a concurrency
+above the pool with different sizes:
+
+    python benchmarks/run.py --scenarios list_expenses,summary_monthly --concurrency 128 \
+        --pool-size 100 --threadpool 100 --output matched.json
+    python benchmarks/run.py --scenarios list_expenses,summary_monthly --concurrency 128 \
+        --pool-size 100 --threadpool 40 --output default_anyio.json
+    python benchmarks/compare.py default_anyio.json matched.json
+
+The expense listing and summary endpoints are async and read through
+PyMongo's asyncio client (async_repository.py). --async-mongo off runs the
+same endpoints on the blocking client via the threadpool, so the two can be
+compared against a real mongod (mongomock always takes the threadpool path):
+
+    python benchmarks/run.py --scenarios list_expenses,summary_monthly,summary_by_category \
+        --no-cache --concurrency 128 --async-mongo off --output threadpool.json
+    python benchmarks/run.py --scenarios list_expenses,summary_monthly,summary_by_category \
+        --no-cache --concurrency 128 --async-mongo on --no-seed --output async.json
+    python benchmarks/compare.py threadpool.json async.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# =========================
+# AUTH
+# =========================
+# Access tokens per bench user. With the server in this process the tokens
+# are minted directly (same SECRET_KEY), so the read/write scenarios do not
+# pay a bcrypt login per user; against --base-url each user logs in once.
+_tokens = {}
+MINT_TOKENS = False
+
+
+def auth(session, base, email):
+    token = _tokens.get(email)
+    if token is None:
+        if MINT_TOKENS:
+            from auth import create_token, ACCESS
+            token = create_token(email, ACCESS)
+        else:
+            from seed import PASSWORD
+            res = session.post(f"{base}/users/login", json={"email": email, "password": PASSWORD})
+            res.raise_for_status()
+            token = res.json()["access_token"]
+        _tokens[email] = token
+    return {"Authorization": f"Bearer {token}"}
+
+
+# =========================
+# SCENARIOS
+# =========================
+def add_expense(session, base, email, rng):
+    return session.post(f"{base}/expenses/", headers=auth(session, base, email), json={
+        "amount": round(rng.uniform(1, 50), 2),
+        "category": "Food",
+        "date": datetime.utcnow().strftime("%Y-%m-%d"),
+        "description": "bench write",
+        "email_id": email,
+    })
+
+
+def list_expenses(session, base, email, rng):
+    return session.get(f"{base}/expenses/", params={"limit": 50}, headers=auth(session, base, email))
+
+
+def summary_monthly(session, base, email, rng):
+    return session.get(f"{base}/summary/monthly", headers=auth(session, base, email))
+
+
+def summary_top_categories(session, base, email, rng):
+    return session.get(f"{base}/summary/top-categories", headers=auth(session, base, email))
+
+
+def summary_by_category(session, base, email, rng):
+    return session.get(f"{base}/summary/by-category", headers=auth(session, base, email))
+
+
+def login(session, base, email, rng):
+    from seed import PASSWORD
+    return session.post(f"{base}/users/login", json={"email": email, "password": PASSWORD})
+
+
+def allocate_funds(session, base, email, rng):
+    return session.post(f"{base}/funds/allocate", headers=auth(session, base, email), json={"amount": 100})
+
+
+SCENARIOS = {
+    "add_expense": add_expense,
+    "list_expenses": list_expenses,
+    "summary_monthly": summary_monthly,
+    "summary_top_categories": summary_top_categories,
+    "summary_by_category": summary_by_category,
+    "login": login,
+    "allocate_funds": allocate_funds,
+}
+
+
+# =========================
+# DRIVER
+# =========================
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(name, base, users, requests_count, concurrency, random_seed):
+    from seed import user_email
+
+    scenario = SCENARIOS[name]
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=concurrency))
+
+    def one(i):
+        rng = random.Random(random_seed * 1_000_003 + i)
+        email = user_email(rng.randrange(users))
+        started = time.perf_counter()
+        res = scenario(session, base, email, rng)
+        return time.perf_counter() - started, res.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    return {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": sum(1 for r in results if r[1] >= 400),
+        "throughput_rps": round(requests_count / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+    }
+
+
+def start_server(port):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def async_reads():
+    """Whether the in-process server's async endpoints used the asyncio driver."""
+    from async_repository import arepo
+    return arepo.native
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mongomock", action="store_true", help="Use an in-memory mongomock store")
+    parser.add_argument("--database", default="ExpenseBench", help="Database to seed and query")
+    parser.add_argument("--no-seed", action="store_true", help="Reuse data from an earlier seed")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the server response cache")
+    parser.add_argument("--pool-size", type=int, help="MONGO_MAX_POOL_SIZE for the in-process server")
+    parser.add_argument("--threadpool", type=int, help="API_THREADPOOL_SIZE for the in-process server")
+    parser.add_argument("--async-mongo", choices=("on", "off"), help="MONGO_ASYNC for the in-process server")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--expenses", type=int, default=20000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure before importing the app
+    os.environ["MONGO_DB_NAME"] = args.database
+    if args.mongomock:
+        os.environ["MONGO_URI"] = "mongomock://"
+        os.environ["RUN_MIGRATIONS_ON_STARTUP"] = "0"
+    if args.no_cache:
+        os.environ["CACHE_BACKEND"] = "none"
+    if args.pool_size:
+        os.environ["MONGO_MAX_POOL_SIZE"] = str(args.pool_size)
+    if args.threadpool:
+        os.environ["API_THREADPOOL_SIZE"] = str(args.threadpool)
+    if args.async_mongo:
+        os.environ["MONGO_ASYNC"] = "1" if args.async_mongo == "on" else "0"
+
+    if not args.no_seed:
+        from seed import seed
+        print("Seeding:", seed(args.users, args.expenses, args.categories, random_seed=args.seed))
+
+    base = args.base_url
+    server = None
+    if not base:
+        global MINT_TOKENS
+        MINT_TOKENS = True
+        server, _ = start_server(args.port)
+        base = f"http://127.0.0.1:{args.port}"
+
+    import settings
+    results = {}
+    try:
+        for name in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+            row = run_scenario(name, base, args.users, args.requests, args.concurrency, args.seed)
+            results[name] = row
+            print(f"{name:<24} {row['throughput_rps']:>8} req/s  p50 {row['p50_ms']:>8} ms  "
+                  f"p95 {row['p95_ms']:>8} ms  p99 {row['p99_ms']:>8} ms  errors {row['errors']}")
+    finally:
+        if server:
+            server.should_exit = True
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "commit": git_commit(),
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "store": "mongomock" if args.mongomock else "mongod",
+                    "users": args.users,
+                    "expenses": args.expenses,
+                    "requests": args.requests,
+                    "concurrency": args.concurrency,
+                    "cache": not args.no_cache,
+                    # Only known for the in-process server
+                    "mongo_pool_size": None if args.base_url else settings.MONGO_MAX_POOL_SIZE,
+                    "threadpool": None if args.base_url else settings.API_THREADPOOL_SIZE,
+                    "async_mongo": None if args.base_url else async_reads(),
+                },
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
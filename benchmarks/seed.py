@@ -0,0 +1,143 @@
+"""
+Seed a local MongoDB (or mongomock store) with synthetic benchmark data.
+
+    MONGO_DB_NAME=ExpenseBench python benchmarks/seed.py --users 1000 --expenses 50000
+
+Users are bench-<n>@example.com with password "benchpass". Every user gets
+enough funds to cover their seeded expenses plus headroom for the write
+benchmarks. Existing data in the target database is dropped first, so
+MONGO_DB_NAME must name a scratch database: seeding refuses to run against
+the application's default database.
+"""
+import argparse
+import os
+import random
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+from database import (
+    db,
+    expenses_collection,
+    categories_collection,
+    roles_collection,
+    users_collection,
+    funds_collection,
+    rollups_collection,
+)
+from rollups import apply_rollups_bulk
+from models import user_search_keys, name_key
+from timeseries import ensure_timeseries_collection
+import settings
+
+PASSWORD = "benchpass"
+CATEGORY_NAMES = [
+    "Food", "Rent", "Travel", "Utilities", "Health", "Shopping", "Education",
+    "Entertainment", "Fuel", "Groceries", "Insurance", "Gifts",
+]
+
+
+def user_email(n: int) -> str:
+    return f"bench-{n}@example.com"
+
+
+def seed(users: int, expenses: int, categories: int, months: int = 24, bcrypt_rounds: Optional[int] = None,
+         batch_size: int = 5000, random_seed: int = 42):
+    if db.name == settings.DEFAULT_MONGO_DB_NAME:
+        raise SystemExit(
+            f"Refusing to seed '{db.name}' (the application database): set MONGO_DB_NAME to a scratch database"
+        )
+    rng = random.Random(random_seed)
+    for collection in (expenses_collection, categories_collection, roles_collection,
+                       users_collection, funds_collection, rollups_collection):
+        collection.delete_many({})
+    if settings.EXPENSES_STORAGE == "timeseries":
+        ensure_timeseries_collection()
+
+    category_names = [
+        CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f"Category{i}" for i in range(categories)
+    ]
+    # Keys the unique indexes from migration 4 are built on
+    categories_collection.insert_many([{"name": name, "name_key": name_key(name)} for name in category_names])
+    roles_collection.insert_many([
+        {"role_name": role, "role_key": name_key(role)} for role in ("User", "Admin")
+    ])
+
+    # Hash once: every bench user shares the password. Defaults to the
+    # server's work factor so logins do not trigger a rehash.
+    hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(bcrypt_rounds or settings.BCRYPT_ROUNDS)).decode("utf-8")
+    user_docs = [
+        {
+            "first_name": "Bench",
+            "middle_name": None,
+            "last_name": f"User{n}",
+            "email_id": user_email(n),
+            "password": hashed,
+            "role_name": "User",
+        }
+        for n in range(users)
+    ]
+    users_collection.insert_many([{**doc, **user_search_keys(doc)} for doc in user_docs])
+
+    now = datetime.utcnow()
+    spent = defaultdict(float)
+    per_user = defaultdict(list)
+    batch = []
+    for _ in range(expenses):
+        email_id = user_email(rng.randrange(users))
+        amount = round(rng.uniform(1, 500), 2)
+        doc = {
+            "amount": amount,
+            "category": rng.choice(category_names),
+            "date": now - timedelta(days=rng.randrange(months * 30), minutes=rng.randrange(1440)),
+            "description": f"bench expense {rng.randrange(10 ** 6)}",
+            "email_id": email_id,
+            "created_at": now,
+            "updated_at": now,
+        }
+        spent[email_id] += amount
+        per_user[email_id].append(doc)
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            expenses_collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        expenses_collection.insert_many(batch, ordered=False)
+
+    funds_collection.insert_many([
+        {
+            "email_id": user_email(n),
+            "total_funds": spent[user_email(n)] + 10 ** 9,
+            "spent": spent[user_email(n)],
+            "balance": 10 ** 9,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for n in range(users)
+    ])
+
+    # Incremental path works on both mongod and mongomock ($merge does not)
+    for email_id, docs in per_user.items():
+        apply_rollups_bulk(email_id, docs)
+
+    return {"users": users, "expenses": expenses, "categories": categories, "database": db.name}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--expenses", type=int, default=50000)
+    parser.add_argument("--categories", type=int, default=12)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="Defaults to BCRYPT_ROUNDS")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    print(seed(args.users, args.expenses, args.categories, args.months, args.bcrypt_rounds, random_seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
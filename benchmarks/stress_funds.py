@@ -0,0 +1,114 @@
+"""
+Concurrency stress test for fund accounting.
+
+Fires many concurrent expense posts (more than the balance can cover) for a
+single user, interleaved with concurrent fund allocations, then checks the
+ledger invariants:
+
+- no overspend: spent <= total_funds and balance == total_funds - spent
+- no lost allocation: total_funds == initial + every accepted allocation
+- ledger matches data: spent == sum of stored expenses == accepted posts
+
+    python benchmarks/stress_funds.py --expenses 2000 --allocations 200 --concurrency 64
+
+Run against a real mongod (mongomock does not give per-document atomicity
+under threads). Exits with status 1 if any invariant is violated.
+"""
+import argparse
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from requests.adapters import HTTPAdapter
+
+EMAIL = "stress@example.com"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="ExpenseStress")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--initial-funds", type=float, default=1000)
+    parser.add_argument("--expenses", type=int, default=2000, help="Concurrent expense posts")
+    parser.add_argument("--expense-amount", type=float, default=5)
+    parser.add_argument("--allocations", type=int, default=200, help="Concurrent fund allocations")
+    parser.add_argument("--allocation-amount", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ["MONGO_DB_NAME"] = args.database
+    os.environ["CACHE_BACKEND"] = "none"
+    from database import expenses_collection, funds_collection, rollups_collection
+    from run import start_server
+
+    for collection in (expenses_collection, funds_collection, rollups_collection):
+        collection.delete_many({"email_id": EMAIL})
+
+    server, _ = start_server(args.port)
+    base = f"http://127.0.0.1:{args.port}"
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=args.concurrency))
+
+    from auth import create_token, ACCESS
+    headers = {"Authorization": f"Bearer {create_token(EMAIL, ACCESS)}"}
+    session.post(f"{base}/funds/allocate", headers=headers, json={"amount": args.initial_funds}).raise_for_status()
+
+    def post_expense(_):
+        return "expense", session.post(f"{base}/expenses/", headers=headers, json={
+            "amount": args.expense_amount,
+            "category": "Food",
+            "date": datetime.utcnow().strftime("%Y-%m-%d"),
+            "description": "stress",
+            "email_id": EMAIL,
+        }).status_code
+
+    def allocate(_):
+        return "allocation", session.post(
+            f"{base}/funds/allocate", headers=headers, json={"amount": args.allocation_amount}
+        ).status_code
+
+    jobs = [post_expense] * args.expenses + [allocate] * args.allocations
+    random.Random(args.seed).shuffle(jobs)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(lambda job: job(None), jobs))
+    server.should_exit = True
+
+    accepted_expenses = sum(1 for kind, code in outcomes if kind == "expense" and code == 200)
+    rejected_expenses = sum(1 for kind, code in outcomes if kind == "expense" and code == 400)
+    accepted_allocations = sum(1 for kind, code in outcomes if kind == "allocation" and code == 200)
+    unexpected = [(kind, code) for kind, code in outcomes if code not in (200, 400)]
+
+    fund = funds_collection.find_one({"email_id": EMAIL})
+    stored = list(expenses_collection.aggregate([
+        {"$match": {"email_id": EMAIL}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]))
+    stored_total = stored[0]["total"] if stored else 0
+    stored_count = stored[0]["count"] if stored else 0
+    expected_total_funds = args.initial_funds + accepted_allocations * args.allocation_amount
+
+    checks = {
+        "no unexpected status codes": not unexpected,
+        "no overspend (spent <= total_funds)": fund["spent"] <= fund["total_funds"] + 1e-6,
+        "balance == total_funds - spent": abs(fund["balance"] - (fund["total_funds"] - fund["spent"])) < 1e-6,
+        "no lost allocation": abs(fund["total_funds"] - expected_total_funds) < 1e-6,
+        "spent == sum(stored expenses)": abs(fund["spent"] - stored_total) < 1e-6,
+        "stored expenses == accepted posts": stored_count == accepted_expenses,
+    }
+
+    print(f"expenses accepted {accepted_expenses}, rejected {rejected_expenses}; allocations accepted {accepted_allocations}")
+    print(f"funds: total {fund['total_funds']} spent {fund['spent']} balance {fund['balance']} version {fund.get('version')}")
+    for name, ok in checks.items():
+        print(f"{'PASS' if ok else 'FAIL'}  {name}")
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Response cache for the read-mostly endpoints.
+
+Entries are keyed "<namespace>:<scope>:<path+query hash>", where scope is the
+user's email (or "all" for shared data such as categories), so a write can
+drop exactly the namespaces and user it affects. Cached responses carry an
+ETag; clients that send it back in If-None-Match get an empty 304.
+Every invalidation also bumps a generation counter for the namespace (and
+scope), so a response computed while a write landed is served but not stored.
+
+CACHE_BACKEND selects "memory" (in-process LRU with TTL, the default),
+"redis" (needs the redis package and REDIS_URL) or "none".
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+import settings
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def generation(self, keys: list) -> tuple:
+        with self._lock:
+            return tuple(self._generations.get(key, 0) for key in keys)
+
+    def bump(self, key: str):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """
+    Same interface backed by a (local) Redis-compatible server.
+    """
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for this backend
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: int):
+        self._client.setex(key, ttl, json.dumps(value))
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self._client.scan_iter(match=f"{prefix}*", count=500))
+        if keys:
+            self._client.delete(*keys)
+
+    # Shared by every worker, so an invalidation in one is seen by the others
+    def generation(self, keys: list) -> tuple:
+        return tuple(int(value or 0) for value in self._client.mget([f"gen:{key}" for key in keys]))
+
+    def bump(self, key: str):
+        self._client.incr(f"gen:{key}")
+
+    def clear(self):
+        self.delete_prefix("")
+
+
+class NullCache:
+    def get(self, key: str):
+        return None
+
+    def set(self, key: str, value: Any, ttl: int):
+        pass
+
+    def delete_prefix(self, prefix: str):
+        pass
+
+    def generation(self, keys: list) -> tuple:
+        return ()
+
+    def bump(self, key: str):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _make_backend():
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCache(settings.REDIS_URL)
+    if settings.CACHE_BACKEND == "none":
+        return NullCache()
+    return LRUCache(settings.CACHE_MAX_ENTRIES)
+
+
+backend = _make_backend()
+
+
+# =========================
+# HELPERS
+# =========================
+def cache_key(namespace: str, scope: str, request: Request) -> str:
+    # The path keeps endpoints sharing a namespace (e.g. the summaries) apart
+    params = json.dumps([request.url.path, sorted(request.query_params.multi_items())])
+    return f"{namespace}:{scope}:{hashlib.sha1(params.encode('utf-8')).hexdigest()}"
+
+
+def _store(key: str, generation_keys: list, generation: tuple, value: Any, ttl: Optional[int]) -> dict:
+    body = json.dumps(jsonable_encoder(value))
+    entry = {"body": body, "etag": f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"'}
+    # An invalidation during compute() may not be in the body: serve it once, don't keep it
+    if backend.generation(generation_keys) == generation:
+        backend.set(key, entry, ttl or settings.CACHE_TTL_SECONDS)
+    return entry
+
+
+def _respond(request: Request, entry: dict) -> Response:
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == entry["etag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+def cached_json(request: Request, namespace: str, scope: str, compute: Callable[[], Any], ttl: Optional[int] = None) -> Response:
+    """
+    Serve `compute()` as JSON from the cache, honouring If-None-Match.
+    """
+    key = cache_key(namespace, scope, request)
+    entry = backend.get(key)
+    if entry is None:
+        generation_keys = [namespace, f"{namespace}:{scope}"]
+        generation = backend.generation(generation_keys)
+        entry = _store(key, generation_keys, generation, compute(), ttl)
+    return _respond(request, entry)
+
+
+async def cached_json_async(request: Request, namespace: str, scope: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Response:
+    """
+    cached_json for async endpoints: `compute` is a coroutine function.
+    Lookups stay synchronous (in-process, or one local Redis round trip).
+    """
+    key = cache_key(namespace, scope, request)
+    entry = backend.get(key)
+    if entry is None:
+        generation_keys = [namespace, f"{namespace}:{scope}"]
+        generation = backend.generation(generation_keys)
+        entry = _store(key, generation_keys, generation, await compute(), ttl)
+    return _respond(request, entry)
+
+
+def invalidate(namespace: str, scope: Optional[str] = None):
+    # Bump first: a compute() that started before this cannot store afterwards
+    backend.bump(f"{namespace}:{scope}" if scope else namespace)
+    backend.delete_prefix(f"{namespace}:{scope}:" if scope else f"{namespace}:")
+
+
+_user_listeners = []
+
+
+def on_invalidate_user(callback: Callable[[str], None]):
+    """
+    Register an in-process cache (e.g. analytics frames) to be dropped with the user's entries.
+    """
+    _user_listeners.append(callback)
+
+
+def invalidate_user(email_id: str):
+    """
+    Drop everything derived from a user's funds or expenses.
+    """
+    email_id = email_id.strip().lower()
+    invalidate("funds", email_id)
+    invalidate("funds_categories", email_id)
+    invalidate("summary", email_id)
+    invalidate("dashboard", email_id)
+    for callback in _user_listeners:
+        callback(email_id)
@@ -2,15 +2,62 @@
 from pymongo import MongoClient  
 from bson import ObjectId
 
-MONGO_URI="mongodb://localhost:27017/"
-client=MongoClient(MONGO_URI)
-db = client["DailyExpenseTracker"]
-expenses_collection = db["expenses"]
+import settings
+from instrumentation import command_listener
+
+# Pool, timeouts and read preference, shared by the sync and async clients
+CLIENT_OPTIONS = dict(
+    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+    minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+    serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    socketTimeoutMS=settings.MONGO_SOCKET_TIMEOUT_MS,
+    readPreference=settings.MONGO_READ_PREFERENCE,
+    event_listeners=[command_listener],
+)
+
+# One client per process: it owns the connection pool every router shares
+if settings.MONGO_URI.startswith("mongomock://"):
+    # In-memory stand-in for benchmarks/tests without a server (optional dependency)
+    import mongomock
+    client = mongomock.MongoClient()
+else:
+    client = MongoClient(settings.MONGO_URI, **CLIENT_OPTIONS)
+db = client[settings.MONGO_DB_NAME]
+
+# Same field names in both modes, so every query runs unchanged (see timeseries.py)
+EXPENSES_TIMESERIES = settings.EXPENSES_STORAGE == "timeseries"
+expenses_collection = db[settings.EXPENSES_TS_COLLECTION if EXPENSES_TIMESERIES else "expenses"]
 categories_collection = db["categories"]
 roles_collection = db["roles"]
 users_collection = db["users"]
 funds_collection = db["funds"]
-funds_collection.create_index("email_id", unique=True)
+rollups_collection = db["expense_rollups"]
+migrations_collection = db["schema_migrations"]
+jobs_collection = db["jobs"]
+deleted_expenses_collection = db["deleted_expenses"]
+# Cold tier: one document per user and month of old expenses (archive.py)
+archive_collection = db["expense_archive"]
+
+_async_client = None
+
+
+def async_db():
+    """
+    The same database on PyMongo's asyncio client (pymongo 4.9+), for the
+    async reads in async_repository.py. Created on first use, from inside
+    the event loop.
+    """
+    global _async_client
+    if _async_client is None:
+        from pymongo import AsyncMongoClient
+        _async_client = AsyncMongoClient(settings.MONGO_URI, **CLIENT_OPTIONS)
+    return _async_client[settings.MONGO_DB_NAME]
+
+
+# Indexes are created by migrations.py (run at startup or from the CLI)
 # print(client.list_database_names())
 
 
@@ -0,0 +1,133 @@
+"""
+Streaming expense exports.
+
+Each exporter takes an iterable of expense documents (a PyMongo cursor, or
+the hot/archive merge from router/expenses.py) and yields encoded chunks one
+batch at a time, so memory stays flat however many rows are exported. Parquet
+(pyarrow) and XLSX (openpyxl) are optional dependencies.
+"""
+import csv
+import io
+import tempfile
+from itertools import islice
+from typing import Iterator
+
+EXPORT_COLUMNS = ("id", "date", "category", "amount", "description")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _batches(rows, size: int) -> Iterator[list]:
+    iterator = iter(rows)
+    try:
+        while True:
+            batch = list(islice(iterator, size))
+            if not batch:
+                return
+            yield batch
+    finally:
+        # Cursors and generators both release their resources on close()
+        close = getattr(rows, "close", None)
+        if close:
+            close()
+
+
+def _row(doc) -> tuple:
+    return (str(doc["_id"]), doc.get("date"), doc.get("category"), doc.get("amount"), doc.get("description", ""))
+
+
+def export_csv(cursor, batch_size: int) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batches(cursor, batch_size):
+        for doc in batch:
+            row = _row(doc)
+            writer.writerow((row[0], row[1].strftime("%Y-%m-%d") if row[1] else "", *row[2:]))
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands written bytes back out in chunks.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_parquet(cursor, batch_size: int) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.string()),
+        ("date", pa.timestamp("ms")),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("amount", pa.float64()),
+        ("description", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for batch in _batches(cursor, batch_size):
+        columns = list(zip(*(_row(doc) for doc in batch)))
+        writer.write_batch(pa.RecordBatch.from_arrays([
+            pa.array(columns[0], pa.string()),
+            pa.array(columns[1], pa.timestamp("ms")),
+            pa.array(columns[2], pa.string()).dictionary_encode(),
+            pa.array(columns[3], pa.float64()),
+            pa.array(columns[4], pa.string()),
+        ], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export_xlsx(cursor, batch_size: int) -> Iterator[bytes]:
+    from openpyxl import Workbook
+
+    # write_only mode streams rows to temp files instead of building a sheet in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Expenses")
+    sheet.append(EXPORT_COLUMNS)
+    for batch in _batches(cursor, batch_size):
+        for doc in batch:
+            sheet.append(_row(doc))
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+
+EXPORTERS = {"csv": export_csv, "parquet": export_parquet, "xlsx": export_xlsx}
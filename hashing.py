@@ -0,0 +1,87 @@
+"""
+Bounded worker pool for bcrypt.
+
+Password hashing is the most expensive thing the API does (tens to
+hundreds of milliseconds of CPU per call). Run in request handlers it
+occupies the shared threadpool, so a burst of logins stalls cheap expense
+reads. Here it gets its own HASH_WORKERS threads (bcrypt releases the GIL
+while hashing, so threads use separate cores). Admission is capped at
+workers + HASH_QUEUE_LIMIT in-flight jobs; past that, callers get a 429
+with a Retry-After estimated from the recent hash latency.
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from auth import hash_password, check_password
+from instrumentation import (
+    PASSWORD_HASH_SECONDS,
+    PASSWORD_HASH_WAIT_SECONDS,
+    PASSWORD_HASH_QUEUE_DEPTH,
+    PASSWORD_HASH_REJECTED,
+)
+import settings
+
+_executor = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix="bcrypt")
+_lock = threading.Lock()
+_in_flight = 0
+# Exponentially weighted hash time, used for Retry-After
+_avg_seconds = 0.25
+
+
+def _admit(operation: str):
+    global _in_flight
+    with _lock:
+        if _in_flight >= settings.HASH_WORKERS + settings.HASH_QUEUE_LIMIT:
+            PASSWORD_HASH_REJECTED.inc((operation,))
+            retry_after = max(1, math.ceil(_in_flight * _avg_seconds / settings.HASH_WORKERS))
+            raise HTTPException(
+                status_code=429,
+                detail="Too many password operations in progress, retry shortly",
+                headers={"Retry-After": str(retry_after)}
+            )
+        _in_flight += 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_in_flight)
+
+
+def _release():
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_in_flight)
+
+
+def _timed(operation: str, submitted: float, fn, *args):
+    global _avg_seconds
+    started = time.perf_counter()
+    PASSWORD_HASH_WAIT_SECONDS.observe((operation,), started - submitted)
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - started
+        PASSWORD_HASH_SECONDS.observe((operation,), elapsed)
+        _avg_seconds = 0.9 * _avg_seconds + 0.1 * elapsed
+
+
+async def _run(operation: str, fn, *args):
+    _admit(operation)
+    try:
+        future = _executor.submit(_timed, operation, time.perf_counter(), fn, *args)
+    except BaseException:
+        _release()
+        raise
+    # Released when the job really ends, even if the client went away first
+    future.add_done_callback(lambda _: _release())
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run("hash", hash_password, password)
+
+
+async def check_password_async(password: str, stored: str) -> bool:
+    return await _run("verify", check_password, password, stored)
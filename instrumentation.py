@@ -0,0 +1,297 @@
+"""
+Request and MongoDB instrumentation.
+
+- MetricsMiddleware times every request per route template.
+- MongoCommandListener counts Mongo commands and their durations, both
+  globally and against the request that issued them, so a slow endpoint
+  can be split into "time in Mongo" and "everything else" (threadpool
+  wait, serialization).
+- With SLOW_QUERY_MS set, commands slower than that are logged together
+  with their explain plan.
+- hashing.py reports bcrypt latency, queue wait and queue depth here.
+
+Metrics are rendered in Prometheus text format by render_metrics(), which
+router/metrics.py exposes at GET /metrics.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+from bson import json_util
+from pymongo import monitoring
+from starlette.routing import Match
+import settings
+
+logger = logging.getLogger("expense_tracker.slow_query")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# =========================
+# METRIC TYPES
+# =========================
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(n, v) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, labels: Tuple = (), amount: float = 1.0):
+        self.inc(labels, -amount)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts, then sum, then count
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_SECONDS = register(Histogram(
+    "http_request_duration_seconds", "End-to-end request latency.", ("method", "route", "status")))
+HTTP_REQUEST_MONGO_SECONDS = register(Histogram(
+    "http_request_mongo_seconds", "Time spent in MongoDB commands per request.", ("method", "route")))
+HTTP_REQUEST_MONGO_COMMANDS = register(Histogram(
+    "http_request_mongo_commands", "MongoDB commands issued per request.", ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)))
+MONGO_COMMAND_SECONDS = register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency.", ("command", "collection")))
+MONGO_COMMAND_FAILURES = register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands.", ("command",)))
+PASSWORD_HASH_SECONDS = register(Histogram(
+    "password_hash_duration_seconds", "bcrypt hash/verify time in the hashing pool.", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+PASSWORD_HASH_WAIT_SECONDS = register(Histogram(
+    "password_hash_wait_seconds", "Time a hashing job waited for a pool worker.", ("operation",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+PASSWORD_HASH_QUEUE_DEPTH = register(Gauge(
+    "password_hash_queue_depth", "Hashing jobs admitted and not yet finished (running + queued)."))
+PASSWORD_HASH_REJECTED = register(Counter(
+    "password_hash_rejected_total", "Hashing jobs refused with 429 because the queue was full.", ("operation",)))
+SLOW_QUERY_EXPLAINS_SKIPPED = register(Counter(
+    "slow_query_explains_skipped_total", "Slow queries logged without a plan because the explain queue was full."))
+
+
+# =========================
+# PER-REQUEST CONTEXT
+# =========================
+# Mutable dict so sync endpoints (run in the threadpool with a copied
+# context) update the same object the middleware reads afterwards.
+_request_stats: ContextVar[Optional[dict]] = ContextVar("request_stats", default=None)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    app = scope.get("app")
+    for candidate in getattr(app, "routes", []):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return getattr(candidate, "path", "unmatched")
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: per-route latency plus the Mongo share of it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = {"mongo_commands": 0, "mongo_seconds": 0.0}
+        token = _request_stats.set(stats)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = _route_template(scope)
+            method = scope.get("method", "")
+            HTTP_REQUEST_SECONDS.observe((method, route, str(status["code"])), elapsed)
+            HTTP_REQUEST_MONGO_SECONDS.observe((method, route), stats["mongo_seconds"])
+            HTTP_REQUEST_MONGO_COMMANDS.observe((method, route), stats["mongo_commands"])
+
+
+# =========================
+# MONGO COMMAND LISTENER
+# =========================
+PROFILED_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+_explain_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+# Bounds the pool's queue: a burst of slow queries must not pile up explains
+_explain_slots = threading.BoundedSemaphore(max(settings.SLOW_QUERY_EXPLAIN_QUEUE, 1))
+
+
+def _slow_query_entry(database_name: str, command_name: str, command: dict, duration_ms: float) -> dict:
+    return {"command": command_name, "database": database_name, "duration_ms": round(duration_ms, 2), "query": command}
+
+
+def _explain_and_log(database_name: str, command_name: str, command: dict, duration_ms: float):
+    entry = _slow_query_entry(database_name, command_name, command, duration_ms)
+    try:
+        from database import client  # late import: database.py imports this module
+        explain = client[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+        entry["plan"] = explain.get("queryPlanner", {}).get("winningPlan", explain)
+    except Exception as e:
+        entry["plan_error"] = str(e)
+    finally:
+        _explain_slots.release()
+    logger.warning("slow query %s", json.dumps(entry, default=json_util.default))
+
+
+def _report_slow_query(database_name: str, command_name: str, command: dict, duration_ms: float):
+    if _explain_slots.acquire(blocking=False):
+        _explain_pool.submit(_explain_and_log, database_name, command_name, command, duration_ms)
+        return
+    SLOW_QUERY_EXPLAINS_SKIPPED.inc()
+    entry = _slow_query_entry(database_name, command_name, command, duration_ms)
+    entry["plan_error"] = "explain queue full"
+    logger.warning("slow query %s", json.dumps(entry, default=json_util.default))
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event):
+        return event.request_id, event.connection_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        command = None
+        if settings.SLOW_QUERY_MS and event.command_name in PROFILED_COMMANDS:
+            # Keep the command body only while slow-query logging is on
+            command = {k: v for k, v in event.command.items() if not k.startswith("$") and k != "lsid"}
+        with self._lock:
+            self._pending[self._key(event)] = (
+                event.database_name, collection if isinstance(collection, str) else "", command
+            )
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        MONGO_COMMAND_FAILURES.inc((event.command_name,))
+        self._finish(event)
+
+    def _finish(self, event):
+        seconds = event.duration_micros / 1_000_000
+        with self._lock:
+            pending = self._pending.pop(self._key(event), None)
+
+        database_name, collection, command = pending or ("", "", None)
+        MONGO_COMMAND_SECONDS.observe((event.command_name, collection), seconds)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats["mongo_commands"] += 1
+            stats["mongo_seconds"] += seconds
+
+        if command is not None and seconds * 1000 >= settings.SLOW_QUERY_MS:
+            _report_slow_query(database_name, event.command_name, command, seconds * 1000)
+
+
+command_listener = MongoCommandListener()
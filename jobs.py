@@ -0,0 +1,219 @@
+"""
+Background cleanup jobs with progress tracking.
+
+Deleting a user, renaming/deleting a category or archiving old expenses
+can touch every expense involved, so the request only records a job and hands it to FastAPI's
+BackgroundTasks; the work runs after the response in bounded batches of
+JOB_BATCH_SIZE rows. Each job is a document in the `jobs` collection
+whose `progress` counters are updated after every batch and can be
+polled through GET /jobs/{job_id}.
+"""
+import traceback
+from datetime import datetime
+from typing import Callable, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import BulkWriteError
+from database import (
+    expenses_collection,
+    funds_collection,
+    rollups_collection,
+    categories_collection,
+    jobs_collection,
+    deleted_expenses_collection,
+    archive_collection,
+)
+from models import name_key
+from rollups import rebuild_rollups
+from archive import archive_expenses, expand_bucket
+from cache import invalidate, invalidate_user
+import settings
+
+# Where expenses of a deleted category go when no other target is given
+FALLBACK_CATEGORY = "Uncategorized"
+
+
+# =========================
+# JOB TRACKING
+# =========================
+def create_job(kind: str, params: dict) -> str:
+    now = datetime.utcnow()
+    result = jobs_collection.insert_one({
+        "kind": kind,
+        "params": params,
+        "status": "queued",
+        "progress": {},
+        "created_at": now,
+        "updated_at": now,
+    })
+    return str(result.inserted_id)
+
+
+def _progress(job_id: str, **counters):
+    jobs_collection.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$inc": {f"progress.{name}": value for name, value in counters.items()},
+         "$set": {"updated_at": datetime.utcnow()}}
+    )
+
+
+def _set_status(job_id: str, status: str, error: Optional[str] = None):
+    fields = {"status": status, "updated_at": datetime.utcnow()}
+    if status in ("done", "failed"):
+        fields["finished_at"] = fields["updated_at"]
+    if error:
+        fields["error"] = error
+    jobs_collection.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+
+
+def run_job(job_id: str, task: Callable, *args):
+    """
+    Entry point handed to BackgroundTasks: runs `task(job_id, *args)` and
+    records how it ended.
+    """
+    _set_status(job_id, "running")
+    try:
+        task(job_id, *args)
+        _set_status(job_id, "done")
+    except Exception as e:
+        traceback.print_exc()
+        _set_status(job_id, "failed", str(e))
+
+
+def job_serializer(job) -> dict:
+    return {
+        "id": str(job["_id"]),
+        "kind": job.get("kind"),
+        "params": job.get("params", {}),
+        "status": job.get("status"),
+        "progress": job.get("progress", {}),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+# =========================
+# CLEANUP TASKS
+# =========================
+def _copy_to_deleted(docs: list):
+    """
+    Copy expenses into `deleted_expenses`, keeping their _id. Rows an
+    earlier run of the same job already copied (it crashed before
+    deleting them) are skipped rather than failing the batch.
+    """
+    now = datetime.utcnow()
+    try:
+        deleted_expenses_collection.insert_many([{**doc, "deleted_at": now} for doc in docs], ordered=False)
+    except BulkWriteError as e:
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+
+
+def purge_user_data(job_id: str, email_id: str, archive: bool = False):
+    """
+    Remove a deleted user's expenses, hot and archived (optionally copying
+    them to `deleted_expenses` first), then their rollups and funds record.
+    """
+    email_id = email_id.strip().lower()
+    while True:
+        # (email_id, date) index: each batch is a short index range
+        batch = list(expenses_collection.find({"email_id": email_id}).limit(settings.JOB_BATCH_SIZE))
+        if not batch:
+            break
+        if archive:
+            _copy_to_deleted(batch)
+            _progress(job_id, expenses_archived=len(batch))
+        result = expenses_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        _progress(job_id, expenses_deleted=result.deleted_count)
+
+    # One bucket at a time: a bucket holds at most a month of one user's rows
+    for bucket in archive_collection.find({"email_id": email_id}):
+        rows = expand_bucket(bucket)
+        if archive and rows:
+            _copy_to_deleted(rows)
+            _progress(job_id, expenses_archived=len(rows))
+        archive_collection.delete_one({"_id": bucket["_id"]})
+        _progress(job_id, archive_buckets_deleted=1)
+    _progress(job_id, rollups_deleted=rollups_collection.delete_many({"email_id": email_id}).deleted_count)
+    _progress(job_id, funds_deleted=funds_collection.delete_one({"email_id": email_id}).deleted_count)
+    invalidate_user(email_id)
+
+
+def remap_category(job_id: str, old_name: str, new_name: Optional[str]):
+    """
+    Move every expense filed under `old_name` to `new_name` (a rename) or,
+    when `new_name` is None, to FALLBACK_CATEGORY (a delete), then rebuild
+    the rollups of the users that were touched.
+    """
+    target = new_name or ensure_category(FALLBACK_CATEGORY)
+    affected = set()
+    last_id = None
+    while True:
+        # Single forward pass in _id order; category is not an index prefix
+        query = {"category": old_name}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            expenses_collection.find(query, {"email_id": 1})
+            .sort("_id", ASCENDING)
+            .limit(settings.JOB_BATCH_SIZE)
+        )
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        result = expenses_collection.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in batch]}, "category": old_name},
+            {"$set": {"category": target}}
+        )
+        affected.update(doc["email_id"] for doc in batch)
+        _progress(job_id, expenses_remapped=result.modified_count)
+
+    # Archived rows are remapped in place, bucket by bucket
+    for bucket in archive_collection.find({"rows.c": old_name}, {"email_id": 1}):
+        archive_collection.update_one(
+            {"_id": bucket["_id"]},
+            {"$set": {"rows.$[r].c": target}},
+            array_filters=[{"r.c": old_name}]
+        )
+        affected.add(bucket["email_id"])
+        _progress(job_id, archive_buckets_remapped=1)
+
+    # Per-category allocations follow the category (dropped on delete)
+    if new_name:
+        funds_collection.update_many(
+            {"category_allocations.category": old_name},
+            {"$set": {"category_allocations.$[a].category": new_name}},
+            array_filters=[{"a.category": old_name}]
+        )
+    else:
+        for fund_doc in funds_collection.find({"category_allocations.category": old_name}, {"email_id": 1}):
+            affected.add(fund_doc["email_id"])
+        funds_collection.update_many(
+            {"category_allocations.category": old_name},
+            {"$pull": {"category_allocations": {"category": old_name}}}
+        )
+
+    for email_id in affected:
+        rebuild_rollups(email_id)
+        invalidate_user(email_id)
+        _progress(job_id, users_rebuilt=1)
+    invalidate("funds_categories")
+
+
+def archive_old_expenses(job_id: str, older_than_days: Optional[int], email_id: Optional[str]):
+    """Move expenses past the archive horizon into monthly buckets (archive.py)."""
+    archive_expenses(older_than_days, email_id, on_batch=lambda **counters: _progress(job_id, **counters))
+
+
+def ensure_category(name: str) -> str:
+    """Create category `name` if it does not exist; return its stored name."""
+    category = categories_collection.find_one_and_update(
+        {"name_key": name_key(name)},
+        {"$setOnInsert": {"name": name.strip().capitalize(), "name_key": name_key(name)}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate("categories")
+    return category["name"]
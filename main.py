@@ -1,13 +1,32 @@
 from fastapi import FastAPI
-from router import expenses,categories,users, roles,funds
+from anyio import to_thread
+from router import expenses,categories,users, roles,funds,metrics,dashboard,analytics,jobs
+from instrumentation import MetricsMiddleware
+from repository import repo
+import settings
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+def prepare_storage():
+    # Create/upgrade tables, collections and indexes before serving traffic
+    repo.setup()
+
+
+@app.on_event("startup")
+async def size_threadpool():
+    # Sync endpoints run here; match it to the Mongo pool
+    to_thread.current_default_thread_limiter().total_tokens = settings.API_THREADPOOL_SIZE
+
 # Include routes
 app.include_router(expenses.router)
 app.include_router(categories.router)
 app.include_router(users.router)
 app.include_router(roles.router)
 app.include_router(funds.router)
-
-
-
+app.include_router(dashboard.router)
+app.include_router(analytics.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
@@ -0,0 +1,235 @@
+"""
+Versioned index and schema migrations.
+
+Each migration runs once and is recorded in the `schema_migrations`
+collection, so startup only pays for the ones that have not been applied.
+Every worker runs them at startup: a runner first claims a version by
+inserting its record as "running", and one that loses the claim leaves the
+rest to the winner instead of failing.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # list applied / pending versions
+    python migrations.py stats      # $indexStats usage counters per index
+"""
+import sys
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from database import (
+    db,
+    expenses_collection,
+    categories_collection,
+    roles_collection,
+    users_collection,
+    funds_collection,
+    rollups_collection,
+    migrations_collection,
+    archive_collection,
+    jobs_collection,
+)
+from models import name_key, USER_SEARCH_KEYS
+from rollups import rebuild_rollups
+import settings
+
+# Case-insensitive comparisons (strength 2 ignores case, not accents)
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+
+
+# =========================
+# MIGRATIONS
+# =========================
+def _001_core_indexes():
+    funds_collection.create_index("email_id", unique=True)
+    users_collection.create_index("email_id", unique=True)
+
+    # Hot expense queries: per-user listings by date, category filters, summaries
+    expenses_collection.create_index([("email_id", ASCENDING), ("date", DESCENDING)])
+    expenses_collection.create_index(
+        [("email_id", ASCENDING), ("category", ASCENDING), ("date", DESCENDING)]
+    )
+
+
+def _002_name_collation_indexes():
+    categories_collection.create_index("name", collation=CASE_INSENSITIVE, name="name_ci")
+    roles_collection.create_index("role_name", collation=CASE_INSENSITIVE, name="role_name_ci")
+
+
+def _003_expense_rollups():
+    # $merge in rebuild_rollups needs a unique index on its "on" fields
+    rollups_collection.create_index(
+        [("email_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING)], unique=True
+    )
+    rebuild_rollups()
+
+
+def _004_normalized_name_keys():
+    for collection, field, key_field, old_index in (
+        (categories_collection, "name", "name_key", "name_ci"),
+        (roles_collection, "role_name", "role_key", "role_name_ci"),
+    ):
+        seen = set()
+        for doc in collection.find({}, {field: 1}).sort("_id", ASCENDING):
+            key = name_key(doc.get(field) or "")
+            if key in seen:
+                # Case variant the old regex check let through; keep the oldest
+                collection.delete_one({"_id": doc["_id"]})
+                continue
+            seen.add(key)
+            collection.update_one({"_id": doc["_id"]}, {"$set": {key_field: key}})
+        collection.create_index(key_field, unique=True)
+        try:
+            collection.drop_index(old_index)
+        except OperationFailure:
+            pass
+
+    # Expenses are stored as category.strip().capitalize(); bring older rows in line
+    expenses_collection.update_many(
+        {"category": {"$type": "string"}},
+        [{"$set": {"category": {"$let": {
+            "vars": {"c": {"$trim": {"input": "$category"}}},
+            "in": {"$concat": [
+                {"$toUpper": {"$substrCP": ["$$c", 0, 1]}},
+                {"$toLower": {"$substrCP": ["$$c", 1, {"$strLenCP": "$$c"}]}}
+            ]}
+        }}}}]
+    )
+    rebuild_rollups()
+
+
+def _005_user_search_keys():
+    # Lowercased copies of the searchable user fields, so prefix search is an
+    # anchored, case-sensitive regex that can walk an index
+    users_collection.update_many({}, [{"$set": {
+        key_field: {"$toLower": {"$trim": {"input": {"$ifNull": [f"${field}", ""]}}}}
+        for field, key_field in USER_SEARCH_KEYS.items()
+    }}])
+    for key_field in ("first_name_key", "last_name_key"):
+        users_collection.create_index([(key_field, ASCENDING), ("_id", ASCENDING)])
+    users_collection.create_index([("email_key", ASCENDING), ("_id", ASCENDING)])
+    users_collection.create_index([("role_key", ASCENDING), ("email_key", ASCENDING), ("_id", ASCENDING)])
+
+
+def _006_expense_archive():
+    archive_collection.create_index([("email_id", ASCENDING), ("month", DESCENDING)], unique=True)
+    # restore() finds a single archived row by id
+    archive_collection.create_index([("email_id", ASCENDING), ("rows.i", ASCENDING)])
+    jobs_collection.create_index([("created_at", DESCENDING)])
+
+
+MIGRATIONS = [
+    (1, "core indexes for funds, users and expenses", _001_core_indexes),
+    (2, "case-insensitive collation indexes for category and role names", _002_name_collation_indexes),
+    (3, "monthly/category expense rollups", _003_expense_rollups),
+    (4, "normalized category/role keys and expense categories", _004_normalized_name_keys),
+    (5, "lowercased user search keys and their indexes", _005_user_search_keys),
+    (6, "expense archive buckets and job indexes", _006_expense_archive),
+]
+
+
+# =========================
+# RUNNER
+# =========================
+RUNNING = "running"
+
+
+def applied_versions():
+    # Records from before claims existed have no status and count as applied
+    return {doc["_id"] for doc in migrations_collection.find({"status": {"$ne": RUNNING}}, {"_id": 1})}
+
+
+def _claim(version: int, description: str) -> bool:
+    """
+    Record `version` as running for this runner. False if another runner
+    holds it or has applied it since; a claim older than
+    MIGRATION_CLAIM_TIMEOUT_SECONDS (its runner died) is taken over.
+    """
+    now = datetime.utcnow()
+    try:
+        migrations_collection.insert_one(
+            {"_id": version, "description": description, "status": RUNNING, "started_at": now}
+        )
+        return True
+    except DuplicateKeyError:
+        stale = now - timedelta(seconds=settings.MIGRATION_CLAIM_TIMEOUT_SECONDS)
+        return migrations_collection.find_one_and_update(
+            {"_id": version, "status": RUNNING, "started_at": {"$lt": stale}},
+            {"$set": {"started_at": now}}
+        ) is not None
+
+
+def run_migrations(verbose: bool = False):
+    """
+    Apply every migration that has not been recorded yet, in version order.
+    Returns the list of versions applied by this call; a runner that finds a
+    version claimed by another one stops there and returns what it applied.
+    """
+    done = applied_versions()
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        if not _claim(version, description):
+            # Later versions may build on this one; its runner applies them in order
+            if verbose:
+                print(f"Migration {version} is being applied by another runner")
+            break
+        if verbose:
+            print(f"Applying migration {version}: {description}")
+        try:
+            migrate()
+        except Exception:
+            # Give the claim back so the next run retries it
+            migrations_collection.delete_one({"_id": version, "status": RUNNING})
+            raise
+        migrations_collection.update_one(
+            {"_id": version},
+            {"$set": {"status": "applied", "applied_at": datetime.utcnow()}, "$unset": {"started_at": ""}}
+        )
+        applied.append(version)
+    return applied
+
+
+def migration_status():
+    states = {doc["_id"]: doc.get("status", "applied") for doc in migrations_collection.find({}, {"status": 1})}
+    return [
+        {"version": version, "description": description, "applied": states.get(version) == "applied",
+         "running": states.get(version) == RUNNING}
+        for version, description, _ in MIGRATIONS
+    ]
+
+
+def index_stats():
+    """
+    Usage counters from $indexStats for every collection in the database,
+    so you can confirm the planner is actually hitting the indexes.
+    """
+    stats = []
+    for name in sorted(db.list_collection_names()):
+        if name == migrations_collection.name:
+            continue
+        for row in db[name].aggregate([{"$indexStats": {}}]):
+            stats.append({
+                "collection": name,
+                "index": row["name"],
+                "key": dict(row.get("key", {})),
+                "ops": row.get("accesses", {}).get("ops", 0),
+                "since": row.get("accesses", {}).get("since"),
+            })
+    return stats
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "up"
+    if command == "up":
+        applied = run_migrations(verbose=True)
+        print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+    elif command == "status":
+        for row in migration_status():
+            state = "applied" if row["applied"] else RUNNING if row["running"] else "pending"
+            print(f"{row['version']:>4}  {state:<8} {row['description']}")
+    elif command == "stats":
+        for row in index_stats():
+            print(f"{row['collection']:<20} {row['index']:<40} ops={row['ops']}")
+    else:
+        print(__doc__)
+        sys.exit(1)
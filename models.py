@@ -2,6 +2,30 @@ from typing import Optional
 from pydantic import BaseModel, Field,EmailStr
 from datetime import datetime
 
+
+def name_key(name: str) -> str:
+    """Case/whitespace-insensitive lookup key for category and role names."""
+    return name.strip().lower()
+
+
+# Lowercased copies of the user fields the admin search matches on
+USER_SEARCH_KEYS = {
+    "first_name": "first_name_key",
+    "last_name": "last_name_key",
+    "email_id": "email_key",
+    "role_name": "role_key",
+}
+
+
+def user_search_keys(fields: dict) -> dict:
+    """Search keys for whichever of USER_SEARCH_KEYS appear in `fields`."""
+    return {
+        key_field: name_key(fields[field] or "")
+        for field, key_field in USER_SEARCH_KEYS.items()
+        if field in fields
+    }
+
+
 # Model for adding expenses
 class Expense(BaseModel):
     amount: float
@@ -9,7 +33,8 @@ class Expense(BaseModel):
     date: datetime
     description: str
     # description: Optional[str] = None
-    email_id: EmailStr
+    # Ignored: the owner comes from the bearer token (auth.current_email)
+    email_id: Optional[EmailStr] = None
 
 # Model for categories collection
 class Category(BaseModel):
@@ -23,7 +48,7 @@ class User(BaseModel):
     last_name: str
     email_id: EmailStr
     password: str  # Ideally hashed before storing
-    role_name: str 
+    role_name: Optional[str] = None  # Defaults to auth.DEFAULT_ROLE
 
 # --- Model for roles collection ---
 class Role(BaseModel):
@@ -0,0 +1,74 @@
+"""
+Opaque keyset cursors.
+
+A cursor is the sort key of the last row on a page, JSON-encoded and
+base64'd so clients treat it as a token rather than something to edit.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(date: Optional[datetime], _id: ObjectId) -> str:
+    payload = {"d": date.isoformat() if date else None, "i": str(_id)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        date = datetime.fromisoformat(payload["d"]) if payload.get("d") else None
+        return date, ObjectId(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Filter for rows strictly after `cursor` in (date desc, _id desc) order.
+    """
+    date, _id = decode_cursor(cursor)
+    return {"$or": [
+        {"date": {"$lt": date}},
+        {"date": date, "_id": {"$lt": _id}},
+    ]}
+
+
+def encode_key_cursor(key: str, _id: ObjectId) -> str:
+    payload = {"k": key, "i": str(_id)}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+
+def decode_key_cursor(cursor: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return payload["k"], ObjectId(payload["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def after_key_cursor(field: str, cursor: str) -> Dict[str, Any]:
+    """
+    Filter for rows strictly after `cursor` in (field asc, _id asc) order.
+    """
+    key, _id = decode_key_cursor(cursor)
+    return {"$or": [
+        {field: {"$gt": key}},
+        {field: key, "_id": {"$gt": _id}},
+    ]}
+
+
+def parse_fields(fields: Optional[str], allowed) -> Optional[set]:
+    """
+    Turn a comma-separated `fields` query parameter into a validated set.
+    """
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
@@ -0,0 +1,553 @@
+"""
+Storage backends behind one repository interface.
+
+Routers talk to `repo` (expenses, funds, users, categories, roles) instead
+of importing collections, so STORAGE_BACKEND can swap MongoDB for the
+embedded SQLite engine in sqlite_repository.py. Documents go in and come
+out in the Mongo shape on both ({"_id": ObjectId, "date": datetime, ...}),
+which keeps the serializers and keyset cursors unchanged.
+
+MongoRepository wraps what the routers did before: rollups are kept
+current on every expense write, listings merge in the archive tier, and
+writes can share a transaction. Mongo-only extras (background jobs, the
+archive tier, time-series storage) stay in their own modules; routers
+that need them declare `Depends(mongo_only)` and answer 501 elsewhere.
+"""
+import heapq
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+from database import (
+    client,
+    expenses_collection,
+    funds_collection,
+    users_collection,
+    categories_collection,
+    roles_collection,
+    EXPENSES_TIMESERIES,
+)
+from pagination import decode_cursor, after_cursor, after_key_cursor
+from rollups import apply_rollup, apply_rollups_bulk, move_rollup, monthly_totals, category_totals, summary_facets
+from archive import iter_archived, restore, archived_totals
+import settings
+
+
+class DuplicateError(Exception):
+    """A unique key (user email, category or role name) is already taken."""
+
+
+class RollupError(Exception):
+    """
+    An expense write outside a transaction went through but its rollup
+    update did not. `result` is what the write returned; the stored rows
+    stand and rollups.rebuild_rollups repairs the totals.
+    """
+
+    def __init__(self, result, error: Exception):
+        super().__init__(f"Rollup update failed: {error}")
+        self.result = result
+
+
+# Every funds mutation bumps `version`, so readers can detect concurrent
+# changes and PUT /funds/update can refuse to overwrite a newer document.
+BUMP_VERSION = {"version": 1}
+
+# Only what the admin screens show; never the password hash
+USER_PROJECTION = {"first_name": 1, "middle_name": 1, "last_name": 1, "email_id": 1, "role_name": 1, "email_key": 1}
+
+
+def _newest_first(hot, archived):
+    """Merge hot and archived rows, both already in (date desc, _id desc) order."""
+    return heapq.merge(hot, archived, key=lambda exp: (exp.get("date") or datetime.min, exp["_id"]), reverse=True)
+
+
+NEWEST_FIRST = [("date", -1), ("_id", -1)]
+
+
+def expense_find_plan(
+    email_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    text: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: Optional[set] = None,
+):
+    """
+    (hot query, projection, archive filters) for MongoExpenses.find and its
+    async twin in async_repository.py. The archive filters are keyword
+    arguments for archive.archived_query, or None when the cursor is already
+    past every archived row.
+    """
+    query: Dict[str, Any] = {"email_id": email_id}
+    date_range: Dict[str, Any] = {}
+    if start:
+        date_range["$gte"] = start
+    if end:
+        date_range["$lte"] = end
+    if date_range:
+        query["date"] = date_range
+    if category:
+        # Stored categories are normalized on write, so this is an indexed equality match
+        query["category"] = category
+    amount_range: Dict[str, Any] = {}
+    if min_amount is not None:
+        amount_range["$gte"] = min_amount
+    if max_amount is not None:
+        amount_range["$lte"] = max_amount
+    if amount_range:
+        query["amount"] = amount_range
+    if text:
+        # Escaped substring match, evaluated only on this user's indexed subset
+        query["description"] = {"$regex": re.escape(text), "$options": "i"}
+
+    after = decode_cursor(cursor) if cursor else None
+    archive_filters = None
+    if not (after and after[0] is None):
+        archive_filters = dict(
+            start=start, end=end, category=category,
+            min_amount=min_amount, max_amount=max_amount, text=text, after=after
+        )
+    if cursor:
+        query = {"$and": [query, after_cursor(cursor)]}
+
+    projection = {f: 1 for f in fields | {"date"}} if fields else None
+    return query, projection, archive_filters
+
+
+def _recompute_pipeline(actual_spent: float, now: datetime):
+    """
+    Update pipeline that sets spent (capped at total_funds) and balance from a
+    recomputed expense sum, reading total_funds from the document itself.
+    """
+    return [
+        {"$set": {"spent": {"$min": [actual_spent, {"$ifNull": ["$total_funds", 0]}]}}},
+        {"$set": {
+            "balance": {"$subtract": [{"$ifNull": ["$total_funds", 0]}, "$spent"]},
+            "updated_at": now,
+            "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+        }}
+    ]
+
+
+# =========================
+# MONGODB
+# =========================
+class MongoExpenses:
+    def insert(self, doc: dict, session=None) -> dict:
+        """Insert one expense (sets doc["_id"]) and add it to its rollup."""
+        expenses_collection.insert_one(doc, session=session)
+        try:
+            apply_rollup(doc["email_id"], doc["date"], doc["category"], doc["amount"], session=session)
+        except Exception as e:
+            if session is not None:
+                raise  # aborts the transaction, the insert with it
+            raise RollupError(doc, e) from e
+        return doc
+
+    def insert_many(self, email_id: str, docs: list):
+        """
+        Insert a batch without stopping at the first bad row. Returns the
+        inserted docs and a list of (position in `docs`, error message).
+        """
+        failed = {}
+        try:
+            expenses_collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                failed[write_error["index"]] = write_error.get("errmsg")
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+        try:
+            apply_rollups_bulk(email_id, inserted)
+        except Exception as e:
+            raise RollupError((inserted, sorted(failed.items())), e) from e
+        return inserted, sorted(failed.items())
+
+    def get(self, email_id: str, expense_id: ObjectId) -> Optional[dict]:
+        """One of the user's expenses; archived ones move back to the hot tier first."""
+        return (
+            expenses_collection.find_one({"_id": expense_id, "email_id": email_id})
+            or restore(email_id, expense_id)
+        )
+
+    def update(self, old: dict, changes: dict, session=None) -> bool:
+        """
+        Apply `changes`, guarded on the values the ledger/rollup deltas are
+        based on. False means the expense changed underneath us.
+        """
+        expense_filter = {
+            "_id": old["_id"],
+            "email_id": old["email_id"],
+            "amount": old.get("amount"),
+            "category": old.get("category"),
+            "date": old.get("date")
+        }
+        result = expenses_collection.update_one(expense_filter, {"$set": changes}, session=session)
+        if result.matched_count == 0:
+            return False
+        if old.get("date"):
+            try:
+                move_rollup(
+                    old["email_id"],
+                    old,
+                    {
+                        "amount": changes.get("amount", old["amount"]),
+                        "category": changes.get("category", old["category"]),
+                        "date": changes.get("date", old["date"])
+                    },
+                    session
+                )
+            except Exception as e:
+                if session is not None:
+                    raise
+                raise RollupError(True, e) from e
+        return True
+
+    def delete(self, email_id: str, expense_id: ObjectId, session=None) -> Optional[dict]:
+        """Delete one expense and drop it from its rollup; returns the deleted doc."""
+        expense_filter = {"_id": expense_id, "email_id": email_id}
+        if EXPENSES_TIMESERIES:
+            # Time-series collections have no findAndModify: read, then delete
+            deleted = expenses_collection.find_one(expense_filter)
+            if deleted and not expenses_collection.delete_one(expense_filter).deleted_count:
+                deleted = None
+        else:
+            deleted = expenses_collection.find_one_and_delete(expense_filter, session=session)
+        if deleted and deleted.get("date"):
+            try:
+                apply_rollup(
+                    deleted["email_id"], deleted["date"], deleted.get("category"),
+                    -deleted.get("amount", 0), -1, session
+                )
+            except Exception as e:
+                if session is not None:
+                    raise
+                raise RollupError(deleted, e) from e
+        return deleted
+
+    def find(
+        self,
+        email_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        text: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[set] = None,
+        batch_size: int = 500,
+    ) -> Iterable[dict]:
+        """
+        The user's expenses matching the filters, newest first by (date, _id),
+        hot and archived rows merged into one stream. `cursor` is a
+        next_cursor from pagination.encode_cursor; `fields` narrows the
+        projection of hot rows (date is always fetched, it is half of the
+        keyset). Close the returned generator to release the cursor early.
+        """
+        query, projection, archive_filters = expense_find_plan(
+            email_id, start, end, category, min_amount, max_amount, text, cursor, fields
+        )
+        # Past every dated row when None; archived rows always have a date
+        archived = iter_archived(email_id, **archive_filters) if archive_filters is not None else iter(())
+
+        # Newest first; served by the (email_id, date) index
+        hot = expenses_collection.find(query, projection).sort(NEWEST_FIRST).batch_size(batch_size)
+        if limit:
+            hot = hot.limit(limit)
+
+        def rows():
+            # Rows go straight from the PyMongo cursor (and archive buckets) to the caller
+            with hot:
+                merged = _newest_first(hot, archived)
+                yield from (islice(merged, limit) if limit else merged)
+
+        return rows()
+
+    def monthly_totals(self, email_id: str):
+        # Pre-summed (month, category) rollups; see rollups.py
+        return monthly_totals(email_id)
+
+    def category_totals(self, email_id: str, limit: Optional[int] = None):
+        return category_totals(email_id, limit)
+
+    def summary(self, email_id: str) -> dict:
+        """Monthly and per-category totals; one $facet over the rollups."""
+        return summary_facets(email_id)
+
+    def spent_by_user(self, email_id: Optional[str] = None) -> Dict[str, float]:
+        """Sum of every expense (hot and archived) per user."""
+        match = {"email_id": email_id} if email_id else {}
+        spent = {
+            row["_id"]: row["total_spent"]
+            for row in expenses_collection.aggregate([
+                {"$match": match},
+                {"$group": {"_id": "$email_id", "total_spent": {"$sum": "$amount"}}}
+            ])
+        }
+        # Archived expenses still count towards spent
+        for owner, total in archived_totals(email_id).items():
+            spent[owner] = spent.get(owner, 0) + total
+        return spent
+
+
+class MongoFunds:
+    def get(self, email_id: str, session=None) -> Optional[dict]:
+        return funds_collection.find_one({"email_id": email_id}, session=session)
+
+    def find(self, email_id: Optional[str] = None):
+        return funds_collection.find(
+            {"email_id": email_id} if email_id else {},
+            {"email_id": 1, "total_funds": 1, "spent": 1, "balance": 1}
+        )
+
+    def ensure(self, email_id: str):
+        """Create an empty funds record if the user has none yet."""
+        now = datetime.utcnow()
+        funds_collection.update_one(
+            {"email_id": email_id},
+            {"$setOnInsert": {"total_funds": 0, "spent": 0, "balance": 0, "created_at": now, "updated_at": now}},
+            upsert=True
+        )
+
+    def allocate(self, email_id: str, amount: float):
+        now = datetime.utcnow()
+        # Single atomic upsert: concurrent allocations add up instead of overwriting
+        funds_collection.update_one(
+            {"email_id": email_id},
+            {
+                "$inc": {"total_funds": amount, "balance": amount, **BUMP_VERSION},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"spent": 0, "created_at": now}
+            },
+            upsert=True
+        )
+
+    def adjust_spent(self, email_id: str, delta: float, session=None) -> Optional[dict]:
+        """
+        Apply an expense delta to the running ledger with a single atomic $inc.
+        Positive deltas only match while the balance can cover them; negative
+        deltas (refunds) only match while spent is large enough to give back.
+        Returns the updated funds document, or None if the guard rejected it.
+        """
+        query: Dict[str, Any] = {"email_id": email_id}
+        if delta > 0:
+            query["balance"] = {"$gte": delta}
+        elif delta < 0:
+            query["spent"] = {"$gte": -delta}
+
+        return funds_collection.find_one_and_update(
+            query,
+            {
+                "$inc": {"spent": delta, "balance": -delta, **BUMP_VERSION},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    def set_total(self, email_id: str, total_funds: float, expected_version: Optional[int] = None) -> bool:
+        """
+        Set total_funds and derive balance from the stored spent in the same
+        write. Never below spent, and with `expected_version` only while the
+        document is still at that version. False if nothing matched.
+        """
+        conditions = [{"$lte": [{"$ifNull": ["$spent", 0]}, total_funds]}]
+        if expected_version is not None:
+            # Optimistic concurrency: refuse to overwrite a newer document
+            conditions.append({"$eq": [{"$ifNull": ["$version", 0]}, expected_version]})
+        result = funds_collection.update_one(
+            {"email_id": email_id, "$expr": {"$and": conditions}},
+            [{"$set": {
+                "total_funds": total_funds,
+                "balance": {"$subtract": [total_funds, {"$ifNull": ["$spent", 0]}]},
+                "updated_at": datetime.utcnow(),
+                "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]}
+            }}]
+        )
+        return result.matched_count > 0
+
+    def reset(self, email_id: str) -> bool:
+        result = funds_collection.update_one(
+            {"email_id": email_id},
+            {
+                "$set": {"total_funds": 0, "spent": 0, "balance": 0, "updated_at": datetime.utcnow()},
+                "$inc": BUMP_VERSION
+            }
+        )
+        return result.matched_count > 0
+
+    def set_allocations(self, email_id: str, allocations: list):
+        funds_collection.update_one(
+            {"email_id": email_id},
+            {
+                "$set": {"category_allocations": allocations, "updated_at": datetime.utcnow()},
+                "$inc": BUMP_VERSION
+            }
+        )
+
+    def recompute(self, email_id: str, actual_spent: float) -> Optional[dict]:
+        """
+        Rewrite spent (capped at total_funds) and balance from a recomputed
+        expense sum; total_funds is read in the same write so a concurrent
+        allocation is not overwritten.
+        """
+        return funds_collection.find_one_and_update(
+            {"email_id": email_id},
+            _recompute_pipeline(actual_spent, datetime.utcnow()),
+            return_document=ReturnDocument.AFTER
+        )
+
+
+class MongoUsers:
+    def get(self, user_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return users_collection.find_one({"_id": user_id}, projection)
+
+    def get_by_email(self, email_id: str) -> Optional[dict]:
+        return users_collection.find_one({"email_id": email_id})
+
+    def insert(self, doc: dict) -> ObjectId:
+        try:
+            return users_collection.insert_one(doc).inserted_id
+        except DuplicateKeyError:
+            raise DuplicateError(doc.get("email_id"))
+
+    def update(self, user_id: ObjectId, fields: dict, bump_token_version: bool = False) -> bool:
+        """$set `fields`; a password change also retires outstanding refresh tokens."""
+        update: Dict[str, Any] = {"$set": fields}
+        if bump_token_version:
+            update["$inc"] = {"token_version": 1}
+        return users_collection.update_one({"_id": user_id}, update).matched_count > 0
+
+    def delete(self, user_id: ObjectId) -> Optional[dict]:
+        return users_collection.find_one_and_delete({"_id": user_id}, {"email_id": 1})
+
+    def search(self, prefix: Optional[str] = None, role_key: Optional[str] = None,
+               cursor: Optional[str] = None, limit: int = 25) -> list:
+        """
+        Users ordered by (email_key, _id), filtered by a lowercased prefix of
+        first name, last name or email and by role. No password in the output.
+        """
+        query: Dict[str, Any] = {}
+        if prefix:
+            # Anchored regex on the lowercased keys: each branch is an index range scan
+            pattern = {"$regex": "^" + re.escape(prefix)}
+            query["$or"] = [{"first_name_key": pattern}, {"last_name_key": pattern}, {"email_key": pattern}]
+        if role_key:
+            query["role_key"] = role_key
+        if cursor:
+            query = {"$and": [query, after_key_cursor("email_key", cursor)]}
+        return list(
+            users_collection.find(query, USER_PROJECTION)
+            .sort([("email_key", 1), ("_id", 1)])
+            .limit(limit)
+        )
+
+
+class MongoCategories:
+    def all(self) -> list:
+        return list(categories_collection.find())
+
+    def get(self, category_id: ObjectId) -> Optional[dict]:
+        return categories_collection.find_one({"_id": category_id})
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        return categories_collection.find_one({"name_key": key})
+
+    def insert(self, doc: dict) -> ObjectId:
+        # The unique index catches a concurrent duplicate
+        try:
+            return categories_collection.insert_one(doc).inserted_id
+        except DuplicateKeyError:
+            raise DuplicateError(doc.get("name"))
+
+    def update(self, category_id: ObjectId, fields: dict) -> Optional[dict]:
+        """$set `fields`; returns the category as it was before."""
+        try:
+            return categories_collection.find_one_and_update({"_id": category_id}, {"$set": fields}, {"name": 1})
+        except DuplicateKeyError:
+            raise DuplicateError(fields.get("name"))
+
+    def delete(self, category_id: ObjectId) -> Optional[dict]:
+        return categories_collection.find_one_and_delete({"_id": category_id}, {"name": 1})
+
+
+class MongoRoles:
+    def all(self) -> list:
+        return list(roles_collection.find())
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        return roles_collection.find_one({"role_key": key})
+
+    def insert(self, doc: dict) -> ObjectId:
+        try:
+            return roles_collection.insert_one(doc).inserted_id
+        except DuplicateKeyError:
+            raise DuplicateError(doc.get("role_name"))
+
+
+class MongoRepository:
+    name = "mongo"
+    # Cascades (user purge, category remap) run as tracked jobs (jobs.py)
+    background_jobs = True
+
+    def __init__(self):
+        self.expenses = MongoExpenses()
+        self.funds = MongoFunds()
+        self.users = MongoUsers()
+        self.categories = MongoCategories()
+        self.roles = MongoRoles()
+
+    def setup(self):
+        """Create/upgrade collections and indexes before serving traffic."""
+        from migrations import run_migrations
+        from timeseries import ensure_timeseries_collection
+
+        if settings.EXPENSES_STORAGE == "timeseries":
+            # Must exist before the first insert, or Mongo creates a plain collection
+            ensure_timeseries_collection()
+        if settings.RUN_MIGRATIONS_ON_STARTUP:
+            run_migrations()
+
+    def run_in_transaction(self, callback):
+        """
+        Run callback(session) inside a multi-document transaction when
+        USE_TRANSACTIONS is on (needs a replica set), else callback(None).
+        The ledger guards keep each funds document consistent either way; the
+        transaction additionally makes the expense write and ledger write
+        commit or roll back together.
+        """
+        if not settings.USE_TRANSACTIONS:
+            return callback(None)
+        with client.start_session() as session:
+            return session.with_transaction(
+                callback,
+                read_concern=ReadConcern("snapshot"),
+                write_concern=WriteConcern("majority")
+            )
+
+
+def _make_repository():
+    if settings.STORAGE_BACKEND == "sqlite":
+        from sqlite_repository import SQLiteRepository
+        return SQLiteRepository(settings.SQLITE_PATH)
+    return MongoRepository()
+
+
+repo = _make_repository()
+
+
+def mongo_only():
+    """Route dependency for features that only exist on the Mongo backend."""
+    if repo.name != "mongo":
+        raise HTTPException(status_code=501, detail=f"Not available with the {repo.name} storage backend")
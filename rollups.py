@@ -0,0 +1,195 @@
+"""
+Materialized per-user spending rollups.
+
+One document per (email_id, month, category) holds the running total and
+count for that bucket. Expense writes keep them current with $inc, and the
+/summary endpoints read a handful of these instead of re-aggregating every
+expense.
+
+    python rollups.py rebuild [email_id]   # regenerate from raw expenses
+"""
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+from pymongo import UpdateOne
+from database import expenses_collection, rollups_collection, archive_collection
+
+
+def month_key(date: datetime) -> str:
+    return date.strftime("%Y-%m")
+
+
+def apply_rollup(email_id: str, date: datetime, category: str, amount: float, count: int = 1, session=None):
+    """
+    Add (or, with negative amount/count, remove) expenses from a bucket.
+    """
+    key = {"email_id": email_id, "month": month_key(date), "category": category}
+    rollups_collection.update_one(key, {"$inc": {"total": amount, "count": count}}, upsert=True, session=session)
+    if count < 0:
+        # Drop buckets that no longer hold any expense
+        rollups_collection.delete_one({**key, "count": {"$lte": 0}}, session=session)
+
+
+def apply_rollups_bulk(email_id: str, expenses: Iterable[dict], session=None):
+    """
+    Fold many new expenses into their buckets with one bulk_write.
+    """
+    buckets = defaultdict(lambda: [0.0, 0])
+    for exp in expenses:
+        bucket = buckets[(month_key(exp["date"]), exp["category"])]
+        bucket[0] += exp["amount"]
+        bucket[1] += 1
+    if not buckets:
+        return
+    rollups_collection.bulk_write([
+        UpdateOne(
+            {"email_id": email_id, "month": month, "category": category},
+            {"$inc": {"total": total, "count": count}},
+            upsert=True
+        )
+        for (month, category), (total, count) in buckets.items()
+    ], ordered=False, session=session)
+
+
+def move_rollup(email_id: str, old: dict, new: dict, session=None):
+    """
+    Re-bucket an updated expense. `old`/`new` carry amount, category and date.
+    """
+    if (old["amount"], old["category"], month_key(old["date"])) == (
+        new["amount"], new["category"], month_key(new["date"])
+    ):
+        return
+    apply_rollup(email_id, old["date"], old["category"], -old["amount"], -1, session)
+    apply_rollup(email_id, new["date"], new["category"], new["amount"], 1, session)
+
+
+def rebuild_rollups(email_id: Optional[str] = None):
+    """
+    Regenerate rollups from raw expenses with a single $group + $merge,
+    then add the archived rows (archive.py) on top with a second one.
+    """
+    match = {"email_id": email_id.strip().lower()} if email_id else {}
+    rollups_collection.delete_many(match)
+    expenses_collection.aggregate([
+        {"$match": {**match, "date": {"$type": "date"}}},
+        {"$group": {
+            "_id": {
+                "email_id": "$email_id",
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$date"}},
+                "category": "$category"
+            },
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "email_id": "$_id.email_id",
+            "month": "$_id.month",
+            "category": "$_id.category",
+            "total": 1,
+            "count": 1
+        }},
+        {"$merge": {
+            "into": rollups_collection.name,
+            "on": ["email_id", "month", "category"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ])
+    archive_collection.aggregate([
+        {"$match": match},
+        {"$unwind": "$rows"},
+        {"$group": {
+            "_id": {"email_id": "$email_id", "month": "$month", "category": "$rows.c"},
+            "total": {"$sum": "$rows.a"},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "email_id": "$_id.email_id",
+            "month": "$_id.month",
+            "category": "$_id.category",
+            "total": 1,
+            "count": 1
+        }},
+        {"$merge": {
+            "into": rollups_collection.name,
+            "on": ["email_id", "month", "category"],
+            # A month can have both hot and archived rows
+            "whenMatched": [{"$set": {
+                "total": {"$add": ["$total", "$$new.total"]},
+                "count": {"$add": ["$count", "$$new.count"]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ])
+    return rollups_collection.count_documents(match)
+
+
+# =========================
+# READERS
+# =========================
+# Pipelines and row shapes are shared with the async reads (async_repository.py)
+MONTHLY_GROUP = [
+    {"$group": {"_id": "$month", "total": {"$sum": "$total"}}},
+    {"$sort": {"_id": -1}}
+]
+CATEGORY_GROUP = [
+    {"$group": {"_id": "$category", "total": {"$sum": "$total"}}},
+    {"$sort": {"total": -1}}
+]
+
+
+def monthly_pipeline(email_id: str) -> list:
+    return [{"$match": {"email_id": email_id}}, *MONTHLY_GROUP]
+
+
+def category_pipeline(email_id: str, limit: Optional[int] = None) -> list:
+    pipeline = [{"$match": {"email_id": email_id}}, *CATEGORY_GROUP]
+    if limit:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+def facets_pipeline(email_id: str) -> list:
+    return [
+        {"$match": {"email_id": email_id}},
+        {"$facet": {"monthly": MONTHLY_GROUP, "by_category": CATEGORY_GROUP}}
+    ]
+
+
+def monthly_rows(rows) -> list:
+    return [{"month": row["_id"], "total_expense": row["total"]} for row in rows]
+
+
+def category_rows(rows) -> list:
+    return [{"category": row["_id"], "total": row["total"]} for row in rows]
+
+
+def facet_rows(result: Optional[dict]) -> dict:
+    result = result or {"monthly": [], "by_category": []}
+    return {"monthly": monthly_rows(result["monthly"]), "by_category": category_rows(result["by_category"])}
+
+
+def monthly_totals(email_id: str):
+    return monthly_rows(rollups_collection.aggregate(monthly_pipeline(email_id)))
+
+
+def category_totals(email_id: str, limit: Optional[int] = None):
+    return category_rows(rollups_collection.aggregate(category_pipeline(email_id, limit)))
+
+
+def summary_facets(email_id: str) -> dict:
+    """
+    Monthly and per-category totals from a single $facet pass over the rollups.
+    """
+    return facet_rows(next(rollups_collection.aggregate(facets_pipeline(email_id)), None))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(1)
+    count = rebuild_rollups(sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"Rebuilt {count} rollup document(s).")
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
+from datetime import datetime
+from auth import current_email
+import analytics
+import traceback
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+def _frame(email_id: str):
+    if not analytics.available():
+        raise HTTPException(status_code=503, detail="Analytics engine requires numpy")
+    return analytics.get_frame(email_id)
+
+
+def _parse_date(value: Optional[str], field: str) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field} date. Use YYYY-MM-DD")
+
+
+@router.get("/by-month")
+def by_month(email_id: str = Depends(current_email)):
+    try:
+        return {"monthly_summary": _frame(email_id).by_month()}
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/by-category")
+def by_category(email_id: str = Depends(current_email), top: Optional[int] = Query(None, ge=1)):
+    try:
+        return {"categories": _frame(email_id).by_category(top)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/range-total")
+def range_total(email_id: str = Depends(current_email), start: str = Query(...), end: str = Query(...)):
+    try:
+        start_date, end_date = _parse_date(start, "start"), _parse_date(end, "end")
+        # Whole end day is included
+        end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999000)
+        return {"start": start, "end": end, "total": _frame(email_id).range_total(start_date, end_date)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/rolling")
+def rolling(
+    email_id: str = Depends(current_email),
+    window: int = Query(7, ge=1, le=366, description="Window length in days"),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+):
+    try:
+        frame = _frame(email_id)
+        return {
+            "window_days": window,
+            "rolling": frame.rolling(window, _parse_date(start, "start"), _parse_date(end, "end"))
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,44 +1,71 @@
-from fastapi import APIRouter, HTTPException
-from models import Category
-from database import categories_collection
+from fastapi import APIRouter, HTTPException, Request, Query, BackgroundTasks, Depends
+from models import Category, name_key
+from repository import repo, DuplicateError
 from serializers import category_serializer
+from cache import cached_json, invalidate, invalidate_user
+from jobs import create_job, run_job, remap_category, FALLBACK_CATEGORY
+from auth import require_admin
 from bson import ObjectId
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
 
+
+def _remap(background_tasks: BackgroundTasks, kind: str, params: dict, old_name: str, new_name: Optional[str]) -> Optional[str]:
+    """
+    Move expenses (and allocations) from `old_name` to `new_name`, or to
+    the fallback category when None. A tracked background job on Mongo;
+    a single UPDATE on the embedded backend, done before returning.
+    """
+    if not repo.background_jobs:
+        for email_id in repo.remap_category(old_name, new_name, FALLBACK_CATEGORY):
+            invalidate_user(email_id)
+        invalidate("categories")
+        return None
+    job_id = create_job(kind, params)
+    background_tasks.add_task(run_job, job_id, remap_category, old_name, new_name)
+    return job_id
+
+
 # POST REQUEST TO ADD CATEGORY:IF CATEGORY ALREADY EXISTS,BLOCK THAT REQUEST
-@router.post("/categories/")
+@router.post("/categories/", dependencies=[Depends(require_admin)])
 def add_category(category: Category):
     category_dict = category.dict()
 
     # Capitalize category name (first letter uppercase, rest lowercase)
     category_dict["name"] = category_dict["name"].strip().capitalize()
 
-    # Duplicate check
-    existing_category = categories_collection.find_one(
-        {"name": {"$regex": f"^{category_dict['name']}$", "$options": "i"}}
-    )
+    # Duplicate check: indexed equality on the normalized key
+    category_dict["name_key"] = name_key(category_dict["name"])
+    existing_category = repo.categories.get_by_key(category_dict["name_key"])
     if existing_category:
         raise HTTPException(status_code=400, detail=f"Category '{category_dict['name']}' already exists.")
 
-    # Insert new category
-    result = categories_collection.insert_one(category_dict)
+    # Insert new category (the unique index catches a concurrent duplicate)
+    try:
+        category_id = repo.categories.insert(category_dict)
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail=f"Category '{category_dict['name']}' already exists.")
+    invalidate("categories")
+    invalidate("dashboard")
+    invalidate("funds_categories")
 
     # Return clean JSON-safe response
     return {
-        "id": str(result.inserted_id),
+        "id": str(category_id),
         "name": category_dict["name"]
     }
 
 @router.get("/categories/", response_model=List[Category])
-def get_all_categories():
-    categories = list(categories_collection.find())
-    return [category_serializer(cat) for cat in categories]
+def get_all_categories(request: Request):
+    return cached_json(
+        request, "categories", "all",
+        lambda: [category_serializer(cat) for cat in repo.categories.all()]
+    )
 
 # UPDATE CATEGORY
-@router.put("/categories/{category_id}")
-def update_category(category_id: str, updated_data: dict):
+@router.put("/categories/{category_id}", dependencies=[Depends(require_admin)])
+def update_category(category_id: str, updated_data: dict, background_tasks: BackgroundTasks):
     if not ObjectId.is_valid(category_id):
         raise HTTPException(status_code=400, detail="Invalid category ID")
 
@@ -49,32 +76,68 @@ def update_category(category_id: str, updated_data: dict):
         new_name = updated_data["name"].strip().capitalize()
 
         # Duplicate check (case-insensitive, exclude current category)
-        existing_category = categories_collection.find_one(
-            {
-                "name": {"$regex": f"^{new_name}$", "$options": "i"},
-                "_id": {"$ne": ObjectId(category_id)}
-            }
-        )
-        if existing_category:
+        existing_category = repo.categories.get_by_key(name_key(new_name))
+        if existing_category and existing_category["_id"] != ObjectId(category_id):
             raise HTTPException(status_code=400, detail=f"Category '{new_name}' already exists.")
 
         update_fields["name"] = new_name
+        update_fields["name_key"] = name_key(new_name)
 
     if not update_fields:
         raise HTTPException(status_code=400, detail="No valid fields provided for update")
 
-    result = categories_collection.update_one({"_id": ObjectId(category_id)}, {"$set": update_fields})
+    try:
+        old_category = repo.categories.update(ObjectId(category_id), update_fields)
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail=f"Category '{update_fields['name']}' already exists.")
 
-    if result.matched_count == 0:
+    if not old_category:
         raise HTTPException(status_code=404, detail="Category not found")
 
-    return {"message": "Category updated successfully", "updated_fields": list(update_fields.keys())}
+    invalidate("categories")
+    invalidate("dashboard")
+    invalidate("funds_categories")
+    response = {"message": "Category updated successfully", "updated_fields": list(update_fields.keys())}
+
+    # Existing expenses follow the rename; remapped in batches after the response
+    if old_category.get("name") != update_fields["name"]:
+        response["job_id"] = _remap(
+            background_tasks, "rename_category",
+            {"old_name": old_category.get("name"), "new_name": update_fields["name"]},
+            old_category.get("name"), update_fields["name"]
+        )
+    return response
+
+
+# Expenses filed under the deleted category move to `reassign_to`
+# (or "Uncategorized") in a background job
+@router.delete("/categories/{category_id}", status_code=202, dependencies=[Depends(require_admin)])
+def delete_category(
+    category_id: str,
+    background_tasks: BackgroundTasks,
+    reassign_to: Optional[str] = Query(None, description=f"Existing category for its expenses (default {FALLBACK_CATEGORY})"),
+):
+    if not ObjectId.is_valid(category_id):
+        raise HTTPException(status_code=400, detail="Invalid category ID")
 
+    target = None
+    if reassign_to:
+        target_category = repo.categories.get_by_key(name_key(reassign_to))
+        if not target_category or target_category["_id"] == ObjectId(category_id):
+            raise HTTPException(status_code=400, detail=f"Category '{reassign_to}' does not exist")
+        target = target_category["name"]
 
-@router.delete("/categories/{category_id}")
-def delete_category(category_id: str):
-    result = categories_collection.delete_one({"_id": ObjectId(category_id)})
-    if result.deleted_count == 0:
+    category = repo.categories.delete(ObjectId(category_id))
+    if not category:
         raise HTTPException(status_code=404, detail="Category not found")
-    return {"message": "Category deleted"}
+    invalidate("categories")
+    invalidate("dashboard")
+    invalidate("funds_categories")
+
+    job_id = _remap(
+        background_tasks, "delete_category",
+        {"name": category.get("name"), "reassign_to": target or FALLBACK_CATEGORY},
+        category.get("name"), target
+    )
+    return {"message": "Category deleted", "job_id": job_id}
 
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Depends
+from repository import repo
+from serializers import expense_serializer, fund_serializer, category_serializer
+from pagination import parse_fields
+from cache import cached_json
+from auth import current_email
+from router.funds import category_funds_overview
+import traceback
+
+router = APIRouter(tags=["Dashboard"])
+
+DASHBOARD_SECTIONS = ("funds", "recent_expenses", "monthly_summary", "top_categories", "by_category", "categories", "category_funds")
+
+
+# Everything the user dashboard shows, in one round trip
+@router.get("/dashboard")
+def get_dashboard(
+    request: Request,
+    email_id: str = Depends(current_email),
+    include: str = Query(",".join(DASHBOARD_SECTIONS), description="Comma-separated sections to return"),
+    recent_limit: int = Query(10, ge=1, le=100),
+):
+    try:
+        sections = parse_fields(include, DASHBOARD_SECTIONS) or set(DASHBOARD_SECTIONS)
+
+        def build():
+            data = {}
+            if "funds" in sections:
+                fund_doc = repo.funds.get(email_id)
+                data["funds"] = fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
+
+            if "recent_expenses" in sections:
+                recent = repo.expenses.find(email_id, limit=recent_limit)
+                data["recent_expenses"] = [expense_serializer(exp) for exp in recent]
+
+            # Monthly, top and per-category totals share one summary pass
+            # ($facet over the rollups on Mongo)
+            if sections & {"monthly_summary", "top_categories", "by_category"}:
+                facets = repo.expenses.summary(email_id)
+                if "monthly_summary" in sections:
+                    data["monthly_summary"] = facets["monthly"]
+                if "top_categories" in sections:
+                    data["top_categories"] = facets["by_category"][:3]
+                if "by_category" in sections:
+                    data["by_category"] = facets["by_category"]
+
+            if "category_funds" in sections:
+                data["category_funds"] = category_funds_overview(email_id)
+
+            if "categories" in sections:
+                data["categories"] = [category_serializer(cat) for cat in repo.categories.all()]
+            return data
+
+        return cached_json(request, "dashboard", email_id, build)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error building dashboard: {str(e)}")
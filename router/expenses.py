@@ -1,19 +1,46 @@
-from fastapi import APIRouter, HTTPException, Query, Body
+from fastapi import APIRouter, HTTPException, Query, Body, Request, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from models import Expense
-from database import expenses_collection,funds_collection
-from serializers import expense_serializer,fund_serializer
-from router.funds import update_user_funds
+from repository import repo, RollupError
+from async_repository import arepo
+from serializers import expense_serializer,fund_serializer,EXPENSE_FIELDS
+from pagination import encode_cursor, parse_fields
+from cache import cached_json_async, invalidate_user
+from auth import current_email
+from exporters import EXPORTERS, MEDIA_TYPES
+from pydantic import ValidationError
+from router.funds import reserve_funds, release_funds, run_in_transaction
 from bson.son import SON
 from bson import ObjectId
-from typing import Optional, Any, Dict,cast
+from typing import Optional, Any, Dict, Literal,cast
 from datetime import datetime
+import csv
+import io
+import json
 import traceback
+import settings
 
 router = APIRouter()
 
-# Add Expense (email_id required as query parameter)
+
+def _rollup_failed(email_id: str, saved: str, error: RollupError) -> HTTPException:
+    """
+    The expense write stood but its rollup update did not: the ledger
+    already matches the stored rows, so leave it alone, drop the cached
+    summaries and report the failure (rollups.rebuild_rollups repairs it).
+    """
+    traceback.print_exception(type(error), error, error.__traceback__)
+    invalidate_user(email_id)
+    return HTTPException(
+        status_code=500,
+        detail=f"{saved}, but the summaries could not be updated: {error}"
+    )
+
+
+# Add Expense (owner taken from the bearer token)
 @router.post("/expenses/")
-def add_expense(expense: Expense, email_id: str = Query(..., description="Email ID of logged-in user")):
+def add_expense(expense: Expense, email_id: str = Depends(current_email)):
     try:
         expense_dict = expense.dict()
         # Validate amount
@@ -25,7 +52,7 @@ def add_expense(expense: Expense, email_id: str = Query(..., description="Email
             raise HTTPException(status_code=400, detail="Amount must be a valid number")
 
         # Override email_id in expense with the logged-in user's email_id for security
-        expense_dict["email_id"] = email_id.strip().lower()
+        expense_dict["email_id"] = email_id
 
         # Normalize category
         expense_dict["category"] = expense_dict["category"].strip().capitalize()
@@ -36,130 +63,319 @@ def add_expense(expense: Expense, email_id: str = Query(..., description="Email
         expense_dict["created_at"] = datetime.utcnow()
         expense_dict["updated_at"] = datetime.utcnow()
 
-        # Check funds
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        if not fund_doc or fund_doc.get("total_funds", 0) == 0:
-            raise HTTPException(status_code=400, detail="User has no allocated funds yet")
-        total_funds = fund_doc.get("total_funds", 0)
-
-        # Calculate total spent dynamically from MongoDB
-        pipeline = [
-            {"$match": {"email_id": email_id.strip().lower()}},
-            {"$group": {"_id": None, "total_spent": {"$sum": "$amount"}}}
-        ]
-        result = list(expenses_collection.aggregate(pipeline))
-        current_spent = result[0]["total_spent"] if result else 0
-
-        available_balance = total_funds - current_spent
-        if expense_amount > available_balance:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Insufficient funds. Available balance: {available_balance}"
-            )
-        # current_balance = fund_doc.get("balance", 0)
-        # if expense_dict["amount"] > current_balance:
-        #     raise HTTPException(
-        #         status_code=400,
-        #         detail=f"Insufficient funds. Available balance: {current_balance}"
-        #     )
-        # Insert into MongoDB
-       
-        result = expenses_collection.insert_one(expense_dict)
-
-
-        # 🔥 update funds after expense
-        update_user_funds(email_id)
-
-        return {"message": "Expense added", "id": str(result.inserted_id)}
+        email_id = expense_dict["email_id"]
+
+        def write(session):
+            # Reserve funds first: one guarded $inc instead of re-summing every expense
+            reserve_funds(email_id, expense_amount, session)
+            try:
+                return repo.expenses.insert(expense_dict, session)
+            except RollupError:
+                raise  # the expense is stored; keep the reservation
+            except Exception:
+                if session is None:
+                    # No transaction to roll back: give the reservation back by hand
+                    release_funds(email_id, expense_amount)
+                raise
+
+        inserted = run_in_transaction(write)
+        invalidate_user(email_id)
+
+        return {"message": "Expense added", "id": str(inserted["_id"])}
 
     except HTTPException:
         raise
-        
+
+    except RollupError as e:
+        raise _rollup_failed(email_id, f"Expense {e.result['_id']} was added", e)
+
     except Exception as e:
         print("Error adding expense:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error adding expense: {str(e)}")
 
 
-# Get Expenses (email_id required as query parameter)
+def _parse_bulk_rows(content_type: str, body: bytes):
+    """
+    Decode a JSON array, NDJSON or CSV upload into a list of row dicts.
+    """
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type:
+        return list(csv.DictReader(io.StringIO(text)))
+    if "ndjson" in content_type or "jsonl" in content_type:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    rows = json.loads(text)
+    if not isinstance(rows, list):
+        raise ValueError("Expected a JSON array of expenses")
+    return rows
+
+
+# Bulk import (JSON array, NDJSON or CSV body)
+@router.post("/expenses/bulk")
+async def add_expenses_bulk(request: Request, email_id: str = Depends(current_email)):
+    body = await request.body()
+    try:
+        rows = _parse_bulk_rows(request.headers.get("content-type", ""), body)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse upload: {e}")
+    if len(rows) > settings.BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} rows per upload")
+    # Mongo work is blocking; keep it off the event loop
+    return await run_in_threadpool(_import_expenses, rows, email_id)
+
+
+def _import_expenses(rows, email_id: str):
+    try:
+        errors = []
+        docs = []
+        now = datetime.utcnow()
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors.append({"row": index, "error": "Row must be an object"})
+                continue
+            try:
+                # Same validation as POST /expenses/; owner always comes from the token
+                expense = Expense(**{**row, "email_id": email_id})
+            except ValidationError as e:
+                errors.append({
+                    "row": index,
+                    "error": "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                })
+                continue
+            if expense.amount <= 0:
+                errors.append({"row": index, "error": "Amount must be a positive number"})
+                continue
+            doc = expense.dict()
+            doc["email_id"] = email_id
+            doc["category"] = doc["category"].strip().capitalize()
+            doc["created_at"] = now
+            doc["updated_at"] = now
+            docs.append((index, doc))
+
+        if not docs:
+            return {"message": "No valid rows to import", "inserted": 0, "ids": [], "errors": errors}
+
+        # One balance check and one ledger write for the whole batch
+        batch_total = sum(doc["amount"] for _, doc in docs)
+        reserve_funds(email_id, batch_total)
+
+        rollup_error = None
+        try:
+            inserted, failed = repo.expenses.insert_many(email_id, [doc for _, doc in docs])
+        except RollupError as e:
+            # The rows are stored: settle the ledger as usual, then report it
+            (inserted, failed), rollup_error = e.result, e
+        except Exception:
+            release_funds(email_id, batch_total)
+            raise
+        for position, message in failed:
+            errors.append({"row": docs[position][0], "error": message})
+
+        if failed:
+            release_funds(email_id, batch_total - sum(doc["amount"] for doc in inserted))
+        if rollup_error:
+            raise _rollup_failed(email_id, f"Imported {len(inserted)} of {len(rows)} expenses", rollup_error)
+        invalidate_user(email_id)
+
+        errors.sort(key=lambda err: err["row"])
+        return {
+            "message": f"Imported {len(inserted)} of {len(rows)} expenses",
+            "inserted": len(inserted),
+            "ids": [str(doc["_id"]) for doc in inserted],
+            "errors": errors
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error importing expenses: {str(e)}")
+
+
+async def _funds_data(email_id: str) -> dict:
+    fund_doc = await arepo.funds.get(email_id)
+    return fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
+
+
+def _parse_day(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+
+def _expense_filters(start: Optional[str], end: Optional[str], category: Optional[str]) -> Dict[str, Any]:
+    """
+    Filters shared by the expense listing and export endpoints
+    (keyword arguments for repo.expenses.find).
+    """
+    filters: Dict[str, Any] = {}
+
+    if start and end:
+        filters["start"], filters["end"] = _parse_day(start), _parse_day(end)
+
+    if category:
+        # Stored categories are normalized on write, so this is an indexed equality match
+        filters["category"] = category.strip().capitalize()
+
+    return filters
+
+
+# Get Expenses (owner taken from the bearer token)
+# The listing and the summaries below are async: their reads go through
+# async_repository.arepo (PyMongo's asyncio client on MongoDB)
 @router.get("/expenses/")
-def get_expenses(
-    email_id: str = Query(..., description="Email ID of logged-in user"),
+async def get_expenses(
+    email_id: str = Depends(current_email),
     start: Optional[str] = Query(None),
     end: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; omit to return every match"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated subset of expense fields"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson streams one expense per line"),
 ):
     try:
-        query: Dict[str, Any] = {"email_id": email_id.strip().lower()}
-
-        if start and end:
-            start_date = datetime.strptime(start, "%Y-%m-%d")
-            end_date = datetime.strptime(end, "%Y-%m-%d")
-            query["date"] = {"$gte": start_date, "$lte": end_date}
-
-        if category:
-            query["category"] = {
-                "$regex": f"^{category}$",
-                "$options": "i"
-            }
-        
-        expenses = list(expenses_collection.find(query))
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        funds_data = fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
+        filters = _expense_filters(start, end, category)
+        selected = parse_fields(fields, EXPENSE_FIELDS)
+
+        if format == "ndjson":
+            # Newest first, straight from the storage cursor to the socket
+            rows = arepo.expenses.find(email_id, **filters, cursor=cursor, limit=limit, fields=selected)
+
+            async def stream():
+                try:
+                    async for exp in rows:
+                        yield json.dumps(expense_serializer(exp, selected)) + "\n"
+                finally:
+                    await rows.aclose()
+
+            return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+        next_cursor = None
+        if limit:
+            expenses = await arepo.expenses.fetch(email_id, **filters, cursor=cursor, limit=limit + 1, fields=selected)
+            if len(expenses) > limit:
+                expenses = expenses[:limit]
+                next_cursor = encode_cursor(expenses[-1].get("date"), expenses[-1]["_id"])
+        else:
+            expenses = await arepo.expenses.fetch(email_id, **filters, cursor=cursor, fields=selected)
 
         return {
-            "expenses": [expense_serializer(exp) for exp in expenses],
-            "funds": funds_data
+            "expenses": [expense_serializer(exp, selected) for exp in expenses],
+            "funds": await _funds_data(email_id),
+            "next_cursor": next_cursor
         }
         
-        # expenses = expenses_collection.find(query)
+        # expenses = repo.expenses.find(email_id)
         # return [expense_serializer(exp) for exp in expenses]
 
+    except HTTPException:
+        raise
     except Exception as e:
         # print("Error in get_expenses:", e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Something went wrong")
 
 
+# Search Expenses (paginated; backs the expense picker)
+@router.get("/expenses/search")
+def search_expenses(
+    email_id: str = Depends(current_email),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    min_amount: Optional[float] = Query(None, ge=0),
+    max_amount: Optional[float] = Query(None, ge=0),
+    q: Optional[str] = Query(None, max_length=100, description="Text to look for in the description"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+):
+    try:
+        filters = _expense_filters(None, None, category)
+        # Either bound may be given on its own here
+        filters["start"], filters["end"] = _parse_day(start), _parse_day(end)
+
+        expenses = list(repo.expenses.find(
+            email_id,
+            **filters,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            # Substring match on the description, evaluated only on this user's indexed subset
+            text=q.strip() if q and q.strip() else None,
+            cursor=cursor,
+            limit=limit + 1
+        ))
+        next_cursor = None
+        if len(expenses) > limit:
+            expenses = expenses[:limit]
+            next_cursor = encode_cursor(expenses[-1].get("date"), expenses[-1]["_id"])
+
+        return {"expenses": [expense_serializer(exp) for exp in expenses], "next_cursor": next_cursor}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error searching expenses: {str(e)}")
+
+
+# Export Expenses (same filters as GET /expenses/), streamed from the cursor
+@router.get("/expenses/export")
+def export_expenses(
+    email_id: str = Depends(current_email),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    format: Literal["csv", "parquet", "xlsx"] = Query("csv"),
+):
+    filters = _expense_filters(start, end, category)
+    exporter = EXPORTERS[format]
+    try:
+        # Fail before streaming starts if the optional dependency is missing
+        if format == "parquet":
+            import pyarrow.parquet  # noqa: F401
+        elif format == "xlsx":
+            import openpyxl  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail=f"{format} export is not available on this server")
+
+    # One date-ordered stream (hot and archived rows on Mongo); the exporter closes it
+    rows = repo.expenses.find(
+        email_id,
+        **filters,
+        fields={"amount", "category", "date", "description"},
+        batch_size=settings.EXPORT_BATCH_SIZE
+    )
+
+    filename = f"expenses-{datetime.utcnow().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        exporter(rows, settings.EXPORT_BATCH_SIZE),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
 @router.get("/summary/monthly")
-def get_monthly_summary(email_id: str = Query(...)):
+async def get_monthly_summary(request: Request, email_id: str = Depends(current_email)):
     try:
-        pipeline = [
-            {"$match": {"email_id": email_id.strip().lower()}},
-            {
-                "$group": {
-                    "_id": {
-                        "year": {"$year": "$date"},
-                        "month": {"$month": "$date"}
-                    },
-                    "total": {"$sum": "$amount"}
-                }
-            },
-            {"$sort": {"_id.year": -1, "_id.month": -1}}
-        ]
-        results = list(expenses_collection.aggregate(pipeline))
-   
-
-        summary = []
-        for item in results:
-            year = item["_id"]["year"]
-            month = item["_id"]["month"]
-            key = f"{year}-{month:02d}"
-            summary.append({"month": key, "total_expense": item["total"]})
-
-        # 🔥 Get funds info
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        funds_data = fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
-
-        return {"monthly_summary": summary, "funds": funds_data}
-        # return summary
+
+        async def build():
+            # Rollups on Mongo, a GROUP BY on SQLite (repository.py)
+            summary = await arepo.expenses.monthly_totals(email_id)
+            # 🔥 Get funds info
+            return {"monthly_summary": summary, "funds": await _funds_data(email_id)}
+
+        return await cached_json_async(request, "summary", email_id, build)
 
     except Exception as e:
         print("ERROR in /summary/monthly:", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 # @router.get("/summary/weekly")
-# def get_weekly_summary(email_id: str = Query(...)):
+# def get_weekly_summary(email_id: str = Depends(current_email)):
 #     pipeline = [
 #         {"$match": {"email_id": email_id.strip().lower()}},
 #         {
@@ -186,70 +402,34 @@ def get_monthly_summary(email_id: str = Query(...)):
 
 
 @router.get("/summary/top-categories")
-def get_top_spending_categories(email_id: str = Query(...)):
+async def get_top_spending_categories(request: Request, email_id: str = Depends(current_email)):
     try:
-        pipeline = [
-            {"$match": {"email_id": email_id.strip().lower()}},
-            {
-                "$group": {
-                    "_id": "$category",
-                    "total": {"$sum": "$amount"}
-                }
-            },
-            {"$sort": {"total": -1}},
-            {"$limit": 3}
-        ]
-
-        result = list(expenses_collection.aggregate(pipeline))
-        categories = [{"category": item["_id"], "total": item["total"]} for item in result]
-
-        # 🔥===== Fetch Funds Info =====
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        # funds_data = {
-        #     "total_funds": funds.get("total_funds", 0),
-        #     "spent": funds.get("spent", 0),
-        #     "balance": funds.get("balance", 0)
-        # } if funds else {"total_funds": 0, "spent": 0, "balance": 0}
-        funds_data = fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
-
-        # return [{"category": item["_id"], "total": item["total"]} for item in result]
-        return {"top_categories": categories, "funds": funds_data}
+
+        async def build():
+            categories = await arepo.expenses.category_totals(email_id, limit=3)
+            # 🔥===== Fetch Funds Info =====
+            return {"top_categories": categories, "funds": await _funds_data(email_id)}
+
+        return await cached_json_async(request, "summary", email_id, build)
 
     except Exception as e:
         print("Error in top categories:", e)
         raise HTTPException(status_code=500, detail="Internal server error")
     
 @router.get("/summary/by-category")
-def get_category_summary(email_id: str = Query(...)):
+async def get_category_summary(request: Request, email_id: str = Depends(current_email)):
     """
     Summarize total expenses grouped by category for the given user.
     Returns all categories with total amounts, sorted from highest to lowest.
     """
     try:
-        pipeline = [
-            {"$match": {"email_id": email_id.strip().lower()}},
-            {
-                "$group": {
-                    "_id": "$category",
-                    "total": {"$sum": "$amount"}
-                }
-            },
-            {"$sort": {"total": -1}}
-        ]
-
-        results = list(expenses_collection.aggregate(pipeline))
-        categories = [{"category": item["_id"], "total": item["total"]} for item in results]
-
-        # 🔥 ===== Fetch funds info =====
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        # funds_data = {
-        #     "total_funds": funds.get("total_funds", 0),
-        #     "spent": funds.get("spent", 0),
-        #     "balance": funds.get("balance", 0)
-        # } if funds else {"total_funds": 0, "spent": 0, "balance": 0}
-        funds_data = fund_serializer(fund_doc) if fund_doc else {"total_funds": 0, "spent": 0, "balance": 0}
-        return {"Categories": categories, "funds": funds_data}
-        # return [{"category": item["_id"], "total": item["total"]} for item in results]
+
+        async def build():
+            categories = await arepo.expenses.category_totals(email_id)
+            # 🔥 ===== Fetch funds info =====
+            return {"Categories": categories, "funds": await _funds_data(email_id)}
+
+        return await cached_json_async(request, "summary", email_id, build)
 
     except Exception as e:
         print("Error in /summary/by-category:", e)
@@ -258,17 +438,19 @@ def get_category_summary(email_id: str = Query(...)):
 
 
 
-# Update Expense (by expense_id, email_id required for security)
+# Update Expense (by expense_id, only the token owner's own expenses)
 @router.put("/update/expenses/{expense_id}")
 def update_expense(
     expense_id: str,
     updated_data: dict = Body(...),
-    email_id: str = Query(..., description="Email ID of logged-in user")
+    email_id: str = Depends(current_email)
 ):
     try:
         if not ObjectId.is_valid(expense_id):
             raise HTTPException(status_code=400, detail="Invalid expense ID")
 
+        delta = 0.0
+
         # Normalize fields
         if "category" in updated_data:
             updated_data["category"] = updated_data["category"].strip().capitalize()
@@ -291,47 +473,48 @@ def update_expense(
             except ValueError:
                 raise HTTPException(status_code=400, detail="Amount must be a positive number")
 
-            # Fetch old expense
-            old_expense = expenses_collection.find_one({"_id": ObjectId(expense_id), "email_id": email_id.strip().lower()})
-            if not old_expense:
-                raise HTTPException(status_code=404, detail="Expense not found or not owned by this user")
-
-            # Calculate total spent dynamically from MongoDB (excluding this expense)
-            pipeline = [
-                {"$match": {"email_id": email_id.strip().lower(), "_id": {"$ne": ObjectId(expense_id)}}},
-                {"$group": {"_id": None, "total_spent": {"$sum": "$amount"}}}
-            ]
-            result = list(expenses_collection.aggregate(pipeline))
-            current_spent = result[0]["total_spent"] if result else 0
-
-            # Check available funds
-            fund_doc = funds_collection.find_one({"email_id": email_id})
-            total_funds = fund_doc.get("total_funds", 0) if fund_doc else 0
-            new_total_spent = current_spent + updated_data["amount"]
-
-            if new_total_spent > total_funds:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Insufficient funds. Available balance: {total_funds - current_spent}"
-                )
+        # Fetch old expense (archived ones move back to the hot tier first)
+        old_expense = repo.expenses.get(email_id, ObjectId(expense_id))
+        if not old_expense:
+            raise HTTPException(status_code=404, detail="Expense not found or not owned by this user")
+
+        if "amount" in updated_data:
+            # Only the difference touches the ledger
+            delta = updated_data["amount"] - old_expense.get("amount", 0)
 
         updated_data["updated_at"] = datetime.utcnow()
 
-        # Update expense
-        result = expenses_collection.update_one(
-            {"_id": ObjectId(expense_id), "email_id": email_id.strip().lower()},
-            {"$set": updated_data}
-        )
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Expense not found or not owned by this user")
+        def write(session):
+            if delta > 0:
+                reserve_funds(email_id, delta, session)
 
-        # Recalculate funds after update
-        update_user_funds(email_id)
+            try:
+                # Guarded on the values the ledger/rollup deltas are based on
+                if not repo.expenses.update(old_expense, updated_data, session):
+                    raise HTTPException(status_code=409, detail="Expense was modified concurrently, please retry")
+            except RollupError:
+                # The update is stored, so the ledger follows it
+                if delta < 0:
+                    release_funds(email_id, -delta)
+                raise
+            except Exception:
+                if delta > 0 and session is None:
+                    # No transaction to roll back: give the reservation back by hand
+                    release_funds(email_id, delta)
+                raise
+
+            if delta < 0:
+                release_funds(email_id, -delta, session)
+
+        run_in_transaction(write)
+        invalidate_user(email_id)
 
         return {"message": "Expense updated successfully"}
 
     except HTTPException:
         raise
+    except RollupError as e:
+        raise _rollup_failed(email_id, "Expense was updated", e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error updating expense: {str(e)}")
@@ -339,21 +522,37 @@ def update_expense(
 
 # ✅ Delete Expense
 @router.delete("/expenses/{expense_id}")
-def delete_expense(expense_id: str, email_id: str = Query(...)):
+def delete_expense(expense_id: str, email_id: str = Depends(current_email)):
     try:
         if not ObjectId.is_valid(expense_id):
             raise HTTPException(status_code=400, detail="Invalid expense ID")
 
-        result = expenses_collection.delete_one(
-            {"_id": ObjectId(expense_id), "email_id": email_id.strip().lower()}
-        )
-        if result.deleted_count == 0:
+        # Archived expenses move back to the hot tier, then delete as usual
+        if not repo.expenses.get(email_id, ObjectId(expense_id)):
             raise HTTPException(status_code=404, detail="Expense not found")
 
-        # 🔥 Recalculate funds after delete
-        update_user_funds(email_id)
+        def write(session):
+            # Also drops it from the rollups on Mongo
+            try:
+                deleted = repo.expenses.delete(email_id, ObjectId(expense_id), session)
+            except RollupError as e:
+                # The expense is gone, so its amount still goes back
+                release_funds(email_id, e.result.get("amount", 0))
+                raise
+            if not deleted:
+                raise HTTPException(status_code=404, detail="Expense not found")
+
+            # 🔥 Give the amount back to the balance
+            release_funds(email_id, deleted.get("amount", 0), session)
+
+        run_in_transaction(write)
+        invalidate_user(email_id)
 
         return {"message": "Expense deleted"}
+    except HTTPException:
+        raise
+    except RollupError as e:
+        raise _rollup_failed(email_id, "Expense was deleted", e)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error deleting expense: {str(e)}")
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query,Body
-from database import funds_collection, expenses_collection
+from fastapi import APIRouter, HTTPException, Query,Body,Request,Depends
 from serializers import fund_serializer
-from bson import ObjectId
-from datetime import datetime
+from models import name_key
+from repository import repo
+from cache import cached_json, invalidate_user
+from auth import current_email, require_admin
+from typing import Optional, Dict
 import traceback
 
 router = APIRouter(prefix="/funds", tags=["Funds"])
@@ -12,94 +14,175 @@ router = APIRouter(prefix="/funds", tags=["Funds"])
 # =========================
 def update_user_funds(email_id: str):
     """
-    Recalculate spent & balance after expense changes.
+    Recalculate spent & balance from a full re-aggregation of expenses.
+    The write paths keep the ledger incrementally (see adjust_user_spent);
+    this is the slow path used when the ledger needs to be rebuilt.
     Ensures balance is never negative.
     """
     try:
         email_id = email_id.strip().lower()
-        # Fetch user's funds document
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        now = datetime.utcnow()
-        if not fund_doc:
-            # If no funds record exists, create one with defaults
-            fund_doc = {
-                "email_id": email_id,
-                "total_funds": 0,
-                "spent": 0,
-                "balance": 0,
-                "created_at": now,
-                "updated_at": now
-            }
-            funds_collection.insert_one(fund_doc)
-
-        total_funds = fund_doc.get("total_funds", 0)
+        # If no funds record exists, create one with defaults
+        repo.funds.ensure(email_id)
 
         # Sum all expenses for this user
-        pipeline = [
-            {"$match": {"email_id": email_id}},
-            {"$group": {"_id": None, "total_spent": {"$sum": "$amount"}}}
-        ]
-        result = list(expenses_collection.aggregate(pipeline))
-        spent = result[0]["total_spent"] if result else 0
-
-        # Prevent overspending
-        # if spent > total_funds:
-        #     spent = total_funds
-        spent = min(spent, total_funds)
-        balance = total_funds - spent
+        spent = repo.expenses.spent_by_user(email_id).get(email_id, 0)
 
-        # Update funds document
-        funds_collection.update_one(
-            {"email_id": email_id},
-            {"$set": {
-                "spent": spent,
-                "balance": balance,
-                "updated_at": now
-            }}
-        )
-        return {"message": "Funds updated", "total_funds": total_funds, "spent": spent, "balance": balance}
+        # Prevent overspending; derived from the stored total_funds in the same
+        # write so a concurrent allocation is not overwritten
+        fund_doc = repo.funds.recompute(email_id, spent)
+        invalidate_user(email_id)
+        return {
+            "message": "Funds updated",
+            "total_funds": fund_doc.get("total_funds", 0),
+            "spent": fund_doc.get("spent", 0),
+            "balance": fund_doc.get("balance", 0)
+        }
 
     except Exception as e:
         traceback.print_exc()
         return {"error": str(e)}
 
 
+def run_in_transaction(callback):
+    """callback(session) in one transaction where the backend supports it (see repository.py)."""
+    return repo.run_in_transaction(callback)
+
+
+def adjust_user_spent(email_id: str, delta: float, session=None):
+    """
+    Apply an expense delta to the running ledger in one guarded write.
+    Returns the updated funds document, or None if the guard rejected it.
+    """
+    return repo.funds.adjust_spent(email_id.strip().lower(), delta, session)
+
+
+def reserve_funds(email_id: str, amount: float, session=None):
+    """
+    Move `amount` from balance to spent, or raise a 400 explaining why not.
+    """
+    fund_doc = adjust_user_spent(email_id, amount, session)
+    if fund_doc:
+        return fund_doc
+
+    fund_doc = repo.funds.get(email_id.strip().lower(), session)
+    if not fund_doc or fund_doc.get("total_funds", 0) == 0:
+        raise HTTPException(status_code=400, detail="User has no allocated funds yet")
+    raise HTTPException(
+        status_code=400,
+        detail=f"Insufficient funds. Available balance: {fund_doc.get('balance', 0)}"
+    )
+
+
+def release_funds(email_id: str, amount: float, session=None):
+    """
+    Give `amount` back to the balance after an expense is removed or lowered.
+    Falls back to a full recompute if the ledger has drifted below `amount`.
+    """
+    if amount <= 0:
+        return
+    if not adjust_user_spent(email_id, -amount, session) and session is None:
+        update_user_funds(email_id)
+
+
+def reconcile_funds(email_id: Optional[str] = None, fix: bool = True):
+    """
+    Re-run the full $sum over expenses (hot and archived) and compare it with the ledger.
+    Reports every funds document whose spent/balance drifted and, if `fix`
+    is set, rewrites it from the recomputed totals.
+    """
+    email_id = email_id.strip().lower() if email_id else None
+    actual_spent = repo.expenses.spent_by_user(email_id)
+
+    checked = 0
+    drifted = []
+    for fund_doc in repo.funds.find(email_id):
+        checked += 1
+        total_funds = fund_doc.get("total_funds", 0)
+        spent = min(actual_spent.get(fund_doc["email_id"], 0), total_funds)
+        balance = total_funds - spent
+        if abs(fund_doc.get("spent", 0) - spent) < 0.005 and abs(fund_doc.get("balance", 0) - balance) < 0.005:
+            continue
+
+        drifted.append({
+            "email_id": fund_doc["email_id"],
+            "stored_spent": fund_doc.get("spent", 0),
+            "actual_spent": spent,
+            "stored_balance": fund_doc.get("balance", 0),
+            "actual_balance": balance
+        })
+        if fix:
+            repo.funds.recompute(fund_doc["email_id"], actual_spent.get(fund_doc["email_id"], 0))
+            invalidate_user(fund_doc["email_id"])
+
+    return {"checked": checked, "drifted": drifted, "fixed": fix}
+
+
+def _funds_response(email_id: str):
+    fund_doc = repo.funds.get(email_id) or {}
+    return {
+        "message": "Funds updated",
+        "total_funds": fund_doc.get("total_funds", 0),
+        "spent": fund_doc.get("spent", 0),
+        "balance": fund_doc.get("balance", 0),
+        "version": fund_doc.get("version", 0)
+    }
+
+
+def category_funds_overview(email_id: str):
+    """
+    Allocated, spent and remaining funds per category.
+    Spent comes from the per-category totals. Categories
+    without an explicit allocation share whatever part of total_funds the
+    explicit allocations leave over, split evenly.
+    """
+    fund_doc = repo.funds.get(email_id) or {}
+    total_funds = fund_doc.get("total_funds", 0)
+    allocations = {row["category"]: row["amount"] for row in fund_doc.get("category_allocations", [])}
+    spent = {row["category"]: row["total"] for row in repo.expenses.category_totals(email_id)}
+
+    names = sorted(cat["name"] for cat in repo.categories.all())
+    # Keep categories that still have spending or an allocation after being removed
+    names += sorted((set(spent) | set(allocations)) - set(names), key=str)
+
+    explicit = sum(allocations.values())
+    unallocated = max(total_funds - explicit, 0)
+    implicit = [name for name in names if name not in allocations]
+    even_share = unallocated / len(implicit) if implicit else 0
+
+    rows = []
+    for name in names:
+        allocated = allocations.get(name, even_share)
+        category_spent = spent.get(name, 0)
+        rows.append({
+            "category": name,
+            "allocated": round(allocated, 2),
+            "spent": category_spent,
+            "remaining": round(max(allocated - category_spent, 0), 2),
+            "explicit": name in allocations
+        })
+
+    return {
+        "total_funds": total_funds,
+        "spent": fund_doc.get("spent", 0),
+        "balance": fund_doc.get("balance", 0),
+        "allocated": explicit,
+        "unallocated": unallocated,
+        "categories": rows
+    }
+
+
 # =========================
 # API ENDPOINTS
 # =========================
 
 # 1️⃣ Allocate Funds (add funds to user)
 @router.post("/allocate")
-def allocate_funds(email_id: str = Body(...), amount: float = Body(..., gt=0)):
+def allocate_funds(amount: float = Body(..., gt=0, embed=True), email_id: str = Depends(current_email)):
     try:
-        email_id = email_id.strip().lower()
-        now = datetime.utcnow()
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-
-        if not fund_doc:
-            # Create new funds record
-            fund_doc = {
-                "email_id": email_id,
-                "total_funds": amount,
-                "spent": 0,
-                "balance": amount,
-                "created_at": now,
-                "updated_at": now
-            }
-            funds_collection.insert_one(fund_doc)
-        else:
-            # Increment total_funds
-            total_funds = fund_doc.get("total_funds", 0) + amount
-            funds_collection.update_one(
-                {"email_id": email_id},
-                {"$set": {
-                    "total_funds": total_funds,
-                    # "balance": total_funds - fund_doc.get("spent", 0),
-                    "updated_at": now
-                }}
-            )
-        # Recalculate balance after allocation
-        return update_user_funds(email_id)
+        # Single atomic upsert: concurrent allocations add up instead of overwriting
+        repo.funds.allocate(email_id, amount)
+        invalidate_user(email_id)
+        return _funds_response(email_id)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -107,22 +190,16 @@ def allocate_funds(email_id: str = Body(...), amount: float = Body(..., gt=0)):
 
 # 2️⃣ View Current Funds
 @router.get("/")
-def get_funds(email_id: str = Query(...)):
+def get_funds(request: Request, email_id: str = Depends(current_email)):
     try:
-        email_id = email_id.strip().lower()
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        # if not fund_doc:
-        #     raise HTTPException(status_code=404, detail="Funds record not found")
-        # return {
-        #     "total_funds": fund_doc.get("total_funds", 0),
-        #     "spent": fund_doc.get("spent", 0),
-        #     "balance": fund_doc.get("balance", 0),
-        #     "created_at": fund_doc.get("created_at"),
-        #     "updated_at": fund_doc.get("updated_at")
-        # }
-        if not fund_doc:
-            return {"total_funds": 0, "spent": 0, "balance": 0, "created_at": None, "updated_at": None}
-        return fund_serializer(fund_doc)
+
+        def build():
+            fund_doc = repo.funds.get(email_id)
+            if not fund_doc:
+                return {"total_funds": 0, "spent": 0, "balance": 0, "created_at": None, "updated_at": None}
+            return fund_serializer(fund_doc)
+
+        return cached_json(request, "funds", email_id, build)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -130,39 +207,101 @@ def get_funds(email_id: str = Query(...)):
 
 # 3️⃣ Update Funds (set new total_funds)
 @router.put("/update")
-def update_funds(email_id: str = Body(...), total_funds: float = Body(..., ge=0)):
+def update_funds(
+    total_funds: float = Body(..., ge=0),
+    expected_version: Optional[int] = Body(None, description="Only update if the funds document is still at this version"),
+    email_id: str = Depends(current_email)
+):
     try:
-        email_id = email_id.strip().lower()
-        fund_doc = funds_collection.find_one({"email_id": email_id})
-        if not fund_doc:
+        # Derive balance from the stored spent in the same write; never below
+        # spent, and with expected_version, refuse to overwrite a newer document
+        if not repo.funds.set_total(email_id, total_funds, expected_version):
+            fund_doc = repo.funds.get(email_id)
+            if not fund_doc:
+                raise HTTPException(status_code=404, detail="Funds record not found")
+            if fund_doc.get("spent", 0) > total_funds:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Total funds cannot be less than what is already spent ({fund_doc.get('spent', 0)})"
+                )
+            raise HTTPException(status_code=409, detail="Funds were modified concurrently; reload and retry")
+        invalidate_user(email_id)
+        return _funds_response(email_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 4️⃣ Delete Funds Record (reset the caller's own)
+@router.delete("/")
+def delete_funds(email_id: str = Depends(current_email)):
+    try:
+        if not repo.funds.reset(email_id):
             raise HTTPException(status_code=404, detail="Funds record not found")
+        invalidate_user(email_id)
+        return {"message": f"Funds record reset for {email_id}"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        funds_collection.update_one(
-            {"email_id": email_id},
-            {"$set": {
-                "total_funds": total_funds,
-                "updated_at": datetime.utcnow()
-            }}
-        )
-        # Recalculate balance
-        return update_user_funds(email_id)
+
+# 5️⃣ Reconcile ledger against the raw expenses (admin; any or every user)
+@router.post("/reconcile", dependencies=[Depends(require_admin)])
+def reconcile(email_id: Optional[str] = Query(None), fix: bool = Query(True)):
+    try:
+        return reconcile_funds(email_id, fix)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# 4️⃣ Delete Funds Record (reset)
-@router.delete("/{email_id}")
-def delete_funds(email_id: str):
+# 6️⃣ Per-category overview: allocated / spent / remaining
+@router.get("/categories")
+def get_category_funds(request: Request, email_id: str = Depends(current_email)):
     try:
-        email_id = email_id.strip().lower()
-        result = funds_collection.update_one(
-            {"email_id": email_id},
-            {"$set": {"total_funds": 0, "spent": 0, "balance": 0, "updated_at": datetime.utcnow()}}
-        )
-        if result.matched_count == 0:
+        return cached_json(request, "funds_categories", email_id, lambda: category_funds_overview(email_id))
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 7️⃣ Set per-category allocations (replaces the previous set)
+@router.put("/categories")
+def set_category_allocations(
+    allocations: Dict[str, float] = Body(..., embed=True, description="Category name -> allocated amount; omitted categories share the rest evenly"),
+    email_id: str = Depends(current_email)
+):
+    try:
+        fund_doc = repo.funds.get(email_id)
+        if not fund_doc:
             raise HTTPException(status_code=404, detail="Funds record not found")
-        return {"message": f"Funds record reset for {email_id}"}
+
+        known = {name_key(cat["name"]): cat["name"] for cat in repo.categories.all()}
+        category_allocations = []
+        for name, amount in allocations.items():
+            if amount < 0:
+                raise HTTPException(status_code=400, detail=f"Allocation for '{name}' cannot be negative")
+            if name_key(name) not in known:
+                raise HTTPException(status_code=400, detail=f"Unknown category '{name}'")
+            category_allocations.append({"category": known[name_key(name)], "amount": amount})
+
+        total_allocated = sum(row["amount"] for row in category_allocations)
+        if total_allocated > fund_doc.get("total_funds", 0):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Allocations ({total_allocated}) exceed total funds ({fund_doc.get('total_funds', 0)})"
+            )
+
+        repo.funds.set_allocations(email_id, category_allocations)
+        invalidate_user(email_id)
+        return category_funds_overview(email_id)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, HTTPException, Query, BackgroundTasks, Depends
+from database import jobs_collection
+from jobs import job_serializer, create_job, run_job, archive_old_expenses
+from repository import mongo_only
+from auth import require_admin
+from bson import ObjectId
+from typing import Optional
+
+# Jobs and the archive tier live in Mongo; 501 on the embedded backend.
+# Admin only: job params name users, and archiving is database-wide.
+router = APIRouter(prefix="/jobs", tags=["Jobs"], dependencies=[Depends(mongo_only), Depends(require_admin)])
+
+
+# Move expenses past the archive horizon into monthly buckets (archive.py)
+@router.post("/archive-expenses", status_code=202)
+def start_archive(
+    background_tasks: BackgroundTasks,
+    older_than_days: Optional[int] = Query(None, ge=0, description="Defaults to ARCHIVE_AFTER_DAYS"),
+    email_id: Optional[str] = Query(None, description="Only archive this user's expenses"),
+):
+    email_id = email_id.strip().lower() if email_id else None
+    job_id = create_job("archive_expenses", {"older_than_days": older_than_days, "email_id": email_id})
+    background_tasks.add_task(run_job, job_id, archive_old_expenses, older_than_days, email_id)
+    return {"message": "Archive job started", "job_id": job_id}
+
+
+# Progress of a background job (user purge, category remap, archive)
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    job = jobs_collection.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_serializer(job)
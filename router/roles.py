@@ -1,37 +1,40 @@
-from fastapi import APIRouter, HTTPException
-from models import Role
-from database import roles_collection
+from fastapi import APIRouter, HTTPException, Request, Depends
+from models import Role, name_key
+from repository import repo, DuplicateError
 from serializers import role_serializer
-from bson import ObjectId
+from cache import cached_json, invalidate
+from auth import require_admin
 from typing import List
 
 router = APIRouter()
 
-# POST REQUEST TO ADD ROLE
-@router.post("/roles/")
+# POST REQUEST TO ADD ROLE (admin)
+@router.post("/roles/", dependencies=[Depends(require_admin)])
 def add_role(role: Role):
     role_dict = role.dict()
 
     # Capitalize role name
     role_dict["role_name"] = role_dict["role_name"].strip().capitalize()
 
-    # Duplicate check (case-insensitive)
-    existing_role = roles_collection.find_one(
-        {"role_name": {"$regex": f"^{role_dict['role_name']}$", "$options": "i"}}
-    )
+    # Duplicate check (case-insensitive, via the normalized key)
+    role_dict["role_key"] = name_key(role_dict["role_name"])
+    existing_role = repo.roles.get_by_key(role_dict["role_key"])
     if existing_role:
         raise HTTPException(status_code=400, detail=f"Role '{role_dict['role_name']}' already exists.")
 
     # Insert new role
-    result = roles_collection.insert_one(role_dict)
+    try:
+        role_id = repo.roles.insert(role_dict)
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail=f"Role '{role_dict['role_name']}' already exists.")
+    invalidate("roles")
 
     return {
-        "id": str(result.inserted_id),
+        "id": str(role_id),
         "role_name": role_dict["role_name"]
     }
 
 # GET ALL ROLES
 @router.get("/roles/", response_model=List[Role])
-def get_all_roles():
-    roles = list(roles_collection.find())
-    return [role_serializer(r) for r in roles]
+def get_all_roles(request: Request):
+    return cached_json(request, "roles", "all", lambda: [role_serializer(r) for r in repo.roles.all()])
@@ -1,57 +1,75 @@
-from fastapi import APIRouter, HTTPException
-from models import User
-from database import users_collection, roles_collection
+from fastapi import APIRouter, HTTPException, Body, Query, BackgroundTasks, Depends, Header
+from fastapi.concurrency import run_in_threadpool
+from models import User, name_key, user_search_keys
+from repository import repo, DuplicateError
 from serializers import user_serializer
+from pagination import encode_key_cursor
+from auth import needs_rehash, issue_tokens, decode_token, current_claims, require_admin, DEFAULT_ROLE, REFRESH
+from hashing import hash_password_async, check_password_async
+from jobs import create_job, run_job, purge_user_data
+from cache import invalidate_user
 from bson import ObjectId
-from typing import List
-import bcrypt
+from typing import Optional
+import settings
 
 router = APIRouter()
 
 # REGISTER USER
 #CORRECT ONE
+# Password handlers are async: bcrypt runs on the hashing pool (429 when it
+# is full) and the blocking Mongo calls go through run_in_threadpool, so a
+# login burst never holds threadpool workers for the length of a hash.
+# The storage calls are blocking on either backend (repository.py).
+# Self-registration always creates a User; any other role needs an admin token.
 @router.post("/users/register")
-def register_user(user: User):
+async def register_user(user: User, authorization: Optional[str] = Header(None)):
     user_dict = user.dict()
+    role_name = (user_dict.get("role_name") or "").strip()
+    if not role_name or name_key(role_name) == name_key(DEFAULT_ROLE):
+        role_name = DEFAULT_ROLE
+    else:
+        require_admin(current_claims(authorization))
+    user_dict["role_name"] = role_name
 
     # Check if email already exists
-    existing_user = users_collection.find_one({"email_id": user_dict["email_id"]})
+    existing_user = await run_in_threadpool(repo.users.get_by_email, user_dict["email_id"])
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Hash password
-    hashed_pw = bcrypt.hashpw(user_dict["password"].encode("utf-8"), bcrypt.gensalt())
-    user_dict["password"] = hashed_pw.decode("utf-8")
+    user_dict["password"] = await hash_password_async(user_dict["password"])
+    user_dict.update(user_search_keys(user_dict))
 
-    # Insert into DB
-    result = users_collection.insert_one(user_dict)
-    return {"message": "User registered successfully", "id": str(result.inserted_id)}
+    # Insert into DB (the unique index catches a concurrent registration)
+    try:
+        user_id = await run_in_threadpool(repo.users.insert, user_dict)
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    return {"message": "User registered successfully", "id": str(user_id)}
 
-# LOGIN USER
-@router.get("/users/login")
-def login_user(email: str, password: str):
-    
+async def _authenticate(email: str, password: str):
+    """
+    The only place a password is checked; everything after login runs on
+    the issued tokens.
+    """
     # Find the user by email
-    user = users_collection.find_one({"email_id": email})
+    user = await run_in_threadpool(repo.users.get_by_email, email.strip())
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stored_password = user["password"]
-
-    # Case 1: If stored as plain text
-    if stored_password == password:
-        pass  # Login success
-
-    # Case 2: If stored as hashed (bcrypt)
-    elif bcrypt.checkpw(password.encode("utf-8"), stored_password.encode("utf-8")):
-        pass  # Login success
-
-    else:
+    stored_password = user.get("password", "")
+    if not await check_password_async(password, stored_password):
         raise HTTPException(status_code=401, detail="Invalid password")
 
+    # Upgrade plain-text passwords and hashes made with another work factor
+    if needs_rehash(stored_password):
+        rehashed = await hash_password_async(password)
+        await run_in_threadpool(repo.users.update, user["_id"], {"password": rehashed})
+
     return {
         "message": "Login successful",
+        **issue_tokens(user),
         "user": {
             "id": str(user["_id"]),
             "first_name": user.get("first_name"),
@@ -62,16 +80,59 @@ def login_user(email: str, password: str):
         }
     }
 
-# GET ALL USERS (no password in output)
-@router.get("/users/", response_model=List[dict])
-def get_all_users():
-    users = list(users_collection.find())
-    return [user_serializer(u) for u in users]
-
 
-# UPDATE USER - Only update allowed fields
-@router.put("/users/{user_id}")
-def update_user(user_id: str, updated_data: dict):
+# LOGIN USER
+@router.post("/users/login")
+async def login_user(email: str = Body(...), password: str = Body(...)):
+    return await _authenticate(email, password)
+
+
+# Legacy login: credentials in the query string, only with LEGACY_AUTH=1
+@router.get("/users/login", deprecated=True)
+async def login_user_legacy(email: str, password: str):
+    if not settings.LEGACY_AUTH:
+        raise HTTPException(status_code=405, detail="Use POST /users/login")
+    return await _authenticate(email, password)
+
+
+# REFRESH ACCESS TOKEN
+@router.post("/users/refresh")
+def refresh_token(refresh_token: str = Body(..., embed=True)):
+    claims = decode_token(refresh_token, REFRESH)
+    if not ObjectId.is_valid(claims.get("uid") or ""):
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    user = repo.users.get(ObjectId(claims["uid"]), {"email_id": 1, "role_name": 1, "token_version": 1})
+    # A password change bumps token_version and retires older refresh tokens
+    if not user or user.get("token_version", 0) != claims.get("ver", 0):
+        raise HTTPException(status_code=401, detail="Refresh token revoked", headers={"WWW-Authenticate": "Bearer"})
+    return issue_tokens(user)
+
+# LIST / SEARCH USERS (admin; paginated, no password in output)
+@router.get("/users/", dependencies=[Depends(require_admin)])
+def get_all_users(
+    q: Optional[str] = Query(None, max_length=100, description="Prefix of first name, last name or email"),
+    role: Optional[str] = Query(None),
+    limit: int = Query(25, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+):
+    # Prefix match on the lowercased keys: each branch is an index range scan
+    users = repo.users.search(
+        prefix=name_key(q) if q and q.strip() else None,
+        role_key=name_key(role) if role else None,
+        cursor=cursor,
+        limit=limit + 1
+    )
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_key_cursor(users[-1].get("email_key", ""), users[-1]["_id"])
+
+    return {"users": [user_serializer(u) for u in users], "next_cursor": next_cursor}
+
+
+# UPDATE USER (admin) - Only update allowed fields
+@router.put("/users/{user_id}", dependencies=[Depends(require_admin)])
+async def update_user(user_id: str, updated_data: dict):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
@@ -93,10 +154,11 @@ def update_user(user_id: str, updated_data: dict):
     if "email_id" in updated_data and updated_data["email_id"]:
         update_fields["email_id"] = updated_data["email_id"]
 
-    # Update password (with hashing)
+    # Update password (with hashing); retires outstanding refresh tokens
+    password_changed = False
     if "password" in updated_data and updated_data["password"]:
-        hashed_pw = bcrypt.hashpw(updated_data["password"].encode("utf-8"), bcrypt.gensalt())
-        update_fields["password"] = hashed_pw.decode("utf-8")
+        update_fields["password"] = await hash_password_async(updated_data["password"])
+        password_changed = True
 
     # Update role_name
     if "role_name" in updated_data and updated_data["role_name"]:
@@ -105,25 +167,48 @@ def update_user(user_id: str, updated_data: dict):
     if not update_fields:
         raise HTTPException(status_code=400, detail="No valid fields provided for update")
 
-    result = users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": update_fields})
+    try:
+        matched = await run_in_threadpool(
+            repo.users.update,
+            ObjectId(user_id),
+            {**update_fields, **user_search_keys(update_fields)},
+            password_changed
+        )
+    except DuplicateError:
+        raise HTTPException(status_code=400, detail="Email already registered")
 
-    if result.matched_count == 0:
+    if not matched:
         raise HTTPException(status_code=404, detail="User not found")
 
     return {"message": "User updated successfully", "updated_fields": list(update_fields.keys())}
 
-# DELETE USER
-@router.delete("/users/{user_id}")
-def delete_user(user_id: str):
+# DELETE USER (admin)
+# Their expenses, rollups and funds are purged by a background job
+@router.delete("/users/{user_id}", status_code=202, dependencies=[Depends(require_admin)])
+def delete_user(
+    user_id: str,
+    background_tasks: BackgroundTasks,
+    archive: bool = Query(False, description="Copy the user's expenses to deleted_expenses before removing them"),
+):
     if not ObjectId.is_valid(user_id):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
-    result = users_collection.delete_one({"_id": ObjectId(user_id)})
+    user = repo.users.delete(ObjectId(user_id))
 
-    if result.deleted_count == 0:
+    if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return {"message": "User deleted successfully"}
+    email_id = (user.get("email_id") or "").strip().lower()
+    if not repo.background_jobs:
+        # Embedded backend: two DELETE statements, no job needed
+        repo.purge_user(email_id, archive)
+        invalidate_user(email_id)
+        return {"message": "User deleted successfully", "job_id": None}
+
+    job_id = create_job("purge_user", {"email_id": email_id, "archive": archive})
+    background_tasks.add_task(run_job, job_id, purge_user_data, email_id, archive)
+
+    return {"message": "User deleted successfully", "job_id": job_id}
 
 
 
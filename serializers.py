@@ -2,15 +2,21 @@ from bson import ObjectId
 from models import Expense
 from typing import Optional
 
-def expense_serializer(expense) -> dict:
-    return {
+EXPENSE_FIELDS = ("amount", "category", "date", "description", "email_id")
+
+def expense_serializer(expense, fields: Optional[set] = None) -> dict:
+    data = {
         "id": str(expense["_id"]),
-        "amount": expense["amount"],
-        "category": expense["category"],
+        "amount": expense.get("amount"),
+        "category": expense.get("category"),
         "date": expense["date"].strftime("%Y-%m-%d") if expense.get("date") else None,
         "description": expense.get("description", ""),
         "email_id": expense.get("email_id")  # 👈 include email of the owner
     }
+    if fields:
+        # Only the projected fields (plus id) when the caller asked for a subset
+        return {k: v for k, v in data.items() if k == "id" or k in fields}
+    return data
 
 
 def category_serializer(category) -> dict:
@@ -32,7 +38,6 @@ def user_serializer(user) -> dict:
         "middle_name": user.get("middle_name"),
         "last_name": user.get("last_name"),
         "email_id": user.get("email_id"),
-        "password": user.get("password"),     # Normally store hashed password
         "role_name": user.get("role_name")        # default role if not provided
     }
 def fund_serializer(fund) -> dict:
@@ -42,6 +47,8 @@ def fund_serializer(fund) -> dict:
         "total_funds": fund.get("total_funds", 0),
         "spent": fund.get("spent", 0),
         "balance": fund.get("balance", fund.get("total_funds", 0) - fund.get("spent", 0)),
+        "version": fund.get("version", 0),
+        "category_allocations": fund.get("category_allocations", []),
         "created_at": fund.get("created_at"),
         "updated_at": fund.get("updated_at")
     }
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""
+Runtime settings, read from environment variables with local defaults.
+"""
+import os
+import secrets
+
+
+def _int(name: str, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+# =========================
+# STORAGE
+# =========================
+# mongo | sqlite. "sqlite" keeps everything in one embedded database file
+# (sqlite_repository.py) for single-node deployments and tests without a
+# server; the Mongo-only extras (jobs, archive tier) then answer 501.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+# ":memory:" gives a throwaway database in a temp file, removed at exit
+SQLITE_PATH = os.getenv("SQLITE_PATH", "expenses.db")
+# How long a writer waits for the database lock before giving up
+SQLITE_BUSY_TIMEOUT_MS = _int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+
+# =========================
+# MONGODB
+# =========================
+# "mongomock://" runs against an in-memory mongomock store instead of a server
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DEFAULT_MONGO_DB_NAME = "DailyExpenseTracker"
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", DEFAULT_MONGO_DB_NAME)
+
+# Connection pool shared by every router
+MONGO_MAX_POOL_SIZE = _int("MONGO_MAX_POOL_SIZE", 100)
+MONGO_MIN_POOL_SIZE = _int("MONGO_MIN_POOL_SIZE", 10)
+MONGO_MAX_IDLE_TIME_MS = _int("MONGO_MAX_IDLE_TIME_MS", 60000)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)
+
+# Fail fast instead of hanging a worker when Mongo is unreachable
+MONGO_CONNECT_TIMEOUT_MS = _int("MONGO_CONNECT_TIMEOUT_MS", 5000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)
+MONGO_SOCKET_TIMEOUT_MS = _int("MONGO_SOCKET_TIMEOUT_MS", None)
+
+# standard | timeseries. "timeseries" keeps expenses in a MongoDB time-series
+# collection (timeField=date, metaField=email_id); needs MongoDB 7.0+ for the
+# update/delete paths. Copy existing data with: python timeseries.py copy
+EXPENSES_STORAGE = os.getenv("EXPENSES_STORAGE", "standard")
+EXPENSES_TS_COLLECTION = os.getenv("EXPENSES_TS_COLLECTION", "expenses_ts")
+# Expense dates are whole days, so "hours" buckets (<= 30 days each) fit best
+EXPENSES_TS_GRANULARITY = os.getenv("EXPENSES_TS_GRANULARITY", "hours")
+
+# Wrap expense + ledger writes in multi-document transactions (replica set only;
+# ignored in timeseries mode, which does not allow writes inside transactions)
+USE_TRANSACTIONS = os.getenv("USE_TRANSACTIONS", "0") == "1" and EXPENSES_STORAGE != "timeseries"
+
+# primary | primaryPreferred | secondary | secondaryPreferred | nearest
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+
+# Serve the expense listing and summary reads from PyMongo's asyncio client
+# (async_repository.py; pymongo 4.9+) instead of the threadpool. It has its
+# own pool with the settings above. Ignored on mongomock and SQLite.
+MONGO_ASYNC = os.getenv("MONGO_ASYNC", "1") == "1"
+
+# =========================
+# API
+# =========================
+# Worker threads for sync endpoints. Sized to the Mongo pool so requests
+# queue in the threadpool rather than on pool checkout.
+API_THREADPOOL_SIZE = _int("API_THREADPOOL_SIZE", MONGO_MAX_POOL_SIZE)
+
+# Create/upgrade indexes on startup (python migrations.py does it on demand)
+RUN_MIGRATIONS_ON_STARTUP = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "1") == "1"
+# A migration claimed by a runner that died is taken over after this long
+MIGRATION_CLAIM_TIMEOUT_SECONDS = _int("MIGRATION_CLAIM_TIMEOUT_SECONDS", 3600)
+
+# Upper bound on rows accepted by POST /expenses/bulk in one request
+BULK_MAX_ROWS = _int("BULK_MAX_ROWS", 10000)
+
+# Rows fetched per round trip / written per chunk by GET /expenses/export
+EXPORT_BATCH_SIZE = _int("EXPORT_BATCH_SIZE", 2000)
+
+# Rows deleted / remapped per write by the background cleanup jobs (jobs.py)
+JOB_BATCH_SIZE = _int("JOB_BATCH_SIZE", 1000)
+
+# Expenses older than this (rounded down to a month) move to the archive tier
+ARCHIVE_AFTER_DAYS = _int("ARCHIVE_AFTER_DAYS", 365)
+
+# =========================
+# AUTH
+# =========================
+# HMAC key for access/refresh tokens. Set it explicitly in production: the
+# random fallback differs per process, so tokens die with a restart and are
+# not shared between workers.
+SECRET_KEY = os.getenv("SECRET_KEY") or secrets.token_hex(32)
+ACCESS_TOKEN_TTL_SECONDS = _int("ACCESS_TOKEN_TTL_SECONDS", 900)
+REFRESH_TOKEN_TTL_SECONDS = _int("REFRESH_TOKEN_TTL_SECONDS", 7 * 24 * 3600)
+
+# bcrypt work factor for new hashes (existing hashes are upgraded at login);
+# python benchmarks/bench_bcrypt.py shows the cost per round count
+BCRYPT_ROUNDS = _int("BCRYPT_ROUNDS", 12)
+
+# bcrypt runs on its own pool (hashing.py) so a login burst cannot take the
+# threadpool away from cheap reads. Jobs beyond workers + queue get a 429.
+HASH_WORKERS = _int("HASH_WORKERS", max(1, (os.cpu_count() or 2) - 1))
+HASH_QUEUE_LIMIT = _int("HASH_QUEUE_LIMIT", 32)
+
+# Accept ?email_id= as the caller's identity when no bearer token is sent,
+# and keep GET /users/login; only for clients that predate tokens
+LEGACY_AUTH = os.getenv("LEGACY_AUTH", "0") == "1"
+
+# =========================
+# CACHE
+# =========================
+# memory | redis | none
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL_SECONDS = _int("CACHE_TTL_SECONDS", 300)
+CACHE_MAX_ENTRIES = _int("CACHE_MAX_ENTRIES", 10000)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Users whose columnar analytics frames stay in memory (analytics.py)
+ANALYTICS_MAX_USERS = _int("ANALYTICS_MAX_USERS", 256)
+# Reload frames after this long anyway (picks up writes made by other processes)
+ANALYTICS_FRAME_TTL_SECONDS = _int("ANALYTICS_FRAME_TTL_SECONDS", 300)
+
+# =========================
+# INSTRUMENTATION
+# =========================
+# Log Mongo commands slower than this (with their explain plan); 0 disables
+SLOW_QUERY_MS = _int("SLOW_QUERY_MS", 0)
+# Explains waiting or running at once; slow queries past that are logged without a plan
+SLOW_QUERY_EXPLAIN_QUEUE = _int("SLOW_QUERY_EXPLAIN_QUEUE", 32)
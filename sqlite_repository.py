@@ -0,0 +1,601 @@
+"""
+Embedded SQLite storage (STORAGE_BACKEND=sqlite).
+
+Same interface as repository.MongoRepository, for single-node deployments
+and tests without a database server. One file (SQLITE_PATH) in WAL mode,
+one connection per thread (":memory:" gets a private temp file). Rows are
+returned in the Mongo document shape: ids are ObjectId hex strings in the
+table and ObjectId in the result, dates are stored as fixed-width
+"YYYY-MM-DD HH:MM:SS.ffffff" text (so they sort and compare as text) and
+come back as datetime.
+
+There are no rollups here: the summaries are GROUP BY queries answered
+from the covering (email_id, category, date, amount) index, and listings
+walk (email_id, date, id) with row-value keyset comparisons. Category
+renames/deletes and user deletes cascade inline in one transaction instead
+of through background jobs.
+"""
+import atexit
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from models import name_key
+from pagination import decode_cursor, decode_key_cursor
+from repository import DuplicateError
+import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    email_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT,
+    date TEXT NOT NULL,
+    description TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+-- Listings and keyset pages: newest first per user
+CREATE INDEX IF NOT EXISTS expenses_email_date ON expenses (email_id, date DESC, id DESC);
+-- Covers the summaries (GROUP BY month / category) and category filters
+CREATE INDEX IF NOT EXISTS expenses_email_category_date ON expenses (email_id, category, date, amount);
+-- Category renames/deletes
+CREATE INDEX IF NOT EXISTS expenses_category ON expenses (category);
+
+CREATE TABLE IF NOT EXISTS deleted_expenses (
+    id TEXT PRIMARY KEY,
+    email_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT,
+    date TEXT NOT NULL,
+    description TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    deleted_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS funds (
+    id TEXT PRIMARY KEY,
+    email_id TEXT NOT NULL UNIQUE,
+    total_funds REAL NOT NULL DEFAULT 0,
+    spent REAL NOT NULL DEFAULT 0,
+    balance REAL NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    category_allocations TEXT NOT NULL DEFAULT '[]',
+    created_at TEXT,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    first_name TEXT,
+    middle_name TEXT,
+    last_name TEXT,
+    email_id TEXT NOT NULL UNIQUE,
+    password TEXT,
+    role_name TEXT,
+    token_version INTEGER NOT NULL DEFAULT 0,
+    first_name_key TEXT,
+    last_name_key TEXT,
+    email_key TEXT,
+    role_key TEXT
+);
+CREATE INDEX IF NOT EXISTS users_first_name_key ON users (first_name_key, id);
+CREATE INDEX IF NOT EXISTS users_last_name_key ON users (last_name_key, id);
+CREATE INDEX IF NOT EXISTS users_email_key ON users (email_key, id);
+CREATE INDEX IF NOT EXISTS users_role_key ON users (role_key, email_key, id);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS roles (
+    id TEXT PRIMARY KEY,
+    role_name TEXT NOT NULL,
+    role_key TEXT NOT NULL UNIQUE
+);
+"""
+
+EXPENSE_COLUMNS = ("email_id", "amount", "category", "date", "description", "created_at", "updated_at")
+USER_COLUMNS = (
+    "first_name", "middle_name", "last_name", "email_id", "password", "role_name",
+    "first_name_key", "last_name_key", "email_key", "role_key",
+)
+DATE_COLUMNS = {"date", "created_at", "updated_at", "deleted_at"}
+# Sorts after any character a lowercased search key can contain
+_PREFIX_END = "\U0010ffff"
+
+
+def _ts(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        # Stored as naive UTC, like the Mongo driver returns dates
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _doc(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    """A row in the Mongo document shape."""
+    if row is None:
+        return None
+    doc = {}
+    for key in row.keys():
+        value = row[key]
+        if key == "id":
+            doc["_id"] = ObjectId(value)
+        elif key in DATE_COLUMNS:
+            doc[key] = datetime.fromisoformat(value) if value else None
+        elif key == "category_allocations":
+            doc[key] = json.loads(value or "[]")
+        else:
+            doc[key] = value
+    return doc
+
+
+def _like(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class _Table:
+    def __init__(self, repo: "SQLiteRepository"):
+        self.repo = repo
+
+    def _one(self, sql: str, params=()) -> Optional[dict]:
+        return _doc(self.repo.conn().execute(sql, params).fetchone())
+
+    def _all(self, sql: str, params=()) -> List[dict]:
+        return [_doc(row) for row in self.repo.conn().execute(sql, params)]
+
+    def _insert(self, table: str, doc: dict, columns) -> ObjectId:
+        doc.setdefault("_id", ObjectId())
+        names = ["id"] + [c for c in columns if c in doc]
+        values = [str(doc["_id"])] + [_ts(doc[c]) if c in DATE_COLUMNS else doc[c] for c in names[1:]]
+        self.repo.conn().execute(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})", values
+        )
+        return doc["_id"]
+
+
+# =========================
+# EXPENSES
+# =========================
+class SQLiteExpenses(_Table):
+    def insert(self, doc: dict, session=None) -> dict:
+        self._insert("expenses", doc, EXPENSE_COLUMNS)
+        return doc
+
+    def insert_many(self, email_id: str, docs: list):
+        """All rows or none: the batch is one transaction."""
+        with self.repo.transaction():
+            for doc in docs:
+                self._insert("expenses", doc, EXPENSE_COLUMNS)
+        return docs, []
+
+    def get(self, email_id: str, expense_id: ObjectId) -> Optional[dict]:
+        return self._one("SELECT * FROM expenses WHERE id = ? AND email_id = ?", (str(expense_id), email_id))
+
+    def update(self, old: dict, changes: dict, session=None) -> bool:
+        columns = [c for c in changes if c in EXPENSE_COLUMNS and c != "email_id"]
+        values = [_ts(changes[c]) if c in DATE_COLUMNS else changes[c] for c in columns]
+        # Guarded on the values the ledger delta was computed from
+        cursor = self.repo.conn().execute(
+            f"UPDATE expenses SET {', '.join(f'{c} = ?' for c in columns)} "
+            "WHERE id = ? AND email_id = ? AND amount = ? AND category IS ? AND date = ?",
+            values + [str(old["_id"]), old["email_id"], old.get("amount"), old.get("category"), _ts(old.get("date"))]
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, email_id: str, expense_id: ObjectId, session=None) -> Optional[dict]:
+        with self.repo.transaction():
+            deleted = self.get(email_id, expense_id)
+            if deleted:
+                self.repo.conn().execute("DELETE FROM expenses WHERE id = ?", (str(expense_id),))
+            return deleted
+
+    def find(
+        self,
+        email_id: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        category: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        text: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[set] = None,
+        batch_size: int = 500,
+    ) -> Iterable[dict]:
+        where, params = ["email_id = ?"], [email_id]
+        if start:
+            where.append("date >= ?")
+            params.append(_ts(start))
+        if end:
+            where.append("date <= ?")
+            params.append(_ts(end))
+        if category:
+            where.append("category = ?")
+            params.append(category)
+        if min_amount is not None:
+            where.append("amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            where.append("amount <= ?")
+            params.append(max_amount)
+        if text:
+            where.append("description LIKE ? ESCAPE '\\'")
+            params.append(_like(text))
+
+        after = decode_cursor(cursor) if cursor else None
+        if after and after[0] is None:
+            return iter(())  # every stored expense has a date
+        columns = ", ".join(["id", "date"] + sorted(set(fields) - {"date"})) if fields else "*"
+
+        def rows():
+            # Keyset batches, each a fresh statement on the iterating thread's
+            # connection: a slow consumer never holds a read transaction open
+            key = (_ts(after[0]), str(after[1])) if after else None
+            remaining = limit
+            while remaining is None or remaining > 0:
+                size = batch_size if remaining is None else min(batch_size, remaining)
+                clauses, values = list(where), list(params)
+                if key:
+                    clauses.append("(date, id) < (?, ?)")
+                    values.extend(key)
+                batch = self.repo.conn().execute(
+                    f"SELECT {columns} FROM expenses WHERE {' AND '.join(clauses)} "
+                    "ORDER BY date DESC, id DESC LIMIT ?",
+                    values + [size]
+                ).fetchall()
+                for row in batch:
+                    yield _doc(row)
+                if len(batch) < size:
+                    return
+                key = (batch[-1]["date"], batch[-1]["id"])
+                if remaining is not None:
+                    remaining -= len(batch)
+
+        return rows()
+
+    def monthly_totals(self, email_id: str):
+        return [
+            {"month": row["month"], "total_expense": row["total"]}
+            for row in self.repo.conn().execute(
+                "SELECT substr(date, 1, 7) AS month, SUM(amount) AS total FROM expenses "
+                "WHERE email_id = ? GROUP BY month ORDER BY month DESC",
+                (email_id,)
+            )
+        ]
+
+    def category_totals(self, email_id: str, limit: Optional[int] = None):
+        return [
+            {"category": row["category"], "total": row["total"]}
+            for row in self.repo.conn().execute(
+                "SELECT category, SUM(amount) AS total FROM expenses "
+                "WHERE email_id = ? GROUP BY category ORDER BY total DESC LIMIT ?",
+                (email_id, limit or -1)
+            )
+        ]
+
+    def summary(self, email_id: str) -> dict:
+        return {"monthly": self.monthly_totals(email_id), "by_category": self.category_totals(email_id)}
+
+    def spent_by_user(self, email_id: Optional[str] = None) -> Dict[str, float]:
+        sql = "SELECT email_id, SUM(amount) AS total FROM expenses"
+        params: tuple = ()
+        if email_id:
+            sql, params = sql + " WHERE email_id = ?", (email_id,)
+        return {row["email_id"]: row["total"] for row in self.repo.conn().execute(sql + " GROUP BY email_id", params)}
+
+
+# =========================
+# FUNDS
+# =========================
+class SQLiteFunds(_Table):
+    def get(self, email_id: str, session=None) -> Optional[dict]:
+        return self._one("SELECT * FROM funds WHERE email_id = ?", (email_id,))
+
+    def find(self, email_id: Optional[str] = None):
+        if email_id:
+            return self._all("SELECT * FROM funds WHERE email_id = ?", (email_id,))
+        return self._all("SELECT * FROM funds")
+
+    def ensure(self, email_id: str):
+        now = _ts(datetime.utcnow())
+        self.repo.conn().execute(
+            "INSERT INTO funds (id, email_id, created_at, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (email_id) DO NOTHING",
+            (str(ObjectId()), email_id, now, now)
+        )
+
+    def allocate(self, email_id: str, amount: float):
+        now = _ts(datetime.utcnow())
+        self.repo.conn().execute(
+            "INSERT INTO funds (id, email_id, total_funds, balance, version, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (email_id) DO UPDATE SET total_funds = total_funds + excluded.total_funds, "
+            "balance = balance + excluded.balance, version = version + 1, updated_at = excluded.updated_at",
+            (str(ObjectId()), email_id, amount, amount, now, now)
+        )
+
+    def adjust_spent(self, email_id: str, delta: float, session=None) -> Optional[dict]:
+        guard = " AND balance >= ?" if delta > 0 else " AND spent >= ?" if delta < 0 else ""
+        params = [delta, delta, _ts(datetime.utcnow()), email_id] + ([abs(delta)] if guard else [])
+        with self.repo.transaction():
+            cursor = self.repo.conn().execute(
+                "UPDATE funds SET spent = spent + ?, balance = balance - ?, version = version + 1, "
+                "updated_at = ? WHERE email_id = ?" + guard,
+                params
+            )
+            return self.get(email_id) if cursor.rowcount else None
+
+    def set_total(self, email_id: str, total_funds: float, expected_version: Optional[int] = None) -> bool:
+        sql = (
+            "UPDATE funds SET total_funds = ?, balance = ? - spent, updated_at = ?, "
+            "version = version + 1 WHERE email_id = ? AND spent <= ?"
+        )
+        params = [total_funds, total_funds, _ts(datetime.utcnow()), email_id, total_funds]
+        if expected_version is not None:
+            sql += " AND version = ?"
+            params.append(expected_version)
+        return self.repo.conn().execute(sql, params).rowcount > 0
+
+    def reset(self, email_id: str) -> bool:
+        return self.repo.conn().execute(
+            "UPDATE funds SET total_funds = 0, spent = 0, balance = 0, updated_at = ?, version = version + 1 "
+            "WHERE email_id = ?",
+            (_ts(datetime.utcnow()), email_id)
+        ).rowcount > 0
+
+    def set_allocations(self, email_id: str, allocations: list):
+        self.repo.conn().execute(
+            "UPDATE funds SET category_allocations = ?, updated_at = ?, version = version + 1 WHERE email_id = ?",
+            (json.dumps(allocations), _ts(datetime.utcnow()), email_id)
+        )
+
+    def recompute(self, email_id: str, actual_spent: float) -> Optional[dict]:
+        with self.repo.transaction():
+            self.repo.conn().execute(
+                "UPDATE funds SET spent = MIN(?, total_funds), balance = total_funds - MIN(?, total_funds), "
+                "updated_at = ?, version = version + 1 WHERE email_id = ?",
+                (actual_spent, actual_spent, _ts(datetime.utcnow()), email_id)
+            )
+            return self.get(email_id)
+
+
+# =========================
+# USERS, CATEGORIES, ROLES
+# =========================
+class SQLiteUsers(_Table):
+    def get(self, user_id: ObjectId, projection: Optional[dict] = None) -> Optional[dict]:
+        return self._one("SELECT * FROM users WHERE id = ?", (str(user_id),))
+
+    def get_by_email(self, email_id: str) -> Optional[dict]:
+        return self._one("SELECT * FROM users WHERE email_id = ?", (email_id,))
+
+    def insert(self, doc: dict) -> ObjectId:
+        try:
+            return self._insert("users", doc, USER_COLUMNS)
+        except sqlite3.IntegrityError:
+            raise DuplicateError(doc.get("email_id"))
+
+    def update(self, user_id: ObjectId, fields: dict, bump_token_version: bool = False) -> bool:
+        columns = [c for c in fields if c in USER_COLUMNS]
+        assignments = [f"{c} = ?" for c in columns]
+        if bump_token_version:
+            assignments.append("token_version = token_version + 1")
+        try:
+            cursor = self.repo.conn().execute(
+                f"UPDATE users SET {', '.join(assignments)} WHERE id = ?",
+                [fields[c] for c in columns] + [str(user_id)]
+            )
+        except sqlite3.IntegrityError:
+            raise DuplicateError(fields.get("email_id"))
+        return cursor.rowcount > 0
+
+    def delete(self, user_id: ObjectId) -> Optional[dict]:
+        with self.repo.transaction():
+            user = self._one("SELECT id, email_id FROM users WHERE id = ?", (str(user_id),))
+            if user:
+                self.repo.conn().execute("DELETE FROM users WHERE id = ?", (str(user_id),))
+            return user
+
+    def search(self, prefix: Optional[str] = None, role_key: Optional[str] = None,
+               cursor: Optional[str] = None, limit: int = 25) -> list:
+        where, params = [], []
+        if prefix:
+            # Key ranges rather than LIKE, so each branch can use its index
+            where.append("(" + " OR ".join(
+                f"({key} >= ? AND {key} < ?)" for key in ("first_name_key", "last_name_key", "email_key")
+            ) + ")")
+            params += [prefix, prefix + _PREFIX_END] * 3
+        if role_key:
+            where.append("role_key = ?")
+            params.append(role_key)
+        if cursor:
+            key, _id = decode_key_cursor(cursor)
+            where.append("(email_key, id) > (?, ?)")
+            params += [key, str(_id)]
+        return self._all(
+            "SELECT id, first_name, middle_name, last_name, email_id, role_name, email_key FROM users "
+            f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY email_key, id LIMIT ?",
+            params + [limit]
+        )
+
+
+class SQLiteCategories(_Table):
+    def all(self) -> list:
+        return self._all("SELECT * FROM categories")
+
+    def get(self, category_id: ObjectId) -> Optional[dict]:
+        return self._one("SELECT * FROM categories WHERE id = ?", (str(category_id),))
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        return self._one("SELECT * FROM categories WHERE name_key = ?", (key,))
+
+    def insert(self, doc: dict) -> ObjectId:
+        try:
+            return self._insert("categories", doc, ("name", "name_key"))
+        except sqlite3.IntegrityError:
+            raise DuplicateError(doc.get("name"))
+
+    def update(self, category_id: ObjectId, fields: dict) -> Optional[dict]:
+        with self.repo.transaction():
+            old = self.get(category_id)
+            if old:
+                try:
+                    self.repo.conn().execute(
+                        "UPDATE categories SET name = ?, name_key = ? WHERE id = ?",
+                        (fields["name"], fields["name_key"], str(category_id))
+                    )
+                except sqlite3.IntegrityError:
+                    raise DuplicateError(fields.get("name"))
+            return old
+
+    def delete(self, category_id: ObjectId) -> Optional[dict]:
+        with self.repo.transaction():
+            old = self.get(category_id)
+            if old:
+                self.repo.conn().execute("DELETE FROM categories WHERE id = ?", (str(category_id),))
+            return old
+
+
+class SQLiteRoles(_Table):
+    def all(self) -> list:
+        return self._all("SELECT * FROM roles")
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        return self._one("SELECT * FROM roles WHERE role_key = ?", (key,))
+
+    def insert(self, doc: dict) -> ObjectId:
+        try:
+            return self._insert("roles", doc, ("role_name", "role_key"))
+        except sqlite3.IntegrityError:
+            raise DuplicateError(doc.get("role_name"))
+
+
+# =========================
+# REPOSITORY
+# =========================
+class SQLiteRepository:
+    name = "sqlite"
+    # Cascades are single statements here; they run inline (remap_category, purge_user)
+    background_jobs = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = path
+        if path == ":memory:":
+            # Not a shared-cache memory database: its table locks fail at once
+            # (SQLITE_LOCKED) instead of waiting out the busy timeout, so
+            # concurrent BEGIN IMMEDIATE from the threadpool would error out
+            self._file = os.path.join(tempfile.mkdtemp(prefix="expenses-sqlite-"), "expenses.db")
+            atexit.register(shutil.rmtree, os.path.dirname(self._file), True)
+        self._local = threading.local()
+        self.expenses = SQLiteExpenses(self)
+        self.funds = SQLiteFunds(self)
+        self.users = SQLiteUsers(self)
+        self.categories = SQLiteCategories(self)
+        self.roles = SQLiteRoles(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        timeout = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+        conn = sqlite3.connect(self._file, isolation_level=None, check_same_thread=False, timeout=timeout)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection (autocommit unless inside transaction())."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def setup(self):
+        """Create tables and indexes (idempotent)."""
+        self.conn().executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE ... COMMIT on this thread's connection; joins the
+        outer transaction when already inside one.
+        """
+        conn = self.conn()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def run_in_transaction(self, callback):
+        """Run callback(connection) in one transaction; the connection is the "session"."""
+        with self.transaction() as conn:
+            return callback(conn)
+
+    # =========================
+    # INLINE CASCADES
+    # =========================
+    def remap_category(self, old_name: str, new_name: Optional[str], fallback: str) -> List[str]:
+        """
+        Move `old_name`'s expenses to `new_name` (rename) or `fallback`
+        (delete, created if missing) and carry or drop its allocations.
+        Returns the users whose data changed.
+        """
+        with self.transaction() as conn:
+            target = new_name
+            if not target:
+                existing = self.categories.get_by_key(name_key(fallback))
+                if not existing:
+                    self.categories.insert({"name": fallback.strip().capitalize(), "name_key": name_key(fallback)})
+                target = existing["name"] if existing else fallback.strip().capitalize()
+
+            affected = {
+                row["email_id"]
+                for row in conn.execute("SELECT DISTINCT email_id FROM expenses WHERE category = ?", (old_name,))
+            }
+            conn.execute("UPDATE expenses SET category = ? WHERE category = ?", (target, old_name))
+
+            for fund_doc in self.funds.find():
+                allocations = fund_doc.get("category_allocations", [])
+                if not any(row["category"] == old_name for row in allocations):
+                    continue
+                if new_name:
+                    allocations = [{**row, "category": new_name} if row["category"] == old_name else row
+                                   for row in allocations]
+                else:
+                    allocations = [row for row in allocations if row["category"] != old_name]
+                self.funds.set_allocations(fund_doc["email_id"], allocations)
+                affected.add(fund_doc["email_id"])
+        return sorted(affected)
+
+    def purge_user(self, email_id: str, archive: bool = False) -> dict:
+        """Remove a deleted user's expenses (optionally keeping a copy) and funds."""
+        with self.transaction() as conn:
+            archived = 0
+            if archive:
+                archived = conn.execute(
+                    "INSERT OR IGNORE INTO deleted_expenses SELECT *, ? FROM expenses WHERE email_id = ?",
+                    (_ts(datetime.utcnow()), email_id)
+                ).rowcount
+            deleted = conn.execute("DELETE FROM expenses WHERE email_id = ?", (email_id,)).rowcount
+            funds = conn.execute("DELETE FROM funds WHERE email_id = ?", (email_id,)).rowcount
+        return {"expenses_archived": archived, "expenses_deleted": deleted, "funds_deleted": funds}
@@ -5,8 +5,7 @@ import requests
 import pandas as pd
 from datetime import datetime, timedelta
 import re
-
-API_BASE = "http://127.0.0.1:8000"
+import api_client as api
 
 # =========================
 # PAGE CONFIG
@@ -52,12 +51,14 @@ if "email_id" not in st.session_state:
 if "auth_mode" not in st.session_state:
     st.session_state.auth_mode = "login"
 
+api.begin_rerun()
+
 # =========================
 # API HELPERS
 # =========================
 def get_roles():
     try:
-        res = requests.get(f"{API_BASE}/roles/")
+        res = api.get("/roles/", ttl=api.TTL_STATIC)
         if res.status_code == 200:
             return res.json()
         else:
@@ -70,27 +71,29 @@ def get_roles():
 # USER HELPERS
 # =====================
 def login_user(email, password):
-    params = {"email": email, "password": password}
+    payload = {"email": email, "password": password}
     try:
-        res = requests.get(f"{API_BASE}/users/login", params=params)
+        res = api.post("/users/login", json=payload)
         if res.status_code == 200:
-            return res.json(), None
+            data = res.json()
+            api.set_tokens(data)
+            return data, None
         else:
             return None, res.json().get("detail", "Login failed")
     except Exception as e:
         return None, str(e)
 
-def register_user(first_name, middle_name, last_name, email, password, role_name):
+def register_user(first_name, middle_name, last_name, email, password):
+    # New accounts always get the User role; admins are promoted from the admin tab
     payload = {
         "first_name": first_name,
         "middle_name": middle_name,
         "last_name": last_name,
         "email_id": email,
-        "password": password,
-        "role_name": role_name
+        "password": password
     }
     try:
-        res = requests.post(f"{API_BASE}/users/register", json=payload)
+        res = api.post("/users/register", json=payload, invalidates=api.USER_PATHS)
         if res.status_code == 200:
             return True, None
         else:
@@ -98,20 +101,60 @@ def register_user(first_name, middle_name, last_name, email, password, role_name
     except Exception as e:
         return False, str(e)
     
-def get_all_users():
+def search_users(q=None, role=None, cursor=None, limit=25):
+    """One page of users from the paginated, password-free /users/ listing."""
+    params = {"limit": limit}
+    if q:
+        params["q"] = q
+    if role:
+        params["role"] = role
+    if cursor:
+        params["cursor"] = cursor
     try:
-        res = requests.get(f"{API_BASE}/users/")
+        res = api.get("/users/", params=params, ttl=api.TTL_USER)
         if res.status_code == 200:
-            return res.json()
+            data = res.json()
+            return data.get("users", []), data.get("next_cursor")
+        st.warning(f"⚠ Could not fetch users (status {res.status_code})")
     except Exception as e:
         st.error(f"⚠ Could not fetch users: {e}")
-    return []
+    return [], None
+
+
+def user_search_page(key, limit=25):
+    """
+    Search box, role filter and Previous/Next paging for the admin user tabs.
+    Returns only the users on the current page.
+    """
+    c1, c2 = st.columns([3, 1])
+    q = c1.text_input("Search by name or email (prefix)", key=f"{key}_q").strip()
+    role = c2.selectbox("Role", ["All", "User", "Admin"], key=f"{key}_role")
+    role = None if role == "All" else role
+
+    # Cursor stack per tab; reset whenever the search changes
+    state_key = f"{key}_cursors"
+    if st.session_state.get(f"{key}_filters") != (q, role):
+        st.session_state[f"{key}_filters"] = (q, role)
+        st.session_state[state_key] = [None]
+    cursors = st.session_state[state_key]
+
+    users, next_cursor = search_users(q, role, cursors[-1], limit)
+
+    p1, p2, p3 = st.columns([1, 2, 1])
+    if p1.button("⬅ Previous", key=f"{key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    p2.caption(f"Page {len(cursors)}")
+    if p3.button("Next ➡", key=f"{key}_next", disabled=not next_cursor):
+        cursors.append(next_cursor)
+        st.rerun()
+    return users
 
 
 def update_user(user_id: str, updated_data: dict):
     """Update user details."""
     try:
-        resp = requests.put(f"{API_BASE}/users/{user_id}", json=updated_data)
+        resp = api.put(f"/users/{user_id}", json=updated_data, invalidates=api.USER_PATHS)
         resp.raise_for_status()
         return resp.json()
     except requests.exceptions.RequestException as e:
@@ -120,7 +163,7 @@ def update_user(user_id: str, updated_data: dict):
 def delete_user(user_id: str):
     """Delete a user by their ID."""
     try:
-        resp = requests.delete(f"{API_BASE}/users/{user_id}")
+        resp = api.delete(f"/users/{user_id}", invalidates=api.USER_PATHS)
         resp.raise_for_status()
         return resp.json()
     except requests.exceptions.RequestException as e:
@@ -129,22 +172,23 @@ def delete_user(user_id: str):
 # FUNDS HELPERS
 # --------------------
 # ✅ Funds
-def add_user_funds(email_id, amount):
+def add_user_funds(amount):
     """Allocate funds for a user."""
     try:
-        res = requests.post(
-            f"{API_BASE}/funds/allocate",
-            json={"email_id": email_id, "amount": amount},
+        res = api.post(
+            "/funds/allocate",
+            json={"amount": amount},
+            invalidates=api.FUND_PATHS,
         )
         return res.json()
     except Exception as e:
         return {"error": str(e)}
 
 
-def get_user_funds(email_id):
+def get_user_funds():
     """Fetch current funds info (total, spent, balance)."""
     try:
-        res = requests.get(f"{API_BASE}/funds", params={"email_id": email_id})
+        res = api.get("/funds/", ttl=api.TTL_USER)
         if res.status_code == 200:
             data = res.json()
             return {
@@ -157,22 +201,23 @@ def get_user_funds(email_id):
         return {"error": str(e)}
 
 
-def update_user_funds(email_id, new_total):
+def update_user_funds(new_total):
     """Update user’s total funds directly."""
     try:
-        res = requests.put(
-            f"{API_BASE}/funds/update",
-            json={"email_id": email_id, "total_funds": new_total},
+        res = api.put(
+            "/funds/update",
+            json={"total_funds": new_total},
+            invalidates=api.FUND_PATHS,
         )
         return res.json()
     except Exception as e:
         return {"error": str(e)}
 
 
-def reset_user_funds(email_id):
+def reset_user_funds():
     """Delete user funds record (reset)."""
     try:
-        res = requests.delete(f"{API_BASE}/funds/{email_id}")
+        res = api.delete("/funds/", invalidates=api.FUND_PATHS)
         return res.json()
     except Exception as e:
         return {"error": str(e)}
@@ -183,7 +228,7 @@ def reset_user_funds(email_id):
 
 def get_categories():
     try:
-        resp = requests.get(f"{API_BASE}/categories/")
+        resp = api.get("/categories/", ttl=api.TTL_STATIC)
         if resp.status_code == 200:
             categories = resp.json()
             # Ensure _id is always a string
@@ -197,29 +242,9 @@ def get_categories():
         st.error(f"Error fetching categories: {e}")
         return []
 
-def get_top_categories(email_id):
+def get_top_categories():
     """Fetch top spending categories for a user."""
-    params = {"email_id": email_id}
-    try:
-        res = requests.get(f"{API_BASE}/summary/top-categories", params=params)
-        if res.status_code == 200:
-            try:
-                data = res.json()
-                if isinstance(data, list):
-                    return data
-                elif isinstance(data, dict) and "top_categories" in data:
-                    return data["top_categories"]
-                else:
-                    return []
-            except Exception as e:
-                st.error(f"⚠ Error parsing top categories: {e}")
-                return []
-        else:
-            st.warning(f"⚠ Could not fetch top categories (status {res.status_code})")
-            return []
-    except Exception as e:
-        st.error(f"⚠ Could not load top categories: {e}")
-        return []
+    return get_dashboard("top_categories").get("top_categories", [])
 
 
 # def get_summary_by_category(email_id):
@@ -245,37 +270,9 @@ def get_top_categories(email_id):
 #     except Exception as e:
 #         st.error(f"⚠ Could not load category summary: {e}")
 #         return []
-def get_summary_by_category(email_id):
+def get_summary_by_category():
     """Fetch summary of expenses grouped by category."""
-    params = {"email_id": email_id}
-    try:
-        res = requests.get(f"{API_BASE}/summary/by-category", params=params)
-        if res.status_code == 200:
-            try:
-                data = res.json()
-                # Handle different possible formats
-                if isinstance(data, list):
-                    return data
-                elif isinstance(data, dict):
-                    # If backend returns category_summary key
-                    if "category_summary" in data and isinstance(data["category_summary"], list):
-                        return data["category_summary"]
-                    # If backend returns categories as keys with spent amounts
-                    elif all(isinstance(v, (int, float)) for v in data.values()):
-                        return [{"category": k, "spent": v} for k, v in data.items()]
-                    else:
-                        return []
-                else:
-                    return []
-            except Exception as e:
-                st.error(f"⚠ Error parsing category summary: {e}")
-                return []
-        else:
-            st.warning(f"⚠ Could not fetch category summary (status {res.status_code})")
-            return []
-    except Exception as e:
-        st.error(f"⚠ Could not load category summary: {e}")
-        return []
+    return get_dashboard("by_category").get("by_category", [])
 
 
 # def add_category(name):
@@ -290,7 +287,7 @@ def get_summary_by_category(email_id):
 def add_category(name):
     payload = {"name": name}
     try:
-        res = requests.post(f"{API_BASE}/categories/", json=payload)
+        res = api.post("/categories/", json=payload, invalidates=api.CATEGORY_PATHS)
         if res.status_code in [200, 201]:
             return True, f"Category '{name}' added successfully!"
         else:
@@ -307,7 +304,7 @@ def add_category(name):
 def update_category(category_id: str, updated_data: dict):
     """Update a category name."""
     try:
-        resp = requests.put(f"{API_BASE}/categories/{category_id}", json=updated_data)
+        resp = api.put(f"/categories/{category_id}", json=updated_data, invalidates=api.CATEGORY_PATHS)
         resp.raise_for_status()
         return resp.json()
     except requests.exceptions.RequestException as e:
@@ -316,7 +313,7 @@ def update_category(category_id: str, updated_data: dict):
 def delete_category(category_id: str):
     """Delete a category by ID."""
     try:
-        resp = requests.delete(f"{API_BASE}/categories/{category_id}")
+        resp = api.delete(f"/categories/{category_id}", invalidates=api.CATEGORY_PATHS)
         resp.raise_for_status()
         return resp.json()
     except requests.exceptions.RequestException as e:
@@ -326,8 +323,8 @@ def delete_category(category_id: str):
 # EXPENSE HELPERS
 # =====================
  
-def get_expenses(email_id, start_date=None, end_date=None, category=None):
-    params = {"email_id": email_id}
+def get_expenses(start_date=None, end_date=None, category=None):
+    params = {}
     if start_date:
         params["start"] = start_date
     if end_date:
@@ -336,7 +333,7 @@ def get_expenses(email_id, start_date=None, end_date=None, category=None):
         params["category"] = category
 
     try:
-        res = requests.get(f"{API_BASE}/expenses/", params=params)
+        res = api.get("/expenses/", params=params, ttl=api.TTL_USER)
         if res.status_code == 200:
             data = res.json()
             expenses = data.get("expenses", [])
@@ -349,20 +346,58 @@ def get_expenses(email_id, start_date=None, end_date=None, category=None):
         st.error(f"⚠ Error connecting to backend: {e}")
         return [], {"total_funds": 0, "spent": 0, "balance": 0}
 
-def add_expense(email_id, amount, category, date, description=""):
+def search_expenses(filters, cursor=None, limit=20):
+    """Fetch one page of expenses matching `filters` from /expenses/search."""
+    params = {"limit": limit}
+    params.update({k: v for k, v in filters.items() if v not in (None, "")})
+    if cursor:
+        params["cursor"] = cursor
+    try:
+        res = api.get("/expenses/search", params=params, ttl=api.TTL_USER)
+        if res.status_code == 200:
+            data = res.json()
+            return data.get("expenses", []), data.get("next_cursor")
+        st.warning(f"⚠ Could not search expenses: {res.json().get('detail', res.text)}")
+    except Exception as e:
+        st.error(f"⚠ Error connecting to backend: {e}")
+    return [], None
+
+EXPORT_MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def export_expenses(start_date=None, end_date=None, category=None, export_format="csv"):
+    """Download an expense export file from the backend."""
+    params = {"format": export_format}
+    if start_date:
+        params["start"] = start_date
+    if end_date:
+        params["end"] = end_date
+    if category:
+        params["category"] = category
+    try:
+        res = api.get("/expenses/export", params=params)
+        if res.status_code == 200:
+            return res.content, None
+        return None, res.json().get("detail", res.text)
+    except Exception as e:
+        return None, str(e)
+
+def add_expense(amount, category, date, description=""):
     """Add a new expense entry."""
     payload = {
         "amount": amount,
         "category": category,
         "date": date,
         "description": description or "",
-        "email_id": email_id,
     }
     try:
-        res = requests.post(
-            f"{API_BASE}/expenses/",
-            params={"email_id": email_id},
-            json=payload
+        res = api.post(
+            "/expenses/",
+            json=payload,
+            invalidates=api.EXPENSE_PATHS
         )
         if res.status_code in [200, 201]:
             return True, res.json() if res.content else {"message": "Expense added."}
@@ -371,13 +406,13 @@ def add_expense(email_id, amount, category, date, description=""):
     except Exception as e:
         return False, {"error": f"⚠ Error connecting to backend: {e}"}
 
-def update_expense(expense_id: str, updated_data: dict, email_id: str):
+def update_expense(expense_id: str, updated_data: dict):
     """Update an existing expense by ID."""
     try:
-        res = requests.put(
-            f"{API_BASE}/update/expenses/{expense_id}",
-            params={"email_id": email_id},
-            json=updated_data
+        res = api.put(
+            f"/update/expenses/{expense_id}",
+            json=updated_data,
+            invalidates=api.EXPENSE_PATHS
         )
         if res.status_code == 200:
             return res.json()
@@ -385,18 +420,39 @@ def update_expense(expense_id: str, updated_data: dict, email_id: str):
     except Exception as e:
         return {"error": f"⚠ Error updating expense: {e}"}
 
-def get_monthly_summary(email_id):
-    params = {"email_id": email_id}
+def get_monthly_summary():
+    data = get_dashboard("monthly_summary,funds")
+    return {
+        "monthly_summary": data.get("monthly_summary", []),
+        "funds": data.get("funds", {"total_funds": 0, "spent": 0, "balance": 0})
+    }
+
+def get_dashboard(sections):
+    """Fetch several dashboard datasets (funds, summaries, categories...) in one call."""
+    params = {"include": sections}
     try:
-        res = requests.get(f"{API_BASE}/summary/monthly", params=params)
+        res = api.get("/dashboard", params=params, ttl=api.TTL_USER)
         if res.status_code == 200:
             return res.json()
+        st.warning(f"⚠ Could not load dashboard (status {res.status_code})")
+    except Exception as e:
+        st.error(f"⚠ Could not load dashboard: {e}")
+    return {}
+
+
+def set_category_allocations(allocations):
+    """Replace the user's per-category allocations."""
+    try:
+        res = api.put(
+            "/funds/categories",
+            json={"allocations": allocations},
+            invalidates=api.FUND_PATHS
+        )
+        if res.status_code == 200:
+            return True, None
+        return False, res.json().get("detail", res.text)
     except Exception as e:
-        st.error(f"⚠ Could not load monthly summary: {e}")
-    # return []
-    # Always return dict with same structure
-    # return {"monthly_summary": [], "funds": {}}
-    return {"monthly_summary": [], "funds": {"total_funds": 0, "spent": 0, "balance": 0}}
+        return False, str(e)
 
 
 # =========================
@@ -435,13 +491,12 @@ if not st.session_state.authenticated:
         last_name = st.text_input("Last Name")
         email = st.text_input("Email")
         password = st.text_input("Password", type="password")
-        role_name = st.selectbox("Role", ["User", "Admin"])
 
         if st.button("Register"):
             if not first_name or not last_name or not email or not password:
                 st.warning("Please fill in all required fields.")
             else:
-                success, message = register_user(first_name, middle_name, last_name, email, password, role_name)
+                success, message = register_user(first_name, middle_name, last_name, email, password)
                 if success:
                     st.success("✅ Registration successful! Please login.")
                     st.session_state.auth_mode = "login"
@@ -460,6 +515,8 @@ else:
     st.title("💰 Daily Expense Tracker")
     st.sidebar.write(f"👋 Welcome, {st.session_state.user.get('first_name', '')}!")
     if st.sidebar.button("🚪 Logout"):
+        api.clear()
+        api.clear_tokens()
         st.session_state.authenticated = False
         st.session_state.user = {}
         st.session_state.email_id = None
@@ -490,8 +547,10 @@ else:
             "✏️ Update My Expense"
         ]
 
-    tab_objects = st.tabs(tabs_to_show)
-    tab_mapping = {tabs_to_show[i]: tab_objects[i] for i in range(len(tabs_to_show))}
+    # Only the selected view is rendered, so only its data gets fetched
+    # (st.tabs would run every tab body on every rerun)
+    active_view = st.sidebar.radio("📑 Go to", tabs_to_show, key=f"active_view_{role}")
+    tab_mapping = {active_view: st.container()}
     if role=="admin":
         # ------------------------
         # Admin only: View Categories
@@ -514,7 +573,7 @@ else:
         if "👥 View Users" in tab_mapping:  
             with tab_mapping["👥 View Users"]:    
                 st.subheader("👥 All Registered Users")  
-                users = get_all_users()
+                users = user_search_page("view_users")
                 if users:
                     st.dataframe(pd.DataFrame(users))
                 else:
@@ -525,22 +584,19 @@ else:
         if "✏️ Update User" in tab_mapping:
             with tab_mapping["✏️ Update User"]:
                 st.subheader("✏️ Update User")
-                users = get_all_users()
+                users = user_search_page("update_user")
                 # st.write(users)
                 if users:
-                    user_df = pd.DataFrame(users)
-                    # Build mapping: display label -> user_id
-                    user_options = {
-                    f"{row['first_name']} {row.get('last_name', '')} ({row['email_id']})": row["id"]
-                    for _, row in user_df.iterrows()
+                    users_by_id = {u["id"]: u for u in users}
+                    # Build mapping: user_id -> display label (name + email)
+                    user_labels = {
+                        u["id"]: f"{u.get('first_name', '')} {u.get('last_name', '') or ''} ({u.get('email_id', '')})"
+                        for u in users
                     }
-                    # # Select user
-                    # selected_user_id = st.selectbox("Select User to Update", user_df["id"])
                     # Dropdown with name + email shown, id stored
-                    selected_label = st.selectbox("Select User to Update", list(user_options.keys()))
-                    selected_user_id = user_options[selected_label]
+                    selected_user_id = st.selectbox("Select User to Update", list(user_labels), format_func=user_labels.get)
                     # Get selected user data
-                    selected_user_data = user_df[user_df["id"] == selected_user_id].iloc[0].to_dict()
+                    selected_user_data = users_by_id[selected_user_id]
                     # Input fields with correct dict access
                     first_name = st.text_input("First Name", selected_user_data.get("first_name", ""))
                     middle_name = st.text_input("Middle Name", selected_user_data.get("middle_name", ""))
@@ -586,40 +642,33 @@ else:
             with tab_mapping["❌ Delete User"]:
                 st.subheader("❌ Delete User")
 
-                users = get_all_users()
+                users = user_search_page("delete_user")
                 if users:
-                    user_df = pd.DataFrame(users)
-
                     # Remove the currently logged-in user (prevent self-deletion)
-                    if "email_id" in st.session_state:
-                        user_df = user_df[user_df["email_id"] != st.session_state["email_id"]]
-                    
-                    if not user_df.empty:
-                        # Create display label: "Full Name (Email)"
-                        # user_df["label"] = user_df["first_name"] + " (" + user_df["email_id"] + ")"
-                        user_df["label"] = (user_df["first_name"] + " " + user_df["last_name"] + " (" + user_df["email_id"] + ")")
-                    
-                        # Sort alphabetically by display name
-                        user_df = user_df.sort_values(by="label")
-
-                        # Create mapping from label -> id
-                        label_to_id = dict(zip(user_df["label"], user_df["id"]))
-
-                        # Show selectbox with labels
-                        selected_label = st.selectbox("Select User to Delete", user_df["label"])
+                    current_email = (st.session_state.get("email_id") or "").lower()
+                    users = [u for u in users if (u.get("email_id") or "").lower() != current_email]
+
+                    if users:
+                        # Display label "Full Name (Email)" per id, sorted by name
+                        user_labels = {
+                            u["id"]: f"{u.get('first_name', '')} {u.get('last_name', '') or ''} ({u.get('email_id', '')})"
+                            for u in sorted(users, key=lambda u: (u.get("first_name") or "", u.get("last_name") or ""))
+                        }
 
-                        # Get the selected user_id
-                        selected_user_id = label_to_id[selected_label]
+                        # Show selectbox with labels, id stored
+                        selected_user_id = st.selectbox("Select User to Delete", list(user_labels), format_func=user_labels.get)
 
                         if st.button("Delete User"):
                             resp = delete_user(selected_user_id)
 
                             if "error" not in resp:
                                 st.success("✅ User deleted successfully!")
+                                if resp.get("job_id"):
+                                    st.caption(f"🧹 Their expenses and funds are being removed in the background (job {resp['job_id']}, see /jobs/{resp['job_id']}).")
                             else:
                                 st.error(f"⚠ {resp['error']}")
                     else:
-                        st.error(f"⚠ {resp['error']}")            
+                        st.info("No other users on this page.")
                 else:
                     st.warning("No users found to delete.")
                     
@@ -717,7 +766,7 @@ else:
         if "💵 Manage Funds" in tab_mapping:
             with tab_mapping["💵 Manage Funds"]:
                 st.subheader("💵 Manage Your Funds")
-                user_funds = get_user_funds(st.session_state.email_id)
+                user_funds = get_user_funds()
 
                 col1, col2, col3 = st.columns(3)
                 col1.metric("💰 Total Funds", f"₹{user_funds.get('total_funds', 0):.2f}")
@@ -733,7 +782,7 @@ else:
                         if new_funds <= 0:
                             st.warning("⚠ Enter a positive amount to add.")
                         else:
-                            if add_user_funds(st.session_state.email_id, new_funds):
+                            if add_user_funds(new_funds):
                                 st.success(f"✅ ₹{new_funds:.2f} added successfully!")
                                 st.rerun()
                             else:
@@ -743,42 +792,48 @@ else:
             with tab_mapping["💳 Category Funds Overview"]:
                 st.subheader("💳 Category-Wise Funds Overview")
 
-                # 1️⃣ Fetch expenses and funds
-                all_expenses, funds = get_expenses(st.session_state.email_id)  # now returns (expenses, funds)
-                categories = get_categories()
-                category_names = [cat["name"] for cat in categories] if categories else []
+                # 1️⃣ Allocated / spent / remaining per category, computed server-side
+                overview = get_dashboard("category_funds").get("category_funds", {})
+                rows = overview.get("categories", [])
 
-                if not category_names:
+                if not rows:
                     st.warning("No categories available. Add categories first.")
                 else:
-                    # 2️⃣ Aggregate spent per category
-                    spent_per_category = {cat: 0 for cat in category_names}
-                    if all_expenses and isinstance(all_expenses, list):
-                        for exp in all_expenses:
-                            if isinstance(exp, dict):
-                                cat = exp.get("category")
-                                amt = exp.get("amount", 0)
-                                if cat in spent_per_category:
-                                    spent_per_category[cat] += amt
-
-                    # 3️⃣ Display allocated funds per category
-                    st.info(f"💰 Total Funds: ₹{funds.get('total_funds', 0):.2f}")
-                    st.info(f"💸 Total Spent: ₹{funds.get('spent', 0):.2f}")
-                    st.info(f"💵 Balance: ₹{funds.get('balance', 0):.2f}")
-
-                    # 4️⃣ Build a dataframe
-                    df_cat = pd.DataFrame({
-                        "Category": category_names,
-                        "Spent": [spent_per_category[cat] for cat in category_names],
+                    # 2️⃣ Totals
+                    st.info(f"💰 Total Funds: ₹{overview.get('total_funds', 0):.2f}")
+                    st.info(f"💸 Total Spent: ₹{overview.get('spent', 0):.2f}")
+                    st.info(f"💵 Balance: ₹{overview.get('balance', 0):.2f}")
+
+                    # 3️⃣ The returned rows are the table; nothing is recomputed here
+                    df_cat = pd.DataFrame(rows).rename(columns={
+                        "category": "Category", "allocated": "Allocated", "spent": "Spent",
+                        "remaining": "Remaining", "explicit": "Custom Allocation"
                     })
-                    df_cat["Remaining"] = df_cat["Spent"].apply(
-                        lambda x: max(funds.get("total_funds", 0) / len(category_names) - x, 0)
-                    )
                     st.dataframe(df_cat)
 
-                    # 5️⃣ Visualize category-wise spending
+                    # 4️⃣ Visualize category-wise spending
                     st.bar_chart(df_cat.set_index("Category")[["Spent", "Remaining"]])
 
+                    # 5️⃣ Edit per-category allocations (blank = share the rest evenly)
+                    with st.expander("🎯 Set category allocations"):
+                        edited = st.data_editor(
+                            df_cat.loc[:, ["Category", "Allocated"]].assign(
+                                Allocated=df_cat["Allocated"].where(df_cat["Custom Allocation"])
+                            ),
+                            disabled=["Category"],
+                            hide_index=True,
+                            key="allocation_editor"
+                        )
+                        st.caption(f"Unallocated funds shared evenly: ₹{overview.get('unallocated', 0):.2f}")
+                        if st.button("Save Allocations"):
+                            allocations = edited.dropna(subset=["Allocated"]).set_index("Category")["Allocated"].to_dict()
+                            ok, msg = set_category_allocations(allocations)
+                            if ok:
+                                st.success("✅ Allocations saved")
+                                st.rerun()
+                            else:
+                                st.error(f"❌ {msg}")
+
         # ------------------------
         # View & Filter Expenses
         # ------------------------
@@ -797,7 +852,6 @@ else:
                     category_filter = None
 
                 expenses, funds = get_expenses(
-                    st.session_state.email_id,
                     str(start_date),
                     str(end_date),
                     category_filter
@@ -812,6 +866,23 @@ else:
                 else:
                     st.info("No expenses found.")
 
+                # ⬇️ Server-side export with the same filters (streamed from Mongo)
+                col1, col2 = st.columns([1, 3])
+                export_format = col1.selectbox("Export format", ["csv", "xlsx", "parquet"])
+                if col2.button("📦 Prepare export"):
+                    content, error = export_expenses(
+                        str(start_date), str(end_date), category_filter, export_format
+                    )
+                    if error:
+                        st.error(f"⚠ {error}")
+                    else:
+                        st.download_button(
+                            "⬇️ Download",
+                            data=content,
+                            file_name=f"expenses.{export_format}",
+                            mime=EXPORT_MIME_TYPES[export_format]
+                        )
+
 
         # ------------------------
         # Add Expenses
@@ -819,12 +890,13 @@ else:
         if "➕ Add Expenses" in tab_mapping:
             with tab_mapping["➕ Add Expenses"]:
                 st.subheader("➕ Add New Expense")
-                categories = get_categories()
+                dashboard = get_dashboard("categories,funds")
+                categories = dashboard.get("categories", [])
                 category_names = [cat["name"] for cat in categories] if categories else []
                 
-                # user_funds = get_user_funds(st.session_state.email_id)
+                # user_funds = get_user_funds()
                 # balance = user_funds.get("balance", 0)
-                user_funds: dict = get_user_funds(st.session_state.email_id)
+                user_funds: dict = dashboard.get("funds", {})
                 balance: float = float(user_funds.get("balance", 0) or 0)
 
                 st.info(f"💵 Available Balance: ₹{balance:.2f}")
@@ -845,7 +917,7 @@ else:
                         elif category_name == "No categories available":
                             st.warning("⚠ Please add categories first.")
                         else:
-                            if add_expense(st.session_state.email_id, amount, category_name, date.strftime("%Y-%m-%d"), description):
+                            if add_expense(amount, category_name, date.strftime("%Y-%m-%d"), description):
                                 st.success(f"✅ Expense of ₹{amount:.2f} added successfully!")
                             else:
                                 st.error("⚠ Could not add expense.")
@@ -856,7 +928,7 @@ else:
         # if "📅 Monthly Summary" in tab_mapping:s
         #     with tab_mapping["📅 Monthly Summary"]:
         #         st.subheader("📅 Monthly Expense Summary")
-        #         monthly_data = get_monthly_summary(st.session_state.email_id)
+        #         monthly_data = get_monthly_summary()
                 
         #         if monthly_data:
         #             df_monthly = pd.DataFrame(monthly_data)
@@ -876,7 +948,7 @@ else:
             with tab_mapping["📅 Monthly Summary"]:
                 st.subheader("📅 Monthly Expense Summary")
 
-                monthly_data = get_monthly_summary(st.session_state.email_id)
+                monthly_data = get_monthly_summary()
 
                 if monthly_data:
                     # ------------------------
@@ -911,7 +983,7 @@ else:
         if "🏆 Top Categories" in tab_mapping:
             with tab_mapping["🏆 Top Categories"]:
                 st.subheader("🏆 Top Spending Categories")
-                top_cats = get_top_categories(st.session_state.email_id)
+                top_cats = get_top_categories()
 
                 if not top_cats:
                     st.warning("No top categories data found.")
@@ -940,7 +1012,7 @@ else:
     #     if "📊 Summary by Category" in tab_mapping:
     #         with tab_mapping["📊 Summary by Category"]:
     #             st.subheader("📊 Expense Summary by Category")
-    #             summary_data = get_summary_by_category(st.session_state.email_id)
+    #             summary_data = get_summary_by_category()
     #             if summary_data:
     #                 df_summary = pd.DataFrame(summary_data)
     #                 if 'category' in df_summary.columns:
@@ -956,7 +1028,7 @@ else:
         if "📊 Summary by Category" in tab_mapping:
             with tab_mapping["📊 Summary by Category"]:
                 st.subheader("📊 Expense Summary by Category")
-                summary_data = get_summary_by_category(st.session_state.email_id)
+                summary_data = get_summary_by_category()
 
                 if summary_data:
                     df_summary = pd.DataFrame(summary_data)
@@ -984,81 +1056,123 @@ else:
             with tab_mapping["✏️ Update My Expense"]:
                 st.subheader("✏️ Update My Expense")
 
-                # Fetch user's expenses (unpack expenses and funds)
-                expenses, _ = get_expenses(st.session_state.email_id)
-
-                if expenses and isinstance(expenses, list):
-                    # Convert to DataFrame safely
-                    expense_df = pd.DataFrame(expenses)
-
-                    if not expense_df.empty:
-                        # Select expense to update
-                        selected_expense_id = st.selectbox(
-                            "Select Expense to Update",
-                            expense_df["id"],
-                            # format_func=lambda x: f"{expense_df.loc[expense_df['id'] == x, 'category'].values[0]} | ₹{expense_df.loc[expense_df['id'] == x, 'amount'].values[0]} | {expense_df.loc[expense_df['id'] == x, 'date'].values[0]}"
-                            format_func=lambda x: (
-                            f"{expense_df.loc[expense_df['id'] == x].iloc[0]['category']} | "
-                            f"₹{expense_df.loc[expense_df['id'] == x].iloc[0]['amount']} | "
-                            f"{expense_df.loc[expense_df['id'] == x].iloc[0]['date']}")
-                        )
+                # Search filters: only one page of matches is fetched at a time
+                categories = get_categories()
+                category_names = [cat["name"] for cat in categories] if categories else []
 
-                        selected_expense = expense_df.loc[expense_df["id"] == selected_expense_id].iloc[0]
+                f1, f2, f3 = st.columns(3)
+                search_text = f1.text_input("Description contains", key="pick_q")
+                search_category = f2.selectbox("Category", ["All"] + category_names, key="pick_category")
+                use_dates = f3.checkbox("Filter by date", key="pick_use_dates")
+                a1, a2 = st.columns(2)
+                min_amount = a1.number_input("Min amount", min_value=0.0, value=0.0, format="%.2f", key="pick_min")
+                max_amount = a2.number_input("Max amount (0 = no limit)", min_value=0.0, value=0.0, format="%.2f", key="pick_max")
+
+                filters = {
+                    "q": search_text.strip() or None,
+                    "category": None if search_category == "All" else search_category,
+                    "min_amount": min_amount or None,
+                    "max_amount": max_amount or None,
+                }
+                if use_dates:
+                    d1, d2 = st.columns(2)
+                    filters["start"] = d1.date_input("From", key="pick_start").strftime("%Y-%m-%d")
+                    filters["end"] = d2.date_input("To", key="pick_end").strftime("%Y-%m-%d")
+
+                # Cursor stack for paging; reset whenever the filters change
+                filter_key = tuple(sorted(filters.items()))
+                if st.session_state.get("pick_filter_key") != filter_key:
+                    st.session_state.pick_filter_key = filter_key
+                    st.session_state.pick_cursors = [None]
+                cursors = st.session_state.pick_cursors
+
+                expenses, next_cursor = search_expenses(filters, cursor=cursors[-1])
+
+                p1, p2, p3 = st.columns([1, 2, 1])
+                if p1.button("⬅ Previous", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+                p2.caption(f"Page {len(cursors)}")
+                if p3.button("Next ➡", disabled=not next_cursor):
+                    cursors.append(next_cursor)
+                    st.rerun()
 
-                        # Input fields to update
-                        col1, col2 = st.columns(2)
-                        new_amount = col1.number_input(
-                            "Amount",
-                            value=float(selected_expense.get("amount", 0.0)),
-                            min_value=0.0,
-                            format="%.2f"
-                        )
+                if expenses:
+                    # Labels and lookups are built once per page, not per option render
+                    expenses_by_id = {exp["id"]: exp for exp in expenses}
+                    labels = {
+                        exp["id"]: f"{exp.get('category')} | ₹{exp.get('amount')} | {exp.get('date')} | {exp.get('description') or ''}"
+                        for exp in expenses
+                    }
+                    selected_expense_id = st.selectbox(
+                        "Select Expense to Update",
+                        list(labels),
+                        format_func=labels.get
+                    )
 
-                        categories = get_categories()
-                        category_names = [cat["name"] for cat in categories] if categories else []
-                        new_category = col2.selectbox(
-                            "Category",
-                            category_names,
-                            index=category_names.index(selected_expense.get("category", category_names[0])) if selected_expense.get("category") in category_names else 0
-                        )
+                    selected_expense = expenses_by_id[selected_expense_id]
 
-                        new_date = st.date_input(
-                            "Date",
-                            value=pd.to_datetime(selected_expense.get("date", pd.Timestamp.today())).date()
-                        )
+                    # Input fields to update
+                    col1, col2 = st.columns(2)
+                    new_amount = col1.number_input(
+                        "Amount",
+                        value=float(selected_expense.get("amount", 0.0)),
+                        min_value=0.0,
+                        format="%.2f"
+                    )
 
-                        new_description = st.text_area(
-                            "Description",
-                            value=selected_expense.get("description", "")
-                        )
+                    new_category = col2.selectbox(
+                        "Category",
+                        category_names,
+                        index=category_names.index(selected_expense.get("category", category_names[0])) if selected_expense.get("category") in category_names else 0
+                    )
 
-                        # Update button
-                        if st.button("Update Expense ✅"):
-                            if not st.session_state.email_id:
-                                st.error("⚠ You are not logged in!")
-                            else:
-                                updated_data = {
-                                    "amount": new_amount,
-                                    "category": new_category,
-                                    "date": new_date.strftime("%Y-%m-%d"),
-                                    "description": new_description
-                                }
-
-                                try:
-                                    res = requests.put(
-                                        f"{API_BASE}/update/expenses/{selected_expense_id}",
-                                        params={"email_id": st.session_state.email_id},
-                                        json=updated_data
-                                    )
-
-                                    if res.status_code == 200:
-                                        st.success("✅ Expense updated successfully!")
-                                    else:
-                                        st.error(f"❌ Failed: {res.json().get('detail', res.text)}")
-                                except Exception as e:
-                                    st.error(f"⚠ Error updating expense: {e}")
-                    else:
-                        st.info("No expenses found to update.")
+                    new_date = st.date_input(
+                        "Date",
+                        value=pd.to_datetime(selected_expense.get("date", pd.Timestamp.today())).date()
+                    )
+
+                    new_description = st.text_area(
+                        "Description",
+                        value=selected_expense.get("description", "")
+                    )
+
+                    # Update button
+                    if st.button("Update Expense ✅"):
+                        if not st.session_state.email_id:
+                            st.error("⚠ You are not logged in!")
+                        else:
+                            updated_data = {
+                                "amount": new_amount,
+                                "category": new_category,
+                                "date": new_date.strftime("%Y-%m-%d"),
+                                "description": new_description
+                            }
+
+                            try:
+                                res = api.put(
+                                    f"/update/expenses/{selected_expense_id}",
+                                    json=updated_data,
+                                    invalidates=api.EXPENSE_PATHS
+                                )
+
+                                if res.status_code == 200:
+                                    st.success("✅ Expense updated successfully!")
+                                else:
+                                    st.error(f"❌ Failed: {res.json().get('detail', res.text)}")
+                            except Exception as e:
+                                st.error(f"⚠ Error updating expense: {e}")
                 else:
-                    st.info("No expenses found to update.")
+                    st.info("No expenses match these filters.")
 
+# =========================
+# BACKEND CALL INSTRUMENTATION
+# =========================
+rerun_stats = api.rerun_report()
+with st.sidebar.expander("🔌 Backend calls (this rerun)"):
+    st.write(
+        f"{rerun_stats['network_calls']} request(s), {rerun_stats['cache_hits']} cache hit(s), "
+        f"{rerun_stats['network_ms']} ms"
+    )
+    if rerun_stats["calls"]:
+        st.dataframe(pd.DataFrame(rerun_stats["calls"]))
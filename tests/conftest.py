@@ -0,0 +1,44 @@
+"""
+Shared fixtures. The application modules live at the repository root and
+read their settings from the environment at import, so both are set up
+here before any test module imports them.
+"""
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No server needed: Mongo-side comparisons run on mongomock when it is installed
+if importlib.util.find_spec("mongomock"):
+    os.environ.setdefault("MONGO_URI", "mongomock://")
+os.environ.setdefault("MONGO_DB_NAME", "ExpenseTests")
+os.environ.setdefault("CACHE_BACKEND", "none")
+os.environ.setdefault("RUN_MIGRATIONS_ON_STARTUP", "0")
+
+import pytest
+
+
+@pytest.fixture
+def sqlite_repo():
+    """A fresh embedded repository (its own temp database) per test."""
+    from sqlite_repository import SQLiteRepository
+
+    repo = SQLiteRepository(":memory:")
+    repo.setup()
+    return repo
+
+
+@pytest.fixture
+def mongo_repo():
+    """The Mongo repository on mongomock, emptied first; skipped without mongomock."""
+    pytest.importorskip("mongomock")
+    import settings
+    if not settings.MONGO_URI.startswith("mongomock://"):
+        pytest.skip("MONGO_URI points at a real server")
+    from database import db
+    from repository import MongoRepository
+
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+    return MongoRepository()
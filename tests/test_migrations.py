@@ -0,0 +1,67 @@
+"""
+The migration runner on mongomock: every worker runs it at startup, so
+losing the race for a version must be a no-op rather than a crash. The
+real migrations need a server ($merge), so these run stand-in steps.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def steps(mongo_repo, monkeypatch):
+    """Three recording migrations in place of the real ones; yields the call log."""
+    import migrations
+
+    calls = []
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        (version, f"step {version}", lambda version=version: calls.append(version)) for version in (1, 2, 3)
+    ])
+    return calls
+
+
+def test_run_migrations_records_every_version(steps):
+    from database import migrations_collection
+    from migrations import run_migrations, applied_versions
+
+    assert run_migrations() == [1, 2, 3]
+    assert applied_versions() == {1, 2, 3}
+    assert migrations_collection.count_documents({"status": "running"}) == 0
+    assert run_migrations() == []
+    assert steps == [1, 2, 3]
+
+
+def test_version_claimed_by_another_runner_is_left_alone(steps):
+    from database import migrations_collection
+    from migrations import run_migrations, applied_versions
+
+    migrations_collection.insert_one({"_id": 1, "description": "step 1", "applied_at": datetime.utcnow()})
+    migrations_collection.insert_one({"_id": 2, "status": "running", "started_at": datetime.utcnow()})
+
+    assert run_migrations() == []
+    assert steps == []
+    assert applied_versions() == {1}
+    assert migrations_collection.find_one({"_id": 2})["status"] == "running"
+
+
+def test_stale_claim_is_taken_over(steps):
+    from database import migrations_collection
+    from migrations import run_migrations
+
+    migrations_collection.insert_one({"_id": 1, "status": "running", "started_at": datetime.utcnow() - timedelta(days=1)})
+
+    assert run_migrations() == [1, 2, 3]
+    assert migrations_collection.find_one({"_id": 1})["status"] == "applied"
+
+
+def test_failed_migration_releases_its_claim(mongo_repo, monkeypatch):
+    import migrations
+    from database import migrations_collection
+
+    def broken():
+        raise RuntimeError("index build failed")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [(1, "broken", broken)])
+    with pytest.raises(RuntimeError):
+        migrations.run_migrations()
+    assert migrations_collection.find_one({"_id": 1}) is None
@@ -0,0 +1,350 @@
+"""
+The embedded SQLite backend against the repository contract the routers
+rely on (see repository.py): ledger guards, keyset paging, the GROUP BY
+summaries (same output as the Mongo rollups) and the inline cascades.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from pagination import encode_cursor, encode_key_cursor
+from repository import DuplicateError
+
+EMAIL = "ann@example.com"
+OTHER = "bob@example.com"
+
+
+def expense(amount, category="Food", date=datetime(2024, 3, 10), description="", email_id=EMAIL):
+    return {
+        "email_id": email_id,
+        "amount": amount,
+        "category": category,
+        "date": date,
+        "description": description,
+        "created_at": datetime(2024, 3, 10),
+        "updated_at": datetime(2024, 3, 10),
+    }
+
+
+# A spread over months and categories with distinct totals, so ordering is unambiguous
+SAMPLE = [
+    expense(120.0, "Rent", datetime(2024, 1, 1)),
+    expense(15.5, "Food", datetime(2024, 1, 12)),
+    expense(40.0, "Travel", datetime(2024, 2, 3)),
+    expense(9.25, "Food", datetime(2024, 2, 20)),
+    expense(120.0, "Rent", datetime(2024, 3, 1)),
+    expense(22.0, "Food", datetime(2024, 3, 5)),
+]
+
+
+# =========================
+# LEDGER GUARDS
+# =========================
+def test_allocations_accumulate(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+    sqlite_repo.funds.allocate(EMAIL, 50)
+
+    fund = sqlite_repo.funds.get(EMAIL)
+    assert (fund["total_funds"], fund["spent"], fund["balance"]) == (150, 0, 150)
+    assert fund["version"] == 2
+
+
+def test_adjust_spent_rejects_overspend(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+
+    assert sqlite_repo.funds.adjust_spent(EMAIL, 60)["balance"] == 40
+    assert sqlite_repo.funds.adjust_spent(EMAIL, 40.01) is None
+    fund = sqlite_repo.funds.adjust_spent(EMAIL, 40)
+    assert (fund["spent"], fund["balance"]) == (100, 0)
+
+
+def test_release_cannot_drive_spent_negative(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+    sqlite_repo.funds.adjust_spent(EMAIL, 30)
+
+    assert sqlite_repo.funds.adjust_spent(EMAIL, -31) is None
+    assert sqlite_repo.funds.adjust_spent(EMAIL, -30)["spent"] == 0
+
+
+def test_adjust_spent_without_funds_record(sqlite_repo):
+    assert sqlite_repo.funds.adjust_spent(EMAIL, 1) is None
+
+
+def test_set_total_checks_expected_version(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+    version = sqlite_repo.funds.get(EMAIL)["version"]
+
+    assert not sqlite_repo.funds.set_total(EMAIL, 200, expected_version=version - 1)
+    assert sqlite_repo.funds.set_total(EMAIL, 200, expected_version=version)
+    assert sqlite_repo.funds.get(EMAIL)["balance"] == 200
+    assert not sqlite_repo.funds.set_total(OTHER, 10)
+
+
+def test_set_total_never_drops_below_spent(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+    sqlite_repo.funds.adjust_spent(EMAIL, 60)
+
+    assert not sqlite_repo.funds.set_total(EMAIL, 59)
+    assert sqlite_repo.funds.set_total(EMAIL, 60)
+    fund = sqlite_repo.funds.get(EMAIL)
+    assert (fund["total_funds"], fund["spent"], fund["balance"]) == (60, 60, 0)
+
+
+def test_recompute_caps_spent_at_total(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+
+    fund = sqlite_repo.funds.recompute(EMAIL, 130)
+    assert (fund["spent"], fund["balance"]) == (100, 0)
+    fund = sqlite_repo.funds.recompute(EMAIL, 25)
+    assert (fund["spent"], fund["balance"]) == (25, 75)
+
+
+def test_failed_transaction_rolls_back_expense_and_ledger(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 100)
+
+    def write(session):
+        sqlite_repo.funds.adjust_spent(EMAIL, 10, session)
+        sqlite_repo.expenses.insert(expense(10.0), session)
+        raise RuntimeError("insert failed")
+
+    with pytest.raises(RuntimeError):
+        sqlite_repo.run_in_transaction(write)
+    assert sqlite_repo.funds.get(EMAIL)["spent"] == 0
+    assert list(sqlite_repo.expenses.find(EMAIL)) == []
+
+
+def test_concurrent_reservations_never_overspend(sqlite_repo):
+    sqlite_repo.funds.allocate(EMAIL, 50)
+
+    def reserve(_):
+        def write(session):
+            if not sqlite_repo.funds.adjust_spent(EMAIL, 1, session):
+                return False
+            sqlite_repo.expenses.insert(expense(1.0), session)
+            return True
+        return sqlite_repo.run_in_transaction(write)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        accepted = sum(pool.map(reserve, range(200)))
+
+    fund = sqlite_repo.funds.get(EMAIL)
+    assert accepted == 50
+    assert (fund["spent"], fund["balance"]) == (50, 0)
+    assert sqlite_repo.expenses.spent_by_user(EMAIL) == {EMAIL: 50}
+
+
+# =========================
+# EXPENSES AND KEYSET PAGING
+# =========================
+def test_find_returns_mongo_shaped_documents(sqlite_repo):
+    doc = sqlite_repo.expenses.insert(expense(12.5, description="lunch"))
+
+    (found,) = sqlite_repo.expenses.find(EMAIL)
+    assert found["_id"] == doc["_id"]
+    assert found["date"] == datetime(2024, 3, 10)
+    assert (found["amount"], found["category"], found["description"]) == (12.5, "Food", "lunch")
+    assert sqlite_repo.expenses.get(OTHER, doc["_id"]) is None
+
+
+def test_keyset_pages_cover_every_row_once(sqlite_repo):
+    # Repeated dates: the _id half of the key has to break the ties
+    for i in range(11):
+        sqlite_repo.expenses.insert(expense(float(i + 1), date=datetime(2024, 1 + i % 3, 1)))
+    sqlite_repo.expenses.insert(expense(99.0, email_id=OTHER))
+
+    everything = list(sqlite_repo.expenses.find(EMAIL))
+    assert [(e["date"], e["_id"]) for e in everything] == sorted(
+        ((e["date"], e["_id"]) for e in everything), reverse=True
+    )
+
+    pages, cursor = [], None
+    while True:
+        page = list(sqlite_repo.expenses.find(EMAIL, cursor=cursor, limit=4, batch_size=3))
+        if not page:
+            break
+        pages.append(page)
+        cursor = encode_cursor(page[-1]["date"], page[-1]["_id"])
+    assert [len(page) for page in pages] == [4, 4, 3]
+    assert [e["_id"] for page in pages for e in page] == [e["_id"] for e in everything]
+
+
+def test_find_filters(sqlite_repo):
+    for doc in SAMPLE:
+        sqlite_repo.expenses.insert(dict(doc))
+    sqlite_repo.expenses.insert(expense(5.0, description="100% off_sale"))
+
+    def amounts(**filters):
+        return sorted(e["amount"] for e in sqlite_repo.expenses.find(EMAIL, **filters))
+
+    assert amounts(category="Food") == [5.0, 9.25, 15.5, 22.0]
+    assert amounts(start=datetime(2024, 2, 1), end=datetime(2024, 2, 28)) == [9.25, 40.0]
+    assert amounts(min_amount=20, max_amount=40) == [22.0, 40.0]
+    # LIKE wildcards in the search text are matched literally
+    assert amounts(text="0% OFF_") == [5.0]
+    assert amounts(text="%") == [5.0]
+
+
+def test_update_is_guarded_on_the_old_values(sqlite_repo):
+    old = sqlite_repo.expenses.insert(expense(10.0))
+
+    assert sqlite_repo.expenses.update(old, {"amount": 20.0})
+    # `old` no longer matches the stored row
+    assert not sqlite_repo.expenses.update(old, {"amount": 30.0})
+    assert sqlite_repo.expenses.get(EMAIL, old["_id"])["amount"] == 20.0
+
+
+def test_delete_returns_the_row_once(sqlite_repo):
+    doc = sqlite_repo.expenses.insert(expense(10.0))
+
+    assert sqlite_repo.expenses.delete(OTHER, doc["_id"]) is None
+    assert sqlite_repo.expenses.delete(EMAIL, doc["_id"])["amount"] == 10.0
+    assert sqlite_repo.expenses.delete(EMAIL, doc["_id"]) is None
+
+
+# =========================
+# SUMMARIES
+# =========================
+def test_summaries(sqlite_repo):
+    for doc in SAMPLE:
+        sqlite_repo.expenses.insert(dict(doc))
+    sqlite_repo.expenses.insert(expense(1000.0, "Rent", email_id=OTHER))
+
+    assert sqlite_repo.expenses.monthly_totals(EMAIL) == [
+        {"month": "2024-03", "total_expense": 142.0},
+        {"month": "2024-02", "total_expense": 49.25},
+        {"month": "2024-01", "total_expense": 135.5},
+    ]
+    assert sqlite_repo.expenses.category_totals(EMAIL, 2) == [
+        {"category": "Rent", "total": 240.0},
+        {"category": "Food", "total": 46.75},
+    ]
+    assert sqlite_repo.expenses.spent_by_user() == {EMAIL: 326.75, OTHER: 1000.0}
+
+
+def test_summaries_match_the_mongo_rollups(sqlite_repo, mongo_repo):
+    for backend in (sqlite_repo, mongo_repo):
+        for doc in SAMPLE:
+            backend.expenses.insert(dict(doc))
+        backend.expenses.insert(expense(1000.0, "Rent", email_id=OTHER))
+
+    assert sqlite_repo.expenses.monthly_totals(EMAIL) == mongo_repo.expenses.monthly_totals(EMAIL)
+    assert sqlite_repo.expenses.category_totals(EMAIL) == mongo_repo.expenses.category_totals(EMAIL)
+    assert sqlite_repo.expenses.category_totals(EMAIL, 1) == mongo_repo.expenses.category_totals(EMAIL, 1)
+    assert sqlite_repo.expenses.summary(EMAIL) == mongo_repo.expenses.summary(EMAIL)
+    assert sqlite_repo.expenses.spent_by_user() == mongo_repo.expenses.spent_by_user()
+
+
+# =========================
+# CASCADES
+# =========================
+def test_remap_category_rename(sqlite_repo):
+    sqlite_repo.categories.insert({"name": "Food", "name_key": "food"})
+    sqlite_repo.expenses.insert(expense(10.0, "Food"))
+    sqlite_repo.expenses.insert(expense(5.0, "Rent", email_id=OTHER))
+    sqlite_repo.funds.allocate(OTHER, 100)
+    sqlite_repo.funds.set_allocations(OTHER, [{"category": "Food", "amount": 20}])
+
+    affected = sqlite_repo.remap_category("Food", "Meals", "Uncategorized")
+
+    assert affected == [EMAIL, OTHER]
+    assert sqlite_repo.expenses.category_totals(EMAIL) == [{"category": "Meals", "total": 10.0}]
+    assert sqlite_repo.funds.get(OTHER)["category_allocations"] == [{"category": "Meals", "amount": 20}]
+
+
+def test_remap_category_delete_moves_to_fallback(sqlite_repo):
+    sqlite_repo.expenses.insert(expense(10.0, "Travel"))
+    sqlite_repo.funds.allocate(EMAIL, 100)
+    sqlite_repo.funds.set_allocations(EMAIL, [{"category": "Travel", "amount": 20}, {"category": "Rent", "amount": 5}])
+
+    assert sqlite_repo.remap_category("Travel", None, "uncategorized") == [EMAIL]
+
+    assert sqlite_repo.expenses.category_totals(EMAIL) == [{"category": "Uncategorized", "total": 10.0}]
+    assert sqlite_repo.funds.get(EMAIL)["category_allocations"] == [{"category": "Rent", "amount": 5}]
+    assert sqlite_repo.categories.get_by_key("uncategorized")["name"] == "Uncategorized"
+
+
+def test_purge_user_keeps_a_copy_when_archiving(sqlite_repo):
+    for doc in SAMPLE:
+        sqlite_repo.expenses.insert(dict(doc))
+    sqlite_repo.expenses.insert(expense(7.0, email_id=OTHER))
+    sqlite_repo.funds.allocate(EMAIL, 1000)
+    sqlite_repo.funds.allocate(OTHER, 10)
+
+    result = sqlite_repo.purge_user(EMAIL, archive=True)
+
+    assert result == {"expenses_archived": len(SAMPLE), "expenses_deleted": len(SAMPLE), "funds_deleted": 1}
+    assert list(sqlite_repo.expenses.find(EMAIL)) == []
+    assert sqlite_repo.funds.get(EMAIL) is None
+    assert sqlite_repo.expenses.spent_by_user() == {OTHER: 7.0}
+    copied = sqlite_repo.conn().execute(
+        "SELECT COUNT(*), SUM(amount) FROM deleted_expenses WHERE email_id = ? AND deleted_at IS NOT NULL", (EMAIL,)
+    ).fetchone()
+    assert tuple(copied) == (len(SAMPLE), 326.75)
+    # Re-running after a crash copies nothing twice
+    assert sqlite_repo.purge_user(EMAIL, archive=True)["expenses_deleted"] == 0
+
+
+def test_purge_user_without_archive(sqlite_repo):
+    sqlite_repo.expenses.insert(expense(7.0))
+
+    assert sqlite_repo.purge_user(EMAIL)["expenses_archived"] == 0
+    assert sqlite_repo.conn().execute("SELECT COUNT(*) FROM deleted_expenses").fetchone()[0] == 0
+
+
+# =========================
+# USERS, CATEGORIES, ROLES
+# =========================
+def user(first, last, email_id, role="User"):
+    return {
+        "first_name": first, "last_name": last, "email_id": email_id, "password": "hash", "role_name": role,
+        "first_name_key": first.lower(), "last_name_key": last.lower(), "email_key": email_id, "role_key": role.lower(),
+    }
+
+
+def test_user_search_and_cursor(sqlite_repo):
+    sqlite_repo.users.insert(user("Ann", "Lee", "ann@example.com"))
+    sqlite_repo.users.insert(user("Bob", "Annex", "bob@example.com"))
+    sqlite_repo.users.insert(user("Cy", "Do", "cy@example.com", "Admin"))
+    with pytest.raises(DuplicateError):
+        sqlite_repo.users.insert(user("Ann", "Again", "ann@example.com"))
+
+    assert [u["email_id"] for u in sqlite_repo.users.search("ann")] == ["ann@example.com", "bob@example.com"]
+    assert "password" not in sqlite_repo.users.search("ann")[0]
+    first = sqlite_repo.users.search(None, "user", None, 1)
+    after = encode_key_cursor(first[0]["email_key"], first[0]["_id"])
+    assert [u["email_id"] for u in sqlite_repo.users.search(None, "user", after, 5)] == ["bob@example.com"]
+
+
+def test_password_change_bumps_token_version(sqlite_repo):
+    user_id = sqlite_repo.users.insert(user("Ann", "Lee", EMAIL))
+
+    assert sqlite_repo.users.update(user_id, {"password": "new"}, bump_token_version=True)
+    assert sqlite_repo.users.get(user_id)["token_version"] == 1
+    assert sqlite_repo.users.delete(user_id)["email_id"] == EMAIL
+    assert sqlite_repo.users.get(user_id) is None
+
+
+def test_category_and_role_keys_are_unique(sqlite_repo):
+    category_id = sqlite_repo.categories.insert({"name": "Food", "name_key": "food"})
+    with pytest.raises(DuplicateError):
+        sqlite_repo.categories.insert({"name": "FOOD", "name_key": "food"})
+    assert sqlite_repo.categories.update(category_id, {"name": "Meals", "name_key": "meals"})["name"] == "Food"
+    assert [c["name"] for c in sqlite_repo.categories.all()] == ["Meals"]
+
+    sqlite_repo.roles.insert({"role_name": "Admin", "role_key": "admin"})
+    with pytest.raises(DuplicateError):
+        sqlite_repo.roles.insert({"role_name": "admin", "role_key": "admin"})
+    assert sqlite_repo.roles.get_by_key("admin")["role_name"] == "Admin"
+
+
+def test_connections_are_per_thread_on_one_database(sqlite_repo):
+    sqlite_repo.categories.insert({"name": "Food", "name_key": "food"})
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append((sqlite_repo.conn(), len(sqlite_repo.categories.all()))))
+    thread.start()
+    thread.join()
+
+    assert seen[0][0] is not sqlite_repo.conn()
+    assert seen[0][1] == 1
@@ -0,0 +1,159 @@
+"""
+Optional time-series storage for expenses.
+
+With EXPENSES_STORAGE=timeseries, `expenses_collection` points at a
+MongoDB time-series collection (EXPENSES_TS_COLLECTION) instead of the
+plain `expenses` collection:
+
+    timeField  = "date"
+    metaField  = "email_id"
+    granularity = EXPENSES_TS_GRANULARITY
+
+The documents keep their field names, so every query, index and
+aggregation in the routers runs unchanged; MongoDB groups each user's
+rows into compressed buckets by date. `category` stays a measurement
+field: the metaField must be a single field, and keeping it to the user
+means one bucket series per user rather than one per user and category.
+
+Requires MongoDB 7.0+ (arbitrary updates and deletes on time-series
+collections). Writes cannot run inside transactions there, so
+USE_TRANSACTIONS is ignored in this mode.
+
+    python timeseries.py create            # create the collection and its indexes
+    python timeseries.py copy [--batch N]  # copy `expenses` into it (resumable)
+    python timeseries.py status            # row counts and storage sizes
+"""
+import argparse
+from datetime import datetime
+from typing import Callable, Optional
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+from database import client, db
+import settings
+
+SOURCE_COLLECTION = "expenses"
+# One document per target: the last source _id copy_expenses finished
+CHECKPOINT_COLLECTION = "timeseries_copy"
+
+
+def timeseries_options() -> dict:
+    return {
+        "timeField": "date",
+        "metaField": "email_id",
+        "granularity": settings.EXPENSES_TS_GRANULARITY,
+    }
+
+
+def ensure_timeseries_collection(name: Optional[str] = None) -> bool:
+    """
+    Create the time-series collection if it does not exist yet. Returns
+    True if it was created. A no-op under mongomock, which has no
+    time-series support (the collection then behaves as a plain one).
+    """
+    name = name or settings.EXPENSES_TS_COLLECTION
+    if settings.MONGO_URI.startswith("mongomock://"):
+        return False
+    if name in db.list_collection_names(filter={"name": name}):
+        return False
+    collection = db.create_collection(name, timeseries=timeseries_options())
+    # Same secondary indexes as migration 1 gives the plain collection
+    collection.create_index([("email_id", ASCENDING), ("date", DESCENDING)])
+    collection.create_index([("email_id", ASCENDING), ("category", ASCENDING), ("date", DESCENDING)])
+    return True
+
+
+def copy_expenses(
+    target: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Copy every dated expense from `expenses` into the time-series
+    collection in _id order, keeping the _id. Progress is checkpointed in
+    CHECKPOINT_COLLECTION after every batch, so an interrupted run (or a
+    later one picking up rows added since) resumes where the last left
+    off, even once the app has been writing newer rows into the target.
+    Rows already in the target are not copied again. Rows without a date
+    cannot go into a time-series collection and are counted as skipped.
+    """
+    target = target or settings.EXPENSES_TS_COLLECTION
+    batch_size = batch_size or settings.JOB_BATCH_SIZE
+    ensure_timeseries_collection(target)
+    source, dest = db[SOURCE_COLLECTION], db[target]
+    checkpoints = db[CHECKPOINT_COLLECTION]
+
+    last_id = _resume_after(source, dest, target)
+    copied = skipped = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(source.find(query).sort("_id", ASCENDING).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        rows = [doc for doc in batch if doc.get("date")]
+        skipped += len(batch) - len(rows)
+        # Time-series collections have no unique _id index: skip rows a
+        # crashed run copied before it could checkpoint
+        present = {doc["_id"] for doc in dest.find({"_id": {"$in": [row["_id"] for row in rows]}}, {"_id": 1})}
+        rows = [row for row in rows if row["_id"] not in present]
+        if rows:
+            try:
+                dest.insert_many(rows, ordered=False)
+                copied += len(rows)
+            except BulkWriteError as e:
+                copied += e.details.get("nInserted", 0)
+        checkpoints.update_one(
+            {"_id": target},
+            {"$set": {"last_source_id": last_id, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        if on_batch:
+            on_batch(copied)
+    return {"copied": copied, "skipped_without_date": skipped, "target": target}
+
+
+def _resume_after(source, dest, target: str):
+    """
+    Source _id to continue after: the checkpoint, or for copies made
+    before checkpoints existed, the newest target row no newer than the
+    newest source row (rows the app wrote to the target come later).
+    """
+    checkpoint = db[CHECKPOINT_COLLECTION].find_one({"_id": target})
+    if checkpoint:
+        return checkpoint["last_source_id"]
+    newest = next(iter(source.find({}, {"_id": 1}).sort("_id", -1).limit(1)), None)
+    if newest is None:
+        return None
+    last = next(iter(dest.find({"_id": {"$lte": newest["_id"]}}, {"_id": 1}).sort("_id", -1).limit(1)), None)
+    return last["_id"] if last else None
+
+
+def storage_stats(name: str) -> dict:
+    """Document count and on-disk sizes (bytes) of one collection."""
+    stats = db.command("collStats", name)
+    return {
+        "collection": name,
+        "count": db[name].count_documents({}),
+        "size": stats.get("size", 0),
+        "storage_size": stats.get("storageSize", 0),
+        "index_size": stats.get("totalIndexSize", 0),
+        "timeseries": "timeseries" in stats,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-series storage for expenses")
+    parser.add_argument("command", choices=["create", "copy", "status"])
+    parser.add_argument("--target", default=settings.EXPENSES_TS_COLLECTION)
+    parser.add_argument("--batch", type=int, default=None, help=f"Rows per batch (default {settings.JOB_BATCH_SIZE})")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        print("created" if ensure_timeseries_collection(args.target) else "already exists")
+    elif args.command == "copy":
+        print(copy_expenses(args.target, args.batch, on_batch=lambda n: print(f"  {n} rows copied", end="\r")))
+        print("Set EXPENSES_STORAGE=timeseries and restart the API to serve from it.")
+    else:
+        for name in (SOURCE_COLLECTION, args.target):
+            print(storage_stats(name))
+    client.close()